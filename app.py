@@ -1,30 +1,65 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import locale
+import os
 from datetime import timedelta, datetime
-import plotly.graph_objects as go
 
 # locale.setlocale(locale.LC_TIME, 'fr_FR.UTF-8')
 
 from webapp.data_access import (
     get_first_measure_data,
-    get_all_data,
+    get_series,
+    choose_resolution,
+    RESOLUTION_HOURS,
     get_threshold_lines,
     create_threshold_line,
     update_threshold_line,
     delete_threshold_line,
 )
+from webapp.series import map_series
 from webapp.ui_components import inject_kpi_style, render_kpi
-from webapp.plotly_chart import create_interactive_chart_plotly
+from webapp.figures import (
+    prepare_daily,
+    build_recent_figure,
+    build_annual_figure,
+    build_daily_figure,
+    build_forecast_figure,
+    build_rate_heatmap,
+)
+from webapp.figure_cache import FigureCache, figure_key
+from webapp.forecast import climatology_bands
+from webapp.crossings import (
+    update_threshold_events,
+    get_threshold_events,
+    estimate_time_to_thresholds,
+    describe_time_to_threshold,
+)
 from webapp.colors import build_year_color_map
-from webapp.kpi import compute_kpis  # Utilisation du calcul des KPI
+from webapp.data_quality import coverage_report, summarize_coverage
+from webapp.exceedance import ExceedanceIndex, describe_exceedance
+from webapp.patterns import load_profiles, profile_matrix
+from webapp.kpi import load_kpis  # KPI lus dans la table kpi_snapshot
 from webapp.llm import generate_commentary, generate_annual_comparison
+from webapp.profiling import PROFILE_ALLOW_QUERY, PROFILE_RUNS, start_profile, stop_profile
 from update_missing_day import update_db
-from bdd import init_db
+from bdd import init_db, get_data_version, get_latest_forecast, save_forecast
 
 # --- Mise à jour de la base de données avant l'interface ---
-update_db()
+# Au plus une fois toutes les 10 minutes pour l'ensemble des sessions :
+# les interactions (widgets, fragments) ne relancent pas l'ingestion.
+# `_profile` (préfixe _) est exclu de la clé du cache : ?profile=1 ne force pas l'ingestion,
+# elle n'est profilée que si elle est due.
+@st.cache_data(ttl=600, show_spinner=False)
+def refresh_database(_profile=False):
+    update_db(profile=_profile)
+
+# Profilage à la demande (PROFILE_RUNS=1, ou ?profile=1 si PROFILE_ALLOW_QUERY=1) : un rapport
+# pour l'ingestion, un autre pour le reste de l'exécution du script (cf. webapp/profiling.py)
+profile_enabled = PROFILE_RUNS or (PROFILE_ALLOW_QUERY and st.query_params.get("profile") == "1")
+refresh_database(profile_enabled)
+app_profiler = start_profile(profile_enabled)
+# Période de vérification du jeton data_version par le fragment « live » (secondes)
+LIVE_REFRESH_SECONDS = int(os.getenv("LIVE_REFRESH_SECONDS", "60"))
 # Création de la table threshold_line si nécessaire
 init_db()
 
@@ -39,19 +74,26 @@ st.title("Niveau d'eau du barrage du lac des Saints Peyres")
 inject_kpi_style()
 
 # --- Chargement et préparation des données ---
-df_all = get_all_data()
-if not df_all.empty:
-    df_all["datetime_event"] = pd.to_datetime(df_all["datetime_event"], errors="coerce")
-    df_all = df_all.dropna(subset=["datetime_event"]).sort_values("datetime_event")
-    available_years = sorted(df_all["datetime_event"].dt.year.unique())
+data_version, _ = get_data_version()
+thresholds_version, _ = get_data_version("threshold_line")
+
+# Série compacte en lecture seule, partagée entre sessions tant que les données n'ont pas changé,
+# et entre processus : fichiers publiés par l'ingestion et projetés en mémoire
+@st.cache_resource(max_entries=2)
+def get_shared_series(version):
+    return map_series(version)
+
+series = get_shared_series(data_version)
+if not series.empty:
+    available_years = series.years()
     global_color_map = build_year_color_map(available_years)
 else:
     available_years = []
     global_color_map = {}
 
 # --- KPI globaux ---
-if not df_all.empty:
-    kpi_data = compute_kpis(df_all)
+if not series.empty:
+    kpi_data = load_kpis()
     kpi_date = kpi_data.get("kpi_date")
     kpi_level = kpi_data.get("kpi_level")
     kpi_j1 = kpi_data.get("kpi_j1")
@@ -62,17 +104,39 @@ if not df_all.empty:
     kpi_y2 = kpi_data.get("kpi_y2")
     kpi_y3 = kpi_data.get("kpi_y3")
 else:
+    kpi_data = {}
     kpi_date = kpi_level = kpi_j1 = kpi_j3 = kpi_s1 = kpi_7j = None
 
 # Seuils actifs
 thresholds = get_threshold_lines()
 
-def get_local_comment(kpi_data, thresholds_df):
+# --- Cache des figures, partagé entre sessions ---
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache(max_entries=32)
+
+figure_cache = get_figure_cache()
+
+# Franchissements pré-calculés à l'ingestion et temps estimé avant chaque seuil
+threshold_events = get_threshold_events(limit=10)
+threshold_etas = estimate_time_to_thresholds(kpi_data, thresholds, get_latest_forecast()[0])
+
+def get_local_comment(kpi_data, thresholds_df, on_delta=None):
+    etas = {e["name"]: describe_time_to_threshold(e) for e in threshold_etas}
     thr_list = [
-        dict(name=th.name, description=th.description, value=th.value)
+        dict(name=th.name, description=th.description, value=th.value, eta=etas.get(th.name))
         for th in thresholds_df.itertuples()
     ]
-    return generate_commentary(kpi_data, thr_list)
+    crossings = [
+        f"{ev.name} ({ev.threshold_value:.2f} m) franchi "
+        f"{'à la hausse' if ev.direction == 'up' else 'à la baisse'} le {ev.crossed_at:%d/%m/%Y %H:%M}"
+        for ev in threshold_events.head(3).itertuples()
+    ]
+    return generate_commentary(kpi_data, thr_list, crossings, on_delta=on_delta)
+
+def streamed_markdown(placeholder, prefix="#### ✨ "):
+    """Callback affichant une réponse LLM au fil de l'eau dans `placeholder`."""
+    return lambda text: placeholder.markdown(prefix + text + " ▌")
 
 # === Section 1 : Tendance actuelle ===
 
@@ -84,31 +148,56 @@ else:
     emoji = "🟡"
 
 st.markdown(f"## {emoji} Tendance actuelle")
-commentary = get_local_comment(kpi_data, thresholds)
-st.markdown("#### ✨ " + commentary)
-
-# Première rangée de 3 KPI
-col1, col2, col3 = st.columns(3)
-with col1:
-    st.markdown(render_kpi("Dernier relevé", kpi_date, is_delta=False), unsafe_allow_html=True)
-with col2:
-    st.markdown(
-        render_kpi("Niveau actuel", f"{kpi_level:.2f} m" if kpi_level is not None else None, is_delta=False),
-        unsafe_allow_html=True
-    )
-with col3:
-    st.markdown(render_kpi("Tendance 7 jours (m/j)", kpi_7j, is_delta=True), unsafe_allow_html=True)
-
-# Seconde rangée de 3 KPI
-col4, col5, col6 = st.columns(3)
-with col4:
-    st.markdown(render_kpi("VS Hier", kpi_j1, is_delta=True), unsafe_allow_html=True)
-with col5:
-    st.markdown(render_kpi("VS Il y a 3 jours", kpi_j3, is_delta=True), unsafe_allow_html=True)
-with col6:
-    st.markdown(render_kpi("VS Semaine dernière", kpi_s1, is_delta=True), unsafe_allow_html=True)
-
-if not df_all.empty:
+# Réponse affichée pendant la génération ; dernier commentaire stocké si le délai est dépassé
+commentary_placeholder = st.empty()
+commentary = get_local_comment(kpi_data, thresholds, on_delta=streamed_markdown(commentary_placeholder))
+commentary_placeholder.markdown("#### ✨ " + commentary)
+
+def render_kpi_cards(kpi_data):
+    kpi_date = kpi_data.get("kpi_date")
+    kpi_level = kpi_data.get("kpi_level")
+    kpi_7j = kpi_data.get("kpi_7j")
+    kpi_j1 = kpi_data.get("kpi_j1")
+    kpi_j3 = kpi_data.get("kpi_j3")
+    kpi_s1 = kpi_data.get("kpi_s1")
+
+    # Première rangée de 3 KPI
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.markdown(render_kpi("Dernier relevé", kpi_date, is_delta=False), unsafe_allow_html=True)
+    with col2:
+        st.markdown(
+            render_kpi("Niveau actuel", f"{kpi_level:.2f} m" if kpi_level is not None else None, is_delta=False),
+            unsafe_allow_html=True
+        )
+    with col3:
+        st.markdown(render_kpi("Tendance 7 jours (m/j)", kpi_7j, is_delta=True), unsafe_allow_html=True)
+
+    # Seconde rangée de 3 KPI
+    col4, col5, col6 = st.columns(3)
+    with col4:
+        st.markdown(render_kpi("VS Hier", kpi_j1, is_delta=True), unsafe_allow_html=True)
+    with col5:
+        st.markdown(render_kpi("VS Il y a 3 jours", kpi_j3, is_delta=True), unsafe_allow_html=True)
+    with col6:
+        st.markdown(render_kpi("VS Semaine dernière", kpi_s1, is_delta=True), unsafe_allow_html=True)
+
+# Fragment rafraîchi périodiquement : relit le jeton data_version (une ligne) et ne
+# recalcule le graphique récent que si de nouvelles mesures sont arrivées (KPI : une ligne).
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_section(thresholds, thresholds_version):
+    refresh_database(profile_enabled)  # ingestion limitée à une fois toutes les 10 minutes
+    version, _ = get_data_version()
+    if st.session_state.get("live_data_version") not in (None, version):
+        st.toast("Nouvelles mesures disponibles", icon="💧")
+    st.session_state["live_data_version"] = version
+
+    live_kpis = load_kpis()
+    if not live_kpis:
+        st.write("Pas de données disponibles.")
+        return
+    render_kpi_cards(live_kpis)
+
     # _N_ jours sélectionnables par l’utilisateur
     days = st.number_input(
         "Afficher les derniers N jours",
@@ -116,34 +205,57 @@ if not df_all.empty:
     )
     st.markdown(f"### Évolution sur les {days} derniers jours")
 
-    # Filtrer
-    start_dt = pd.Timestamp.now() - timedelta(days=days)
-    df_window = df_all[df_all["datetime_event"] >= start_dt]
-
-    if not df_window.empty:
-        fig_recent = create_interactive_chart_plotly(
-            data=df_window,
-            x_field="datetime_event",
-            y_field="value",
-            x_axis_format="%d %b %H:%M",
-            y_axis_label="Niveau d'eau (mNGF)",
-            margin_value=1,
-            # tu peux régler segment_size_hours ici si besoin
-            horizontal_lines=thresholds
-        )
+    # Lecture dans le niveau de la pyramide adapté à la fenêtre
+    now = pd.Timestamp.now()
+    resolution = choose_resolution(now - timedelta(days=days), now)
+    # Fin de fenêtre arrondie au pas d'affichage : clé du graphique en cache
+    window_end = now.floor("10min" if resolution == "raw" else f"{RESOLUTION_HOURS[resolution]}h")
+    start_dt = window_end - timedelta(days=days)
+
+    def build_recent():
+        df_window = get_series(start_dt, resolution=resolution)
+        if df_window.empty:
+            return None
+        return build_recent_figure(df_window, RESOLUTION_HOURS[resolution], thresholds)
+
+    fig_recent = figure_cache.get_or_build(
+        figure_key("recent", version, thresholds_version, days=days, end=window_end),
+        build_recent
+    )
+    if fig_recent is not None:
         st.plotly_chart(fig_recent, width='stretch')
     else:
         st.write(f"Aucune donnée disponible pour les {days} derniers jours.")
-else:
-    st.write("Pas de données disponibles.")
+
+live_section(thresholds, thresholds_version)
+
+if threshold_etas:
+    with st.expander("Seuils : temps estimé et derniers franchissements"):
+        for eta in threshold_etas:
+            st.markdown(f"- **{eta['name']}** ({eta['value']:.2f} m, écart {eta['gap']:+.2f} m) : "
+                        f"{describe_time_to_threshold(eta)}")
+        if not threshold_events.empty:
+            st.dataframe(
+                threshold_events.assign(
+                    direction=threshold_events["direction"].map({"up": "▲ hausse", "down": "▼ baisse"})
+                )[["name", "threshold_value", "direction", "crossed_at", "duration_hours"]].rename(columns={
+                    "name": "Seuil",
+                    "threshold_value": "Valeur (m)",
+                    "direction": "Sens",
+                    "crossed_at": "Franchi le",
+                    "duration_hours": "Durée (h)",
+                }),
+                hide_index=True
+            )
 
 st.markdown("---")
 
 # === Section 2 : Comparaison annuelle ===
 st.markdown("## 📈 Comparaison annuelle")
 
-annual_comment = generate_annual_comparison(kpi_data)
-st.markdown("#### ✨ " + annual_comment)
+annual_placeholder = st.empty()
+annual_comment = generate_annual_comparison(kpi_data, on_delta=streamed_markdown(annual_placeholder))
+annual_placeholder.markdown("#### ✨ " + annual_comment)
 # KPI annuel
 d1, d2, d3 = st.columns(3)
 with d1:
@@ -154,15 +266,15 @@ with d3:
     st.markdown(render_kpi(f"VS {datetime.now().year - 3}", kpi_y3, is_delta=True), unsafe_allow_html=True)
 
 # --- Graphique 2 : comparaison annuelle ---
-df_comparison = get_first_measure_data()
-if not df_comparison.empty:
-    df_comparison["Date"] = pd.to_datetime(df_comparison["date"], format="%Y-%m-%d")
-    df_comparison = df_comparison.sort_values("Date")
-    df_comparison["Year"] = df_comparison["Date"].dt.year
-    df_comparison["dummy_date"] = pd.to_datetime(
-        "2000-" + df_comparison["Date"].dt.strftime("%m-%d")
-    )
-
+# Première mesure de chaque jour et climatologie par jour calendaire : une passe par version des données
+@st.cache_data(max_entries=2, show_spinner=False)
+def get_daily_comparison(version):
+    df_comparison = prepare_daily(get_first_measure_data())
+    return df_comparison, climatology_bands(df_comparison)
+
+# Fragment : changer les années ne réexécute que ce graphique
+@st.fragment
+def annual_section(available_years, color_map, thresholds, data_version, thresholds_version):
     default_years = [
         y for y in range(datetime.now().year, datetime.now().year - 4, -1)
         if y in available_years
@@ -172,132 +284,75 @@ if not df_comparison.empty:
         options=available_years,
         default=default_years
     )
-
-    df_selected = df_comparison[df_comparison["Year"].isin(selected_years)]
-    if not df_selected.empty:
+    show_bands = st.checkbox("Afficher les valeurs habituelles (min-max, p10-p90, médiane)", value=True)
+
+    def build_annual():
+        df_comparison, bands = get_daily_comparison(data_version)
+        df_selected = df_comparison[df_comparison["Year"].isin(selected_years)]
+        if df_selected.empty:
+            return None
+        return build_annual_figure(df_selected, color_map, thresholds, bands if show_bands else None)
+
+    fig4 = figure_cache.get_or_build(
+        figure_key("annual", data_version, thresholds_version,
+                   selected_years=selected_years, show_bands=show_bands),
+        build_annual
+    )
+    if fig4 is not None:
         st.markdown("### Par année (du 1er janvier au 31 décembre)")
-        fig4 = px.line(
-            df_selected,
-            x="dummy_date",
-            y="value",
-            color="Year",
-            labels={"dummy_date": "Date", "value": "Niveau d'eau (mNGF)", "Year": "Année"},
-            color_discrete_map=global_color_map
-        )
-        fig4.update_layout(
-            width=800,
-            height=800,
-            margin=dict(l=20, r=20, t=20, b=20),
-            legend=dict(orientation="h", yanchor="top", y=-0.2, xanchor="center", x=0.5),
-            xaxis=dict(
-                range=["2000-01-01", "2000-12-31"],
-                tickformat="%B",
-                hoverformat="%d %B",
-                tickangle=-45,
-                side="bottom",
-                title=None,
-                dtick="M1"
-            ),
-            hovermode="x unified"
-        )
-        for trace in fig4.data:
-            trace.hovertemplate = "%{data.name} : %{y:.2f} m<extra></extra>"
-        # Ajout des lignes horizontales de seuil
-        # fig4 : comparaison annuelle
-        for th in thresholds.itertuples():
-            fig4.add_hline(
-                y=th.value,
-                line_color=th.color,
-                line_dash=th.dash_style,
-                annotation_text=th.name,
-                annotation_position="top left"
-            )
         st.plotly_chart(fig4, width='stretch')
     else:
         st.write("Aucune donnée pour les années sélectionnées.")
+
+if available_years:
+    annual_section(available_years, global_color_map, thresholds, data_version, thresholds_version)
 else:
     st.write("Aucune donnée pour la comparaison annuelle.")
 
 # --- Graphique 1 : évolution quotidienne depuis 2021-07-07 ---
-df_daily = get_first_measure_data()
-if not df_daily.empty:
-    df_daily["Date"] = pd.to_datetime(df_daily["date"], format="%Y-%m-%d")
-    df_daily = df_daily.sort_values("Date")
-    df_daily["Year"] = df_daily["Date"].dt.year
-
+def build_daily():
+    df_daily = get_daily_comparison(data_version)[0]
+    if df_daily.empty:
+        return None
+    return build_daily_figure(df_daily, global_color_map, thresholds)
+
+fig3 = figure_cache.get_or_build(
+    figure_key("daily", data_version, thresholds_version),
+    build_daily
+)
+if fig3 is not None:
     st.markdown("### Évolution quotidienne du niveau d'eau (depuis le 7 juillet 2021)")
-    fig3 = px.line(
-        df_daily,
-        x="Date",
-        y="value",
-        color="Year",
-        color_discrete_map=global_color_map,
-        labels={"value": "Niveau d'eau (mNGF)", "Date": "Date", "Year": "Année"}
-    )
-    # Axe X avec date au format "jour mois année"
-    fig3.update_layout(
-        hovermode="x unified",
-        margin=dict(l=20, r=20, t=20, b=20),
-        xaxis=dict(
-            tickformat="%B %Y",
-            hoverformat="%d %B %Y",
-            tickangle=-45,
-            title=None,
-            dtick="M3"
-        ),
-        legend=dict(orientation="h", yanchor="top", y=-0.3, xanchor="center", x=0.5)
-    )
-    for trace in fig3.data:
-        trace.hovertemplate = "Niveau : %{y:.2f} m<extra></extra>"
-    # Ajout des lignes horizontales de seuil
-    # fig3 : évolution quotidienne
-    for th in thresholds.itertuples():
-        fig3.add_hline(
-            y=th.value,
-            line_color=th.color,            # couleur depuis la BDD
-            line_dash=th.dash_style,        # style (solid, dash, dot…)
-            annotation_text=th.name,
-            annotation_position="top left"
-        )
     st.plotly_chart(fig3, width='stretch')
 else:
     st.write("Aucune donnée pour la première mesure quotidienne.")
 
-from webapp.forecast import forecast_water_level
+from webapp.forecast import forecast_water_level, resolve_forecast_model
 
 st.markdown("## 🔮 Prévision jusqu’à la fin de l’année")
 
+def build_forecast():
+    # La prévision stockée est réutilisée tant que les mesures n'ont pas changé
+    forecast_df, forecast_version, forecast_model = get_latest_forecast()
+    if forecast_version != data_version or forecast_model != resolve_forecast_model():
+        forecast_df, model = forecast_water_level(series)
+        forecast_df = forecast_df[forecast_df["ds"] > pd.Timestamp(series.times[-1])]
+        save_forecast(forecast_df, data_version, model=model)
+    forecast_df = forecast_df[forecast_df["ds"] > pd.Timestamp.now()]  # que le futur
+
+    # Historique complet lu dans la résolution adaptée plutôt qu'en brut
+    history_start = pd.Timestamp(series.times[0])
+    df_history = get_series(
+        history_start,
+        resolution=choose_resolution(history_start, pd.Timestamp.now())
+    )
+    return build_forecast_figure(df_history, forecast_df, thresholds)
+
 # Forecast uniquement si données suffisantes
-if not df_all.empty and len(df_all) > 100:
+if not series.empty and len(series) > 100:
     try:
-        forecast_df = forecast_water_level(df_all)
-        forecast_df = forecast_df[forecast_df["ds"] > pd.Timestamp.now()]  # que le futur
-
-        fig_forecast = go.Figure()
-        fig_forecast.add_trace(go.Scatter(
-            x=df_all["datetime_event"], y=df_all["value"],
-            mode="lines", name="Historique"
-        ))
-        fig_forecast.add_trace(go.Scatter(
-            x=forecast_df["ds"], y=forecast_df["yhat"],
-            mode="lines", name="Prévision",
-            line=dict(dash="dot", color="black")
-        ))
-        for th in thresholds.itertuples():
-            fig_forecast.add_hline(
-                y=th.value,
-                line_color=th.color,
-                line_dash=th.dash_style,
-                annotation_text=th.name,
-                annotation_position="top left"
-            )
-
-        fig_forecast.update_layout(
-            title="Prévision du niveau d'eau",
-            xaxis_title="Date",
-            yaxis_title="Niveau (mNGF)",
-            hovermode="x unified",
-            margin=dict(l=20, r=20, t=40, b=20)
+        fig_forecast = figure_cache.get_or_build(
+            figure_key("forecast", data_version, thresholds_version),
+            build_forecast
         )
         st.plotly_chart(fig_forecast, width='stretch')
     except Exception as e:
@@ -307,6 +362,62 @@ if not df_all.empty and len(df_all) > 100:
 else:
     st.info("Pas assez de données pour générer une prévision.")
 
+# --- Rythme des variations (profils horaires, hebdomadaires et saisonniers) ---
+# Profils cumulés à l'ingestion dans rate_profile : lecture de 2016 lignes au plus
+@st.cache_data(max_entries=2, show_spinner=False)
+def get_rate_profiles(version):
+    return load_profiles()
+
+@st.fragment
+def patterns_section(data_version):
+    with st.expander("⏱️ Rythme des variations (heure du jour, jour de la semaine, saison)"):
+        cube = get_rate_profiles(data_version)
+        if cube.empty:
+            st.write("Pas encore assez d'historique pour établir les profils.")
+            return
+        view = st.radio("Lignes", ["Jour de la semaine", "Mois"], horizontal=True)
+        rows = "weekday" if view == "Jour de la semaine" else "month"
+        fig = figure_cache.get_or_build(
+            figure_key("patterns", data_version, None, rows=rows),
+            lambda: build_rate_heatmap(profile_matrix(cube, rows))
+        )
+        st.plotly_chart(fig, width='stretch')
+        st.caption("Vitesse moyenne de variation du niveau (cm/h) entre deux moyennes horaires consécutives.")
+
+patterns_section(data_version)
+
+# --- Qualité des données ---
+# Lecture de daily_coverage (tenue à jour à l'ingestion), une fois par version des données
+@st.cache_data(max_entries=2, show_spinner=False)
+def get_coverage(version, days=90):
+    report = coverage_report((datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d"))
+    return report, summarize_coverage(report)
+
+with st.expander("🩺 Qualité des données (90 derniers jours)"):
+    coverage, coverage_summary = get_coverage(data_version)
+    q1, q2, q3, q4 = st.columns(4)
+    q1.metric("Complétude moyenne", f"{coverage_summary['completeness_pct'] or 0:.1f} %")
+    q2.metric("Jours sans mesure", coverage_summary["missing_days"])
+    q3.metric("Jours signalés", coverage_summary["flagged_days"])
+    q4.metric("Plus grand trou", f"{coverage_summary['max_gap_hours'] or 0:.1f} h")
+    if not coverage.empty:
+        st.bar_chart(coverage.set_index("date_event")["completeness_pct"], height=160)
+        flagged = coverage[coverage["issues"] != ""]
+        if not flagged.empty:
+            st.dataframe(
+                flagged.sort_values("date_event", ascending=False)[
+                    ["date_event", "n_samples", "completeness_pct", "max_gap_minutes", "units", "issues"]
+                ].rename(columns={
+                    "date_event": "Jour",
+                    "n_samples": "Mesures",
+                    "completeness_pct": "Complétude (%)",
+                    "max_gap_minutes": "Plus grand trou (min)",
+                    "units": "Unité",
+                    "issues": "Anomalies",
+                }),
+                hide_index=True
+            )
+
 # --- Interface de gestion des lignes de seuil ---
 
 st.markdown("## ⚙️ Gestion des lignes de seuil")
@@ -319,69 +430,93 @@ dash_options = {
     "Double tiret": "longdash"
 }
 
-# Formulaire d'ajout
-with st.expander("Ajouter une ligne de seuil"):
-    with st.form("add_threshold"):
-        new_name        = st.text_input("Nom court à afficher")
-        new_description = st.text_area("Description détaillée (non affichée sur le graphique)")
-        new_value       = st.number_input(
+# Index des valeurs quotidiennes triées : fréquence et durées sous un niveau candidat
+# en recherches dichotomiques, construit à partir des valeurs quotidiennes déjà en cache
+@st.cache_resource(max_entries=2)
+def get_exceedance_index(version):
+    return ExceedanceIndex.from_daily(get_daily_comparison(version)[0])
+
+exceedance_index = get_exceedance_index(data_version)
+
+# Fragment : la saisie dans les formulaires ne réexécute que cette section.
+# Un seuil enregistré relance la page entière (il apparaît sur tous les graphiques
+# et dans le commentaire) ; ce rerun reste léger car données et figures sont en cache.
+@st.fragment
+def threshold_management(thresholds):
+    # Formulaire d'ajout
+    with st.expander("Ajouter une ligne de seuil"):
+        # Hors du formulaire : la fréquence historique se met à jour à chaque saisie
+        new_value = st.number_input(
             "Valeur (mètre)",
             format="%.2f",
             min_value=630.0,
             max_value=680.0,
-            step=0.1
+            step=0.1,
+            key="new_threshold_value"
         )
-        new_color       = st.color_picker("Couleur de la ligne", "#1f77b4")
-        new_dash_label  = st.selectbox("Style de ligne", options=list(dash_options.keys()))
-        if st.form_submit_button("Ajouter"):
-            create_threshold_line(
-                name=new_name,
-                description=new_description,
-                value=new_value,
-                color=new_color,
-                dash_style=dash_options[new_dash_label]
-            )
-            st.success(f"Ligne « {new_name} » ajoutée.")
-            st.rerun()
-
-# Liste, modification et suppression
-if thresholds.empty:
-    st.info("Aucune ligne définie pour l’instant.")
-else:
-    for th in thresholds.itertuples():
-        with st.expander(f"{th.name} — {th.value:.2f} m"):
-            mod_name        = st.text_input("Nom court", th.name, key=f"name_{th.id}")
-            mod_description = st.text_area("Description détaillée", th.description, key=f"desc_{th.id}")
-            mod_value       = st.number_input(
-                "Valeur (mètre)",
-                value=th.value,
-                min_value=630.0,
-                max_value=680.0,
-                format="%.2f",
-                step=0.1,
-                key=f"value_{th.id}"
-            )
-            mod_color = st.color_picker("Couleur", th.color, key=f"color_{th.id}")
-            current_dash_label = [k for k,v in dash_options.items() if v == th.dash_style][0]
-            mod_dash_label = st.selectbox(
-                "Style de ligne",
-                options=list(dash_options.keys()),
-                index=list(dash_options.keys()).index(current_dash_label),
-                key=f"dash_{th.id}"
-            )
-            btn_col1, btn_col2 = st.columns(2)
-            if btn_col1.button("Modifier", key=f"mod_{th.id}"):
-                update_threshold_line(
-                    id=th.id,
-                    name=mod_name,
-                    description=mod_description,
-                    value=mod_value,
-                    color=mod_color,
-                    dash_style=dash_options[mod_dash_label]
+        st.caption(describe_exceedance(exceedance_index.query(new_value)))
+        with st.form("add_threshold"):
+            new_name        = st.text_input("Nom court à afficher")
+            new_description = st.text_area("Description détaillée (non affichée sur le graphique)")
+            new_color       = st.color_picker("Couleur de la ligne", "#1f77b4")
+            new_dash_label  = st.selectbox("Style de ligne", options=list(dash_options.keys()))
+            if st.form_submit_button("Ajouter"):
+                create_threshold_line(
+                    name=new_name,
+                    description=new_description,
+                    value=new_value,
+                    color=new_color,
+                    dash_style=dash_options[new_dash_label]
                 )
-                st.success("Modifié.")
+                update_threshold_events()
+                st.success(f"Ligne « {new_name} » ajoutée.")
                 st.rerun()
-            if btn_col2.button("Supprimer", key=f"del_{th.id}"):
-                delete_threshold_line(th.id)
-                st.warning("Supprimé.")
-                st.rerun()
\ No newline at end of file
+
+    # Liste, modification et suppression
+    if thresholds.empty:
+        st.info("Aucune ligne définie pour l’instant.")
+    else:
+        for th in thresholds.itertuples():
+            with st.expander(f"{th.name} — {th.value:.2f} m"):
+                mod_name        = st.text_input("Nom court", th.name, key=f"name_{th.id}")
+                mod_description = st.text_area("Description détaillée", th.description, key=f"desc_{th.id}")
+                mod_value       = st.number_input(
+                    "Valeur (mètre)",
+                    value=th.value,
+                    min_value=630.0,
+                    max_value=680.0,
+                    format="%.2f",
+                    step=0.1,
+                    key=f"value_{th.id}"
+                )
+                st.caption(describe_exceedance(exceedance_index.query(mod_value)))
+                mod_color = st.color_picker("Couleur", th.color, key=f"color_{th.id}")
+                current_dash_label = [k for k,v in dash_options.items() if v == th.dash_style][0]
+                mod_dash_label = st.selectbox(
+                    "Style de ligne",
+                    options=list(dash_options.keys()),
+                    index=list(dash_options.keys()).index(current_dash_label),
+                    key=f"dash_{th.id}"
+                )
+                btn_col1, btn_col2 = st.columns(2)
+                if btn_col1.button("Modifier", key=f"mod_{th.id}"):
+                    update_threshold_line(
+                        id=th.id,
+                        name=mod_name,
+                        description=mod_description,
+                        value=mod_value,
+                        color=mod_color,
+                        dash_style=dash_options[mod_dash_label]
+                    )
+                    update_threshold_events()
+                    st.success("Modifié.")
+                    st.rerun()
+                if btn_col2.button("Supprimer", key=f"del_{th.id}"):
+                    delete_threshold_line(th.id)
+                    update_threshold_events()
+                    st.warning("Supprimé.")
+                    st.rerun()
+
+threshold_management(thresholds)
+
+stop_profile(app_profiler, "app")
@@ -0,0 +1,210 @@
+"""
+Backtest des modèles de prévision sur l'historique stocké (origines glissantes).
+
+Pour chaque origine, chaque modèle est entraîné sur les mesures antérieures puis
+comparé à la première mesure quotidienne des `horizon` jours suivants.
+Les évaluations sont réparties dans un pool de processus.
+
+    python backtest.py --step 30 --horizon 160
+    python backtest.py --models seasonal_naive holt --workers 4 --csv backtest.csv
+"""
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from webapp.data_access import get_all_data
+
+DB_PATH = "niveau_eau.db"
+REPORT_HORIZONS = [1, 7, 14, 30, 60, 90, 160]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(funcName)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+
+def daily_first_values(raw):
+    """First reading of each day on a continuous daily index, missing days interpolated."""
+    daily = raw.groupby(raw["datetime_event"].dt.normalize())["value"].first()
+    return daily.asfreq("D").interpolate(limit_area="inside")
+
+
+# --- Modèles : fit(raw, daily) puis predict(origin, horizon) -> valeurs des jours origin+1..origin+horizon ---
+
+class ProphetModel:
+    """Configuration Prophet du tableau de bord, entraînée sur les mesures brutes."""
+
+    def fit(self, raw, daily):
+        from webapp.forecast import build_prophet_model
+        self.model = build_prophet_model()
+        self.model.fit(raw.rename(columns={"datetime_event": "ds", "value": "y"})[["ds", "y"]])
+
+    def predict(self, origin, horizon):
+        future = self.model.make_future_dataframe(periods=horizon)
+        forecast = self.model.predict(future)
+        by_day = forecast.groupby(forecast["ds"].dt.normalize())["yhat"].first()
+        return by_day.reindex(pd.date_range(origin + pd.Timedelta(days=1), periods=horizon)).to_numpy()
+
+
+class SeasonalNaive:
+    """Valeur observée le même jour un an plus tôt (dernière valeur connue à défaut)."""
+
+    def fit(self, raw, daily):
+        self.daily = daily
+
+    def predict(self, origin, horizon):
+        targets = pd.date_range(origin + pd.Timedelta(days=1), periods=horizon)
+        values = self.daily.reindex(targets - pd.DateOffset(years=1)).to_numpy()
+        return np.where(np.isnan(values), self.daily.iloc[-1], values)
+
+
+class ClimatologyAnomaly:
+    """Prévision climatologique du tableau de bord (webapp.forecast, FORECAST_MODEL=climatology)."""
+
+    def fit(self, raw, daily):
+        from webapp.forecast import fit_climatology
+        self.climatology = fit_climatology(raw)
+
+    def predict(self, origin, horizon):
+        from webapp.forecast import project_climatology
+        forecast = project_climatology(self.climatology, horizon)
+        by_day = forecast.groupby(forecast["ds"].dt.normalize())["yhat"].first()
+        return by_day.reindex(pd.date_range(origin + pd.Timedelta(days=1), periods=horizon)).to_numpy()
+
+
+class Holt:
+    """Lissage exponentiel double à tendance amortie, paramètres choisis sur une petite grille."""
+
+    GRID = [(a, b, phi) for a in (0.3, 0.6, 0.9) for b in (0.05, 0.2) for phi in (0.9, 0.98)]
+
+    @staticmethod
+    def _run(y, alpha, beta, phi):
+        level, trend, sse = y[0], y[1] - y[0], 0.0
+        for value in y[1:]:
+            predicted = level + phi * trend
+            sse += (value - predicted) ** 2
+            new_level = alpha * value + (1 - alpha) * predicted
+            trend = beta * (new_level - level) + (1 - beta) * phi * trend
+            level = new_level
+        return sse, level, trend
+
+    def fit(self, raw, daily):
+        y = daily.dropna().to_numpy()[-730:]
+        results = [(self._run(y, *params), params) for params in self.GRID]
+        (_, self.level, self.trend), (_, _, self.phi) = min(results, key=lambda r: r[0][0])
+
+    def predict(self, origin, horizon):
+        damping = np.cumsum(self.phi ** np.arange(1, horizon + 1))
+        return self.level + damping * self.trend
+
+
+MODELS = {
+    "prophet": ProphetModel,
+    "seasonal_naive": SeasonalNaive,
+    "climatology": ClimatologyAnomaly,
+    "holt": Holt,
+}
+
+
+# --- Exécution parallèle ---
+
+_RAW = None
+_DAILY = None
+
+def _init_worker(raw, daily):
+    global _RAW, _DAILY
+    _RAW, _DAILY = raw, daily
+
+def _evaluate(model_name, origin, horizon):
+    """Fit one model at one origin; return (model, origin, errors, fit_s, predict_s, error message)."""
+    end = origin + pd.Timedelta(days=1)
+    raw = _RAW[_RAW["datetime_event"] < end]
+    daily = _DAILY[:origin]
+    truth = _DAILY.reindex(pd.date_range(end, periods=horizon)).to_numpy()
+    model = MODELS[model_name]()
+    try:
+        start = time.perf_counter()
+        model.fit(raw, daily)
+        fit_s = time.perf_counter() - start
+        start = time.perf_counter()
+        predicted = np.asarray(model.predict(origin, horizon), dtype=float)
+        predict_s = time.perf_counter() - start
+    except Exception as e:
+        return model_name, origin, None, None, None, str(e)
+    return model_name, origin, predicted - truth, fit_s, predict_s, None
+
+
+def run_backtest(raw, models, horizon=160, step=30, min_train_days=365, workers=None):
+    """Evaluate `models` at origins every `step` days; return (errors by horizon, timings by model) DataFrames."""
+    daily = daily_first_values(raw)
+    first_origin = daily.index[0] + pd.Timedelta(days=min_train_days)
+    last_origin = daily.index[-1] - pd.Timedelta(days=horizon)
+    origins = pd.date_range(first_origin, last_origin, freq=f"{step}D")
+    if len(origins) == 0:
+        raise ValueError("Historique trop court pour ces paramètres de backtest")
+    logger.info(f"{len(origins)} origins x {len(models)} models, horizon {horizon} days")
+
+    rows, timings = [], []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(raw, daily)) as pool:
+        futures = [pool.submit(_evaluate, name, origin, horizon) for name in models for origin in origins]
+        for future in as_completed(futures):
+            name, origin, errors, fit_s, predict_s, error = future.result()
+            if error is not None:
+                logger.error(f"{name} failed at {origin:%Y-%m-%d}: {error}")
+                continue
+            timings.append({"model": name, "origin": origin, "fit_s": fit_s, "predict_s": predict_s})
+            rows.extend(
+                {"model": name, "origin": origin, "h": h, "error": e}
+                for h, e in enumerate(errors, start=1) if not np.isnan(e)
+            )
+    return pd.DataFrame(rows), pd.DataFrame(timings)
+
+
+def summarize(errors, timings, horizons=REPORT_HORIZONS):
+    """MAE/RMSE at the reported horizons plus mean fit/predict wall time per model."""
+    errors = errors.assign(abs_error=errors["error"].abs(), sq_error=errors["error"] ** 2)
+    by_horizon = (
+        errors[errors["h"].isin(horizons)]
+        .groupby(["model", "h"])
+        .agg(mae=("abs_error", "mean"), rmse=("sq_error", lambda s: np.sqrt(s.mean())), n=("error", "size"))
+        .reset_index()
+    )
+    overall = errors.groupby("model").agg(
+        mae=("abs_error", "mean"), rmse=("sq_error", lambda s: np.sqrt(s.mean()))
+    )
+    cost = timings.groupby("model")[["fit_s", "predict_s"]].mean()
+    cost["cpu_s"] = cost["fit_s"] + cost["predict_s"]
+    overall = overall.join(cost)
+    return by_horizon, overall
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest des modèles de prévision du niveau d'eau")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=list(MODELS))
+    parser.add_argument("--horizon", type=int, default=160)
+    parser.add_argument("--step", type=int, default=30, help="jours entre deux origines")
+    parser.add_argument("--min-train", type=int, default=365, help="jours d'historique minimum")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--csv", default=None, help="écrire les erreurs détaillées dans ce fichier")
+    args = parser.parse_args()
+
+    raw = get_all_data(args.db)[["datetime_event", "value"]]
+    errors, timings = run_backtest(raw, args.models, args.horizon, args.step, args.min_train, args.workers)
+    if args.csv:
+        errors.to_csv(args.csv, index=False)
+    by_horizon, overall = summarize(errors, timings)
+    for metric in ("mae", "rmse"):
+        print(f"{metric.upper()} (m) par horizon (jours)")
+        print(by_horizon.pivot(index="h", columns="model", values=metric).round(3).to_string())
+        print()
+    print(overall.round(3).to_string())
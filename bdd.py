@@ -13,6 +13,7 @@ if not logger.handlers:
     logger.addHandler(handler)
 
 DB_PATH = "niveau_eau.db"
+SITE_ID = 198  # lieu de mesure interrogé sur data.niv-eau.fr
 
 def init_db(db_path: str = DB_PATH):
     """
@@ -22,6 +23,9 @@ def init_db(db_path: str = DB_PATH):
     """
     with sqlite3.connect(db_path) as conn:
         cursor = conn.cursor()
+        # Pages libérées rendues par PRAGMA incremental_vacuum (effectif sur une base neuve
+        # ou après un VACUUM, cf. retention.py)
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
 
         # Table des niveaux d'eau
         cursor.execute("""
@@ -64,9 +68,222 @@ def init_db(db_path: str = DB_PATH):
             type TEXT NOT NULL DEFAULT 'tendance'  -- nouveau champ
         );
         """)
+        # Télémétrie des appels (durée totale, premier jeton, erreur ou dépassement du délai)
+        add_missing_columns(cursor, "gpt_logs", {
+            "latency_ms": "REAL",
+            "first_token_ms": "REAL",
+            "error": "TEXT",
+        })
+        # Dernier commentaire et quota du jour : recherches indexées quel que soit le volume du journal
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_gpt_logs_type_created_at ON gpt_logs (type, created_at);
+        """)
+        cursor.execute("""
+        CREATE VIEW IF NOT EXISTS gpt_usage_daily AS
+        SELECT DATE(created_at) AS day,
+               type,
+               COUNT(*) AS calls,
+               SUM(error IS NOT NULL) AS errors,
+               SUM(prompt_tokens) AS prompt_tokens,
+               SUM(completion_tokens) AS completion_tokens,
+               SUM(total_tokens) AS total_tokens,
+               AVG(latency_ms) AS avg_latency_ms,
+               MAX(latency_ms) AS max_latency_ms,
+               AVG(first_token_ms) AS avg_first_token_ms
+        FROM gpt_logs
+        GROUP BY day, type;
+        """)
+
+        # Agrégats pré-calculés (pyramide de résolutions) maintenus à l'ingestion
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS water_level_rollup (
+            resolution TEXT NOT NULL,
+            bucket_start DATETIME NOT NULL,
+            value_mean REAL,
+            value_min REAL,
+            value_max REAL,
+            n_samples INTEGER,
+            PRIMARY KEY (resolution, bucket_start)
+        ) WITHOUT ROWID;
+        """)
+
+        # Mesures écartées par le filtre d'aberrations (outlier_filter.py)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS water_level_quarantine (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date_event DATE,
+            datetime_event DATETIME,
+            value REAL,
+            unit TEXT,
+            reason TEXT NOT NULL,
+            detected_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(datetime_event)
+        );
+        """)
+
+        # Registre de versions : incrémenté par trigger à chaque modification,
+        # sert de jeton bon marché pour les caches (ETag, figures, sessions)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS data_version (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+        cursor.execute("""
+        INSERT OR IGNORE INTO data_version (name) VALUES ('water_level'), ('threshold_line'), ('forecast');
+        """)
+        for table, events in (("water_level", ("INSERT", "UPDATE", "DELETE")),
+                              ("threshold_line", ("INSERT", "UPDATE"))):
+            for event in events:
+                cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE data_version
+                    SET version = version + 1,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE name = '{table}';
+                END;
+                """)
+
+        # Franchissements de seuils et état de l'analyse incrémentale
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS threshold_event (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            threshold_id INTEGER NOT NULL,
+            threshold_value REAL NOT NULL,
+            direction TEXT NOT NULL,  -- 'up' : passage au-dessus, 'down' : passage en dessous
+            crossed_at DATETIME NOT NULL,
+            ended_at DATETIME,        -- franchissement suivant, NULL si épisode en cours
+            duration_hours REAL,
+            UNIQUE(threshold_id, crossed_at)
+        );
+        """)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS threshold_scan_state (
+            threshold_id INTEGER PRIMARY KEY,
+            threshold_value REAL NOT NULL,
+            last_datetime DATETIME NOT NULL,
+            is_above INTEGER NOT NULL
+        );
+        """)
+
+        # Dernière prévision calculée (points futurs uniquement)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS forecast (
+            ds DATETIME PRIMARY KEY,
+            yhat REAL NOT NULL,
+            data_version INTEGER NOT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+        add_missing_columns(cursor, "forecast", {
+            "yhat_lower": "REAL",
+            "yhat_upper": "REAL",
+            "model": "TEXT",
+        })
+
+        # Limite du compactage des mesures anciennes (retention.py) : en dessous,
+        # water_level ne garde que la première mesure de chaque heure et les agrégats sont figés
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS compaction_watermark (
+            name TEXT PRIMARY KEY,
+            compacted_before DATETIME NOT NULL,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+
+        # Dernière mesure et écarts aux dates de référence, une ligne par site (mis à jour à l'ingestion)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS kpi_snapshot (
+            site_id INTEGER PRIMARY KEY,
+            datetime_event DATETIME NOT NULL,
+            value REAL NOT NULL,
+            delta_1d REAL,
+            delta_3d REAL,
+            delta_7d REAL,
+            delta_30d REAL,
+            delta_60d REAL,
+            delta_1y REAL,
+            delta_2y REAL,
+            delta_3y REAL,
+            data_version INTEGER NOT NULL,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+
+        # Couverture et intégrité des mesures par jour (webapp/data_quality.py), mise à jour à l'ingestion
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_coverage (
+            date_event DATE PRIMARY KEY,
+            n_samples INTEGER NOT NULL,
+            first_reading DATETIME,
+            last_reading DATETIME,
+            max_gap_minutes REAL,
+            hours_covered INTEGER NOT NULL,
+            completeness_pct REAL NOT NULL,
+            out_of_order INTEGER NOT NULL DEFAULT 0,
+            n_quarantined INTEGER NOT NULL DEFAULT 0,
+            units TEXT,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID;
+        """)
+
+        # Profils de vitesse de variation (webapp/patterns.py) : statistiques suffisantes
+        # par mois, jour de la semaine et heure, cumulées jusqu'à processed_before
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rate_profile (
+            month INTEGER NOT NULL,
+            weekday INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            n_samples INTEGER NOT NULL,
+            sum_rate REAL NOT NULL,
+            sum_sq_rate REAL NOT NULL,
+            PRIMARY KEY (month, weekday, hour)
+        ) WITHOUT ROWID;
+        """)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rate_profile_state (
+            name TEXT PRIMARY KEY,
+            processed_before DATETIME NOT NULL,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
 
         conn.commit()
 
+def add_missing_columns(cursor, table, columns):
+    """Add the given {column: type} to an existing table if absent (migrates older databases)."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, declaration in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+
+def suspend_version_triggers(cursor, table="water_level"):
+    """Drop the per-row version triggers of `table` and return their SQL, to recreate in the same transaction."""
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (table,))
+    triggers = cursor.fetchall()
+    for name, _ in triggers:
+        cursor.execute(f"DROP TRIGGER {name}")
+    return [sql for _, sql in triggers]
+
+def bump_data_version(cursor, name="water_level"):
+    """Increment the version of `name` once (bulk changes made with the triggers suspended)."""
+    cursor.execute("""
+        UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE name = ?
+    """, (name,))
+
+def get_data_version(name="water_level", db_path=DB_PATH):
+    """Return (version, updated_at) of the given table from the version ledger."""
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT version, updated_at FROM data_version WHERE name = ?", (name,))
+        row = cursor.fetchone()
+        return row if row else (0, None)
+
 def record_exists(date_str, hour_str, db_path=DB_PATH):
     """Check if record for given date/hour exists."""
     try:
@@ -80,6 +297,47 @@ def record_exists(date_str, hour_str, db_path=DB_PATH):
         cursor.execute("SELECT 1 FROM water_level WHERE datetime_event = ?", (dt_iso,))
         return cursor.fetchone() is not None
 
+def quarantine_exists(date_str, hour_str, db_path=DB_PATH):
+    """Check if a reading for given date/hour has already been quarantined."""
+    dt = datetime.strptime(f"{date_str} {hour_str}", "%d-%m-%Y %H:%M")
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM water_level_quarantine WHERE datetime_event = ?",
+                       (dt.strftime("%Y-%m-%d %H:%M:%S"),))
+        return cursor.fetchone() is not None
+
+def quarantine_measure(date_str, hour_str, value, unit, reason, db_path=DB_PATH):
+    """Store a suspect reading in the quarantine table instead of water_level."""
+    dt = datetime.strptime(f"{date_str} {hour_str}", "%d-%m-%Y %H:%M")
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR IGNORE INTO water_level_quarantine (date_event, datetime_event, value, unit, reason)
+            VALUES (?, ?, ?, ?, ?)
+        """, (
+            dt.strftime("%Y-%m-%d"),
+            dt.strftime("%Y-%m-%d %H:%M:%S"),
+            float(value),
+            unit,
+            reason
+        ))
+        conn.commit()
+
+def release_quarantine(start, end, db_path=DB_PATH):
+    """Move quarantined readings between start and end (inclusive) back to water_level; return how many moved."""
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR IGNORE INTO water_level (date_event, datetime_event, value, unit)
+            SELECT date_event, datetime_event, value, unit FROM water_level_quarantine
+            WHERE datetime_event BETWEEN ? AND ?
+            ORDER BY datetime_event
+        """, (start, end))
+        moved = cursor.rowcount
+        cursor.execute("DELETE FROM water_level_quarantine WHERE datetime_event BETWEEN ? AND ?", (start, end))
+        conn.commit()
+    return moved
+
 def add_measure(date_str, hour_str, value, unit, db_path=DB_PATH):
     """Add a measure if it does not already exist."""
     try:
@@ -136,12 +394,185 @@ def get_first_measure_data(db_path=DB_PATH):
         """
         return pd.read_sql_query(query, conn)
     
-def log_gpt_call(model, prompt, response, prompt_tokens, completion_tokens, total_tokens, type="tendance", db_path=DB_PATH):
+# --- Rollups (raw -> 1h -> 6h -> 1d) ---
+
+# Expression SQL du début de bucket pour chaque niveau de la pyramide
+ROLLUP_BUCKETS = {
+    "1h": "strftime('%Y-%m-%d %H:00:00', datetime_event)",
+    "6h": "date(datetime_event) || printf(' %02d:00:00', "
+          "(CAST(strftime('%H', datetime_event) AS INTEGER) / 6) * 6)",
+    "1d": "date(datetime_event) || ' 00:00:00'",
+}
+
+def get_compaction_watermark(db_path=DB_PATH):
+    """Return 'YYYY-MM-DD 00:00:00' below which water_level is compacted, or None."""
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT compacted_before FROM compaction_watermark WHERE name = 'water_level'")
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+def refresh_rollups(start_date=None, end_date=None, db_path=DB_PATH):
+    """
+    Recalcule les agrégats de chaque résolution pour les jours de start_date à end_date inclus
+    ('YYYY-MM-DD'), toute la pyramide sans bornes. Sous le filigrane de compactage, seuls
+    les buckets absents sont ajoutés.
+    """
+    start = f"{start_date or '0000-01-01'} 00:00:00"
+    end = (datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d 00:00:00") \
+        if end_date else "9999-12-31 00:00:00"
+    watermark = get_compaction_watermark(db_path) or start
+    live_start = max(start, watermark)
+
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        for resolution, bucket in ROLLUP_BUCKETS.items():
+            insert = f"""
+                INSERT OR IGNORE INTO water_level_rollup
+                    (resolution, bucket_start, value_mean, value_min, value_max, n_samples)
+                SELECT ?, {bucket} AS bucket_start, AVG(value), MIN(value), MAX(value), COUNT(*)
+                FROM water_level
+                WHERE datetime_event >= ? AND datetime_event < ?
+                GROUP BY bucket_start
+            """
+            if start < watermark:
+                cursor.execute(insert, (resolution, start, min(end, watermark)))
+            if live_start < end:
+                cursor.execute("""
+                    DELETE FROM water_level_rollup
+                    WHERE resolution = ? AND bucket_start >= ? AND bucket_start < ?
+                """, (resolution, live_start, end))
+                cursor.execute(insert, (resolution, live_start, end))
+        conn.commit()
+
+def ensure_rollups(db_path=DB_PATH):
+    """Construit la pyramide complète si elle n'a jamais été calculée (base existante)."""
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM water_level_rollup LIMIT 1")
+        if cursor.fetchone() is not None:
+            return
+    logger.info("Building rollup tables from raw readings")
+    refresh_rollups(db_path=db_path)
+
+# --- Instantané des KPI ---
+
+# Colonne de kpi_snapshot -> ancienneté de la mesure de référence (jours)
+KPI_SNAPSHOT_OFFSETS = {
+    "delta_1d": 1,
+    "delta_3d": 3,
+    "delta_7d": 7,
+    "delta_30d": 30,
+    "delta_60d": 60,
+    "delta_1y": 365,
+    "delta_2y": 730,
+    "delta_3y": 1095,
+}
+
+def refresh_kpi_snapshot(site_id=SITE_ID, db_path=DB_PATH):
+    """
+    Recalcule la ligne kpi_snapshot du site : dernière mesure puis une recherche
+    indexée (datetime_event UNIQUE) par date de référence, sans charger l'historique.
+    """
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT version FROM data_version WHERE name = 'water_level'")
+        row = cursor.fetchone()
+        version = row[0] if row else 0
+        cursor.execute("""
+            SELECT datetime_event, value FROM water_level
+            ORDER BY datetime_event DESC LIMIT 1
+        """)
+        latest = cursor.fetchone()
+        if latest is None:
+            cursor.execute("DELETE FROM kpi_snapshot WHERE site_id = ?", (site_id,))
+            conn.commit()
+            return
+        last_dt, last_value = latest
+        current = datetime.strptime(last_dt, "%Y-%m-%d %H:%M:%S")
+
+        deltas = {}
+        for column, days in KPI_SNAPSHOT_OFFSETS.items():
+            cursor.execute("""
+                SELECT value FROM water_level
+                WHERE datetime_event <= ?
+                ORDER BY datetime_event DESC LIMIT 1
+            """, ((current - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S"),))
+            ref = cursor.fetchone()
+            deltas[column] = last_value - ref[0] if ref else None
+
+        columns = ", ".join(deltas)
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO kpi_snapshot
+                (site_id, datetime_event, value, {columns}, data_version, updated_at)
+            VALUES (?, ?, ?, {", ".join("?" * len(deltas))}, ?, CURRENT_TIMESTAMP)
+        """, (site_id, last_dt, last_value, *deltas.values(), version))
+        conn.commit()
+
+def get_kpi_snapshot(site_id=SITE_ID, db_path=DB_PATH):
+    """Return the site's kpi_snapshot row as a dict (None if empty), recomputed if the data changed."""
+    query = "SELECT * FROM kpi_snapshot WHERE site_id = ?"
+    with sqlite3.connect(db_path) as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(query, (site_id,))
+        row = cursor.fetchone()
+        cursor.execute("SELECT version FROM data_version WHERE name = 'water_level'")
+        version = cursor.fetchone()
+        if row is not None and version is not None and row["data_version"] == version[0]:
+            return dict(row)
+    refresh_kpi_snapshot(site_id, db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.row_factory = sqlite3.Row
+        row = conn.execute(query, (site_id,)).fetchone()
+        return dict(row) if row else None
+
+# --- Prévision stockée ---
+
+def save_forecast(forecast_df, data_version, model=None, db_path=DB_PATH):
+    """Replace the stored forecast with forecast_df (`ds`, `yhat`, optional bands)."""
+    lower = forecast_df["yhat_lower"] if "yhat_lower" in forecast_df else [None] * len(forecast_df)
+    upper = forecast_df["yhat_upper"] if "yhat_upper" in forecast_df else [None] * len(forecast_df)
+    rows = [
+        (pd.Timestamp(ds).strftime("%Y-%m-%d %H:%M:%S"), float(yhat),
+         None if lo is None else float(lo), None if up is None else float(up),
+         int(data_version), model)
+        for ds, yhat, lo, up in zip(forecast_df["ds"], forecast_df["yhat"], lower, upper)
+    ]
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM forecast")
+        cursor.executemany("""
+            INSERT INTO forecast (ds, yhat, yhat_lower, yhat_upper, data_version, model)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+        # Une entrée du registre par prévision enregistrée (ETag de /forecast)
+        cursor.execute("""
+            UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE name = 'forecast'
+        """)
+        conn.commit()
+
+def get_latest_forecast(db_path=DB_PATH):
+    """Return (DataFrame, data_version, model) of the stored forecast; version and model are None if absent."""
+    with sqlite3.connect(db_path) as conn:
+        df = pd.read_sql_query(
+            "SELECT ds, yhat, yhat_lower, yhat_upper, data_version, model FROM forecast ORDER BY ds",
+            conn, parse_dates=["ds"]
+        )
+    points = df[["ds", "yhat", "yhat_lower", "yhat_upper"]]
+    if df.empty:
+        return points, None, None
+    return points, int(df["data_version"].iloc[0]), df["model"].iloc[0]
+
+def log_gpt_call(model, prompt, response, prompt_tokens, completion_tokens, total_tokens, type="tendance",
+                 latency_ms=None, first_token_ms=None, error=None, db_path=DB_PATH):
     with sqlite3.connect(db_path) as conn:
         cursor = conn.cursor()
         cursor.execute("""
-            INSERT INTO gpt_logs (model, prompt, response, prompt_tokens, completion_tokens, total_tokens, type)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO gpt_logs (model, prompt, response, prompt_tokens, completion_tokens, total_tokens, type,
+                                  latency_ms, first_token_ms, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             model,
             prompt,
@@ -149,57 +580,90 @@ def log_gpt_call(model, prompt, response, prompt_tokens, completion_tokens, tota
             prompt_tokens,
             completion_tokens,
             total_tokens,
-            type
+            type,
+            latency_ms,
+            first_token_ms,
+            error
         ))
         conn.commit()
 
+# Appels autorisés par jour et par type, échecs compris
+GPT_DAILY_QUOTA = 10
+
+def count_gpt_calls_today(type, cursor):
+    """Count calls of this type since midnight UTC, the clock used by created_at."""
+    cursor.execute("""
+        SELECT COUNT(*) FROM gpt_logs
+        WHERE type = ? AND created_at >= DATE('now')
+    """, (type,))
+    return cursor.fetchone()[0]
+
+def get_gpt_usage(days=7, db_path=DB_PATH):
+    """Per-day and per-type usage over the last `days` days, from the gpt_usage_daily view."""
+    with sqlite3.connect(db_path) as conn:
+        return pd.read_sql_query(
+            "SELECT * FROM gpt_usage_daily WHERE day >= DATE('now', ?) ORDER BY day DESC, type",
+            conn, params=(f"-{days - 1} days",)
+        )
+
+def get_latest_commentary(type="tendance", db_path=DB_PATH):
+    """Return (response, created_at) of the latest stored generation of this type, or (None, None)."""
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT response, created_at
+            FROM gpt_logs
+            WHERE type = ? AND error IS NULL
+            ORDER BY created_at DESC
+            LIMIT 1
+        """, (type,))
+        row = cursor.fetchone()
+        return row if row else (None, None)
+
+def get_latest_commentary_id(db_path=DB_PATH):
+    """Id of the latest successful generation, all types (0 if none)."""
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM gpt_logs WHERE error IS NULL")
+        return cursor.fetchone()[0] or 0
+
 def should_generate_commentary(db_path=DB_PATH):
     """
     Autorise une génération 'tendance' si :
-    - la dernière remonte à plus de 6h
-    - et moins de 10 appels de ce type aujourd'hui
+    - la dernière réussie remonte à plus de 6h
+    - et moins de GPT_DAILY_QUOTA appels de ce type aujourd'hui
     Renvoie (bool, dernière réponse du type 'tendance').
     """
     with sqlite3.connect(db_path) as conn:
         cursor = conn.cursor()
 
-        # 1. Dernière génération du type 'tendance'
+        # 1. Dernière génération réussie du type 'tendance' (index (type, created_at))
         cursor.execute("""
             SELECT created_at, response
             FROM gpt_logs
-            WHERE type = 'tendance'
+            WHERE type = 'tendance' AND error IS NULL
             ORDER BY created_at DESC
             LIMIT 1
         """)
         row = cursor.fetchone()
+        last_response = None
         if row:
             last_time_str, last_response = row
             last_time = datetime.strptime(last_time_str, "%Y-%m-%d %H:%M:%S")
-        else:
-            return True, None  # jamais généré => autorisé
-
-        # 2. Vérifier si au moins 6h se sont écoulées
-        now = datetime.now()
-        delta = now - last_time
-        if delta < timedelta(hours=6):
-            # 3. Vérifier s'il y a déjà 10 générations aujourd'hui (du même type)
-            cursor.execute("""
-                SELECT COUNT(*)
-                FROM gpt_logs
-                WHERE type = 'tendance'
-                  AND DATE(created_at) = DATE('now')
-            """)
-            count_today = cursor.fetchone()[0]
-            if count_today >= 10:
-                return False, last_response
-            else:
+
+            # 2. Vérifier si au moins 6h se sont écoulées
+            if datetime.now() - last_time < timedelta(hours=6):
                 return False, last_response
 
-        return True, None
+        # 3. Quota du jour, échecs et dépassements de délai compris
+        if count_gpt_calls_today("tendance", cursor) >= GPT_DAILY_QUOTA:
+            return False, last_response
+        return True, last_response
     
 def should_generate_annual_comparison(db_path=DB_PATH):
     """
-    Autorise une seule génération 'comparaison_annuelle' par jour.
+    Autorise une seule génération 'comparaison_annuelle' réussie par jour
+    (et au plus GPT_DAILY_QUOTA tentatives).
     Renvoie (do_generate, last_comment).
     """
     with sqlite3.connect(db_path) as conn:
@@ -208,12 +672,14 @@ def should_generate_annual_comparison(db_path=DB_PATH):
             SELECT response
             FROM gpt_logs
             WHERE type = 'comparaison_annuelle'
-              AND DATE(created_at) = DATE('now')
+              AND created_at >= DATE('now')
+              AND error IS NULL
             ORDER BY created_at DESC
             LIMIT 1
         """)
         row = cursor.fetchone()
         if row:
             return False, row[0]
-        else:
-            return True, None
\ No newline at end of file
+        if count_gpt_calls_today("comparaison_annuelle", cursor) >= GPT_DAILY_QUOTA:
+            return False, get_latest_commentary("comparaison_annuelle", db_path)[0]
+        return True, None
@@ -0,0 +1,195 @@
+"""
+Benchmarks du chargement et des calculs sur une base synthétique.
+
+    python benchmark.py                     # tous les benchmarks, 1 million de mesures
+    python benchmark.py --rows 5000000 memory
+
+Chaque benchmark reçoit le chemin d'une base SQLite générée (une mesure toutes les
+10 minutes) et renvoie un dict de résultats affiché à l'écran.
+"""
+
+import argparse
+import gc
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from bdd import init_db
+from webapp.data_access import get_all_data, get_first_measure_data, parquet_snapshot
+from webapp.kpi import compute_kpis, load_kpis
+from webapp.series import load_series, map_series, publish_series
+
+
+def build_synthetic_db(db_path, rows, step_minutes=10):
+    """Fill water_level with `rows` seasonal readings ending now."""
+    init_db(db_path)
+    end = pd.Timestamp.now().floor("min")
+    times = pd.date_range(end=end, periods=rows, freq=f"{step_minutes}min")
+    doy = times.dayofyear.to_numpy() + times.hour.to_numpy() / 24
+    values = 655 + 5 * np.sin(2 * np.pi * (doy - 60) / 365) + np.random.default_rng(0).normal(0, 0.01, rows)
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO water_level (date_event, datetime_event, value, unit) VALUES (?, ?, ?, 'mNGF')",
+            zip(times.strftime("%Y-%m-%d"), times.strftime("%Y-%m-%d %H:%M:%S"), values.tolist())
+        )
+        conn.commit()
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_memory(db_path, rows):
+    """Memory per million rows: DataFrame get_all_data vs WaterLevelSeries."""
+    gc.collect()
+    df, df_s = _timed(get_all_data, db_path)
+    df_bytes = int(df.memory_usage(deep=True).sum())
+    series, series_s = _timed(load_series, db_path)
+    scale = 1_000_000 / rows
+    return {
+        "dataframe_MB_per_Mrows": round(df_bytes * scale / 2**20, 2),
+        "series_MB_per_Mrows": round(series.nbytes * scale / 2**20, 2),
+        "dataframe_load_s": round(df_s, 3),
+        "series_load_s": round(series_s, 3),
+    }
+
+
+def bench_kpis(db_path, rows):
+    """compute_kpis on a DataFrame and on a WaterLevelSeries, versus reading the kpi_snapshot row."""
+    df = get_all_data(db_path)
+    series = load_series(db_path)
+    _, df_s = _timed(compute_kpis, df)
+    _, series_s = _timed(compute_kpis, series)
+    _, snapshot_s = _timed(load_kpis, db_path)  # première lecture : calcul de la ligne
+    _, snapshot_read_s = _timed(load_kpis, db_path)
+    _, load_s = _timed(load_series, db_path)
+    return {
+        "kpis_dataframe_s": round(df_s, 4),
+        "kpis_series_s": round(series_s, 4),
+        "kpis_series_with_load_s": round(series_s + load_s, 4),
+        "kpi_snapshot_refresh_s": round(snapshot_s, 4),
+        "kpi_snapshot_read_s": round(snapshot_read_s, 4),
+    }
+
+
+QUERIES_PER_VERSION = 3  # appels à get_first_measure_data par version des données dans app.py
+
+
+def _ingest_batch(db_path, readings=6, step_minutes=10):
+    """Append `readings` readings after the last one, as one ingestion batch."""
+    with sqlite3.connect(db_path) as conn:
+        last = pd.Timestamp(conn.execute("SELECT MAX(datetime_event) FROM water_level").fetchone()[0])
+        times = pd.date_range(last, periods=readings + 1, freq=f"{step_minutes}min")[1:]
+        conn.executemany(
+            "INSERT INTO water_level (date_event, datetime_event, value, unit) VALUES (?, ?, 655.0, 'mNGF')",
+            zip(times.strftime("%Y-%m-%d"), times.strftime("%Y-%m-%d %H:%M:%S"))
+        )
+        conn.commit()
+
+
+def bench_duckdb(db_path, rows):
+    """
+    First measure per day: SQLite join vs DuckDB on the monthly Parquet files, with parity check.
+    Per-version costs count QUERIES_PER_VERSION queries plus, for DuckDB, the snapshot update.
+    """
+    _, cold_snapshot_s = _timed(parquet_snapshot, db_path)
+    _ingest_batch(db_path)
+    _, snapshot_s = _timed(parquet_snapshot, db_path)
+    sqlite_df, sqlite_s = _timed(get_first_measure_data, db_path, "sqlite")
+    duckdb_df, duckdb_s = _timed(get_first_measure_data, db_path, "duckdb")
+    pd.testing.assert_frame_equal(sqlite_df, duckdb_df, check_dtype=False)
+    sqlite_version_s = QUERIES_PER_VERSION * sqlite_s
+    duckdb_version_s = snapshot_s + QUERIES_PER_VERSION * duckdb_s
+    saving = sqlite_s - duckdb_s
+    return {
+        "years": round((sqlite_df["date"].iloc[-1] - sqlite_df["date"].iloc[0]).days / 365.25, 1),
+        "first_per_day_sqlite_s": round(sqlite_s, 3),
+        "first_per_day_duckdb_s": round(duckdb_s, 3),
+        "parquet_cold_snapshot_s": round(cold_snapshot_s, 3),
+        "parquet_snapshot_per_version_s": round(snapshot_s, 3),
+        "sqlite_per_version_s": round(sqlite_version_s, 3),
+        "duckdb_per_version_s": round(duckdb_version_s, 3),
+        "speedup_per_version": round(sqlite_version_s / duckdb_version_s, 1),
+        "break_even_queries_per_version": round(snapshot_s / saving, 1) if saving > 0 else None,
+    }
+
+
+def _anonymous_mb():
+    """Anonymous memory of the current process in MB, excluding shareable file pages (Linux only)."""
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Anonymous:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _series_private_mb(loader, db_path):
+    """Private memory added by loading then scanning the series in a fresh process."""
+    before = _anonymous_mb()
+    series = loader(db_path)
+    float(series.values.sum()), int(series.times.view("int64").max())
+    return _anonymous_mb() - before
+
+
+def _map_current(db_path):
+    return map_series(db_path=db_path)
+
+
+def bench_shared(db_path, rows):
+    """Per-worker memory of the series: load_series (private copy) vs map_series (shared pages)."""
+    from concurrent.futures import ProcessPoolExecutor
+    _, publish_s = _timed(publish_series, db_path)
+    _, load_s = _timed(load_series, db_path)
+    _, map_s = _timed(map_series, None, db_path)
+    results = {
+        "series_MB": round(12 * rows / 2**20, 1),
+        "publish_s": round(publish_s, 3),
+        "load_s": round(load_s, 3),
+        "map_s": round(map_s, 4),
+    }
+    if os.path.exists("/proc/self/smaps_rollup"):
+        for name, loader in [("load", load_series), ("map", _map_current)]:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                results[f"{name}_private_MB_per_worker"] = round(pool.submit(_series_private_mb, loader, db_path).result(), 1)
+    return results
+
+
+BENCHMARKS = {
+    "memory": bench_memory,
+    "kpis": bench_kpis,
+    "duckdb": bench_duckdb,
+    "shared": bench_shared,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks du niveau d'eau")
+    parser.add_argument("names", nargs="*", help=f"parmi {', '.join(BENCHMARKS)} (tous par défaut)")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--db", default=None, help="base existante (sinon base synthétique temporaire)")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"benchmark inconnu : {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db
+        rows = args.rows
+        if db_path is None:
+            db_path = os.path.join(tmp, "bench.db")
+            _, build_s = _timed(build_synthetic_db, db_path, rows)
+            print(f"synthetic database: {rows} rows in {build_s:.1f} s")
+        else:
+            init_db(db_path)  # tables ajoutées depuis la création de la base
+            with sqlite3.connect(db_path) as conn:
+                rows = conn.execute("SELECT COUNT(*) FROM water_level").fetchone()[0]
+
+        for name in args.names or BENCHMARKS:
+            results = BENCHMARKS[name](db_path, rows)
+            print(f"[{name}] " + ", ".join(f"{k}={v}" for k, v in results.items()))
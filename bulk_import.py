@@ -0,0 +1,181 @@
+"""
+Import hors ligne de mesures historiques (CSV, JSON Lines, Parquet) dans water_level.
+
+Formats reconnus :
+  - export de export_db_to_csv / instantané Parquet : colonnes datetime_event, value[, unit]
+  - chroniques de l'API data.niv-eau.fr : colonnes date (jj-mm-aaaa), heure (HH:MM), valeur[, unite]
+
+    python bulk_import.py dump.csv
+    python bulk_import.py 2019.jsonl 2020.parquet --db clone.db
+
+Les fichiers sont lus par blocs et convertis en vectoriel dans une table de transit sans
+index, puis versés en une seule transaction, triés par datetime_event : l'index
+UNIQUE(datetime_event) est alimenté dans l'ordre et les doublons (déjà en base, en
+quarantaine ou répétés dans les fichiers) sont ignorés. Les triggers de version,
+exécutés à chaque ligne, sont suspendus pendant le versement et la version n'est
+incrémentée qu'une fois. Les mesures importées passent ensuite par la réanalyse vectorisée
+des aberrations (outlier_filter.rescan_history, désactivable par --no-filter) et les suspectes
+sont mises en quarantaine. Agrégats, couverture, KPI, franchissements, profils de variation et
+série partagée sont enfin recalculés sur la plage importée.
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from bdd import bump_data_version, init_db, refresh_kpi_snapshot, refresh_rollups, suspend_version_triggers
+from outlier_filter import quarantine_readings, rescan_history
+from webapp.crossings import update_threshold_events
+from webapp.data_quality import refresh_coverage
+from webapp.patterns import refresh_patterns
+from webapp.series import publish_series
+
+DB_PATH = "niveau_eau.db"
+DEFAULT_UNIT = "mNGF"
+CHUNK_ROWS = 200_000
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(funcName)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    """Yield DataFrames of at most `chunk_rows` rows from a .csv, .jsonl/.ndjson or .parquet file."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".csv", ".gz"):
+        yield from pd.read_csv(path, chunksize=chunk_rows, dtype=str)
+    elif extension in (".jsonl", ".ndjson", ".json"):
+        yield from pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=False)
+    elif extension == ".parquet":
+        frame = pd.read_parquet(path)  # pyarrow ou fastparquet
+        for start in range(0, len(frame), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows]
+    else:
+        raise ValueError(f"Format non reconnu : {path} (csv, jsonl ou parquet)")
+
+
+def normalize(frame, unit=DEFAULT_UNIT):
+    """Convert a chunk to (date_event, datetime_event, value, unit) rows, dropping unreadable ones."""
+    if "datetime_event" in frame:
+        dt = pd.to_datetime(frame["datetime_event"], errors="coerce")
+        values = frame["value"]
+        units = frame["unit"] if "unit" in frame else None
+    elif {"date", "heure", "valeur"} <= set(frame.columns):
+        dt = pd.to_datetime(frame["date"].astype(str) + " " + frame["heure"].astype(str),
+                            format="%d-%m-%Y %H:%M", errors="coerce")
+        values = frame["valeur"]
+        units = frame["unite"] if "unite" in frame else None
+    else:
+        raise ValueError(f"Colonnes non reconnues : {', '.join(map(str, frame.columns))}")
+
+    # Horodatages au format de add_measure (heure locale, sans fuseau)
+    if getattr(dt.dt, "tz", None) is not None:
+        dt = dt.dt.tz_localize(None)
+    rows = pd.DataFrame({
+        "datetime_event": dt.dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "value": pd.to_numeric(values, errors="coerce"),
+        "unit": units.fillna(unit).astype(str) if units is not None else unit,
+    })
+    rows = rows.dropna(subset=["datetime_event", "value"]).drop_duplicates("datetime_event")
+    rows.insert(0, "date_event", rows["datetime_event"].str[:10])
+    return rows
+
+
+def bulk_import(paths, unit=DEFAULT_UNIT, chunk_rows=CHUNK_ROWS, db_path=DB_PATH, filter_outliers=True):
+    """Import every file of `paths` into water_level and return a dict of statistics."""
+    init_db(db_path)
+    start = time.perf_counter()
+    stats = {"read": 0, "inserted": 0, "quarantined": 0, "first": None, "last": None}
+
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("""
+            CREATE TEMP TABLE water_level_staging (
+                date_event DATE, datetime_event DATETIME, value REAL, unit TEXT
+            )
+        """)
+        for path in paths:
+            for chunk in read_chunks(path, chunk_rows):
+                rows = normalize(chunk, unit)
+                # Colonnes converties en listes Python d'un bloc (itertuples est 3x plus lent)
+                cursor.executemany("INSERT INTO water_level_staging VALUES (?, ?, ?, ?)",
+                                   zip(*(rows[column].tolist() for column in rows.columns)))
+                stats["read"] += len(rows)
+            logger.info(f"{path}: staged ({stats['read']} rows so far)")
+        parsed_s = time.perf_counter() - start
+
+        cursor.execute("SELECT MIN(datetime_event), MAX(datetime_event) FROM water_level_staging")
+        stats["first"], stats["last"] = cursor.fetchone()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM water_level")
+        last_id = cursor.fetchone()[0]
+        triggers = suspend_version_triggers(cursor)
+        cursor.execute("""
+            INSERT OR IGNORE INTO water_level (date_event, datetime_event, value, unit)
+            SELECT date_event, datetime_event, value, unit
+            FROM water_level_staging s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM water_level_quarantine q WHERE q.datetime_event = s.datetime_event
+            )
+            ORDER BY datetime_event, rowid
+        """)
+        stats["inserted"] = cursor.rowcount
+        for sql in triggers:
+            cursor.execute(sql)
+        if stats["inserted"]:
+            bump_data_version(cursor)
+        cursor.execute("DROP TABLE water_level_staging")
+        conn.commit()
+    loaded_s = time.perf_counter() - start - parsed_s
+
+    if stats["inserted"] and filter_outliers:
+        # Contexte de la médiane glissante (6 h centrée) autour de la plage importée
+        context = pd.Timedelta(hours=6)
+        flagged = rescan_history((pd.Timestamp(stats["first"]) - context).strftime("%Y-%m-%d %H:%M:%S"), db_path,
+                                 (pd.Timestamp(stats["last"]) + context).strftime("%Y-%m-%d %H:%M:%S"))
+        flagged = flagged[flagged["id"] > last_id]  # seules les mesures de cet import
+        stats["quarantined"] = quarantine_readings(flagged, db_path, refresh=False)
+    filtered_s = time.perf_counter() - start - parsed_s - loaded_s
+
+    if stats["inserted"]:
+        refresh_rollups(stats["first"][:10], stats["last"][:10], db_path)
+        refresh_coverage(stats["first"][:10], stats["last"][:10], db_path)
+        refresh_kpi_snapshot(db_path=db_path)
+        update_threshold_events(since=stats["first"], db_path=db_path)
+        refresh_patterns(since=stats["first"], db_path=db_path)
+        publish_series(db_path)
+    stats["skipped"] = stats["read"] - stats["inserted"]
+    stats["parse_s"] = parsed_s
+    stats["load_s"] = loaded_s
+    stats["filter_s"] = filtered_s
+    stats["total_s"] = time.perf_counter() - start
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import hors ligne de mesures historiques")
+    parser.add_argument("paths", nargs="+", help="fichiers .csv, .jsonl ou .parquet")
+    parser.add_argument("--unit", default=DEFAULT_UNIT, help="unité des fichiers sans colonne d'unité")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--no-filter", action="store_true",
+                        help="ne pas mettre en quarantaine les mesures aberrantes importées")
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+
+    try:
+        stats = bulk_import(args.paths, args.unit, args.chunk_rows, args.db, filter_outliers=not args.no_filter)
+    except (ValueError, ImportError) as e:
+        parser.error(str(e))
+    rate = stats["read"] / stats["total_s"] if stats["total_s"] else 0
+    logger.info(f"{stats['read']} rows read, {stats['inserted']} inserted, {stats['skipped']} duplicates skipped, "
+                f"{stats['quarantined']} quarantined ({stats['first']} -> {stats['last']})")
+    logger.info(f"parse {stats['parse_s']:.1f} s, load {stats['load_s']:.1f} s, filter {stats['filter_s']:.1f} s, "
+                f"total {stats['total_s']:.1f} s ({rate:,.0f} rows/s)")
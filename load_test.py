@@ -0,0 +1,125 @@
+"""
+Test de charge du tableau de bord : N sessions simultanées pilotées par AppTest
+(streamlit.testing), sur une base synthétique, API de mesures et OpenAI bouchonnés.
+
+Toutes les sessions tournent dans le même processus, comme derrière un serveur
+Streamlit : les caches partagés (cache_resource, cache_data, figures) sont donc mesurés.
+
+    python load_test.py                          # 1, 2, 4, 8 et 16 sessions, 3 exécutions chacune
+    python load_test.py --sessions 1 8 32 --runs 5 --rows 500000
+
+Pour chaque niveau de concurrence : temps d'exécution p50/p95 du script et mémoire
+résidente totale, et par session au-delà des caches partagés (mesure de référence
+prise après un premier passage à froid).
+"""
+
+import argparse
+import gc
+import math
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from benchmark import build_synthetic_db
+from stubs import install_stubs
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+HISTORY_START = "2021-07-01"  # avant la date de départ de get_missing_days
+
+
+def rss_mb():
+    """Current resident set size in MB (peak since start outside Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed_database(directory, rows):
+    """Synthetic niveau_eau.db with `rows` readings from HISTORY_START to now, plus two thresholds."""
+    from webapp.data_access import create_threshold_line
+    db_path = os.path.join(directory, "niveau_eau.db")
+    span_minutes = (pd.Timestamp.now() - pd.Timestamp(HISTORY_START)).total_seconds() / 60
+    build_synthetic_db(db_path, rows, step_minutes=max(1, math.ceil(span_minutes / rows)))
+    create_threshold_line("Alerte", "Reculer le bateau", 652.0, "#d62728", "dash", db_path=db_path)
+    create_threshold_line("Plein", "Niveau normal haut", 658.0, "#2ca02c", "dot", db_path=db_path)
+    with open(os.path.join(directory, "ignore_dates.yaml"), "w") as f:
+        f.write("ignore_dates: []\n")
+    return db_path
+
+
+def _serialize_script_compilation():
+    """Compile app.py under a lock, as ast.parse is not thread-safe on Python 3.11."""
+    import threading
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    get_bytecode, lock = ScriptCache.get_bytecode, threading.Lock()
+
+    def locked_get_bytecode(self, script_path):
+        with lock:
+            return get_bytecode(self, script_path)
+
+    ScriptCache.get_bytecode = locked_get_bytecode
+
+
+def _drive(app, runs):
+    """Run one session `runs` times; return the wall time of each run."""
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        app.run()
+        durations.append(time.perf_counter() - start)
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+    return durations
+
+
+def run_level(sessions, runs, timeout=300):
+    """Drive `sessions` concurrent AppTest sessions; return (durations, RSS in MB)."""
+    from streamlit.testing.v1 import AppTest
+    from streamlit.testing.v1.util import patch_config_options
+    apps = [AppTest.from_file(APP_PATH, default_timeout=timeout) for _ in range(sessions)]
+    # AppTest.run remplace config.get_option le temps d'une exécution puis restaure l'original :
+    # entre sessions concurrentes, le patch doit être tenu pendant tout le niveau
+    with patch_config_options({"global.appTest": True}), ThreadPoolExecutor(max_workers=sessions) as pool:
+        durations = [d for result in pool.map(_drive, apps, [runs] * sessions) for d in result]
+    gc.collect()
+    rss = rss_mb()  # sessions encore vivantes : leur état compte dans la mesure
+    del apps
+    return durations, rss
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test de charge du tableau de bord (AppTest)")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--runs", type=int, default=3, help="exécutions du script par session")
+    parser.add_argument("--rows", type=int, default=200_000, help="mesures de la base synthétique")
+    parser.add_argument("--timeout", type=int, default=300)
+    args = parser.parse_args()
+
+    os.environ.setdefault("FORECAST_MODEL", "climatology")
+    install_stubs()
+    _serialize_script_compilation()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_database(tmp, args.rows)
+        # app.py lit niveau_eau.db et ignore_dates.yaml dans le répertoire courant
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            # Référence après un premier passage : les caches partagés sont déjà remplis
+            cold, baseline = run_level(1, 1, args.timeout)
+            print(f"cold start: {cold[0]:.2f} s, RSS with warm shared caches {baseline:.0f} MB")
+            print(f"{'sessions':>8} {'runs':>5} {'p50_s':>7} {'p95_s':>7} {'max_s':>7} {'rss_MB':>7} {'MB/session':>10}")
+            for sessions in args.sessions:
+                durations, rss = run_level(sessions, args.runs, args.timeout)
+                p50, p95 = np.percentile(durations, [50, 95])
+                print(f"{sessions:>8} {len(durations):>5} {p50:>7.3f} {p95:>7.3f} {max(durations):>7.3f} "
+                      f"{rss:>7.0f} {(rss - baseline) / sessions:>10.1f}")
+        finally:
+            os.chdir(cwd)
@@ -0,0 +1,278 @@
+"""
+Filtrage des mesures aberrantes (pics capteur) à l'ingestion.
+
+- StreamingOutlierFilter : filtre en flux, coût constant par mesure (fenêtre glissante
+  des vitesses de variation acceptées, médiane/MAD + vitesse maximale plausible en m/h).
+- rescan_history : réanalyse vectorisée de l'historique déjà stocké.
+
+Les mesures suspectes sont déplacées dans la table water_level_quarantine au lieu
+d'alimenter water_level. Quand MAX_CONSECUTIVE mesures d'affilée sont rejetées, le niveau
+a réellement changé : le filtre se recale et les mesures écartées depuis la dernière mesure
+valide sont rétablies dans water_level.
+
+    python outlier_filter.py --rescan            # rapport seul
+    python outlier_filter.py --rescan --apply    # mise en quarantaine
+    python outlier_filter.py --release --since 2024-03-01 [--until 2024-03-02]   # rétablissement manuel
+"""
+
+import argparse
+import bisect
+import logging
+import sqlite3
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from bdd import bump_data_version, refresh_rollups, refresh_kpi_snapshot, release_quarantine, suspend_version_triggers
+from webapp.crossings import update_threshold_events
+from webapp.data_quality import refresh_coverage
+from webapp.patterns import refresh_patterns
+
+DB_PATH = "niveau_eau.db"
+
+WINDOW = 48                # nombre de variations acceptées conservées
+MAD_THRESHOLD = 6.0        # écart toléré, en écarts-types robustes
+MIN_DEVIATION_M = 0.05     # écart minimal toujours toléré (m)
+MAX_RATE_M_PER_H = 0.5     # vitesse de variation maximale plausible (m/h)
+MAX_CONSECUTIVE = 6        # au-delà, le niveau a réellement changé : on se recale
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(funcName)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+
+class StreamingOutlierFilter:
+    """Check readings one by one against a bounded window of recent accepted readings."""
+
+    def __init__(self, window=WINDOW, mad_threshold=MAD_THRESHOLD,
+                 min_deviation=MIN_DEVIATION_M, max_rate=MAX_RATE_M_PER_H,
+                 max_consecutive=MAX_CONSECUTIVE):
+        self.window = window
+        self.mad_threshold = mad_threshold
+        self.min_deviation = min_deviation
+        self.max_rate = max_rate
+        self.max_consecutive = max_consecutive
+        self._rates = deque()      # ordre d'arrivée
+        self._sorted = []          # mêmes valeurs, triées (médiane)
+        self.last_time = None
+        self.last_value = None
+        self.consecutive_rejects = 0
+        self.pending = []          # mesures rejetées depuis la dernière mesure valide
+        self._released = []
+
+    def _median(self):
+        n = len(self._sorted)
+        mid = n // 2
+        return self._sorted[mid] if n % 2 else (self._sorted[mid - 1] + self._sorted[mid]) / 2
+
+    def _push_rate(self, rate):
+        self._rates.append(rate)
+        bisect.insort(self._sorted, rate)
+        if len(self._rates) > self.window:
+            old = self._rates.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, old)]
+
+    def accept(self, dt, value):
+        """Record a reading as valid (already stored or accepted)."""
+        if self.last_time is not None:
+            hours = (dt - self.last_time).total_seconds() / 3600
+            if hours > 0:
+                self._push_rate((value - self.last_value) / hours)
+        self.last_time, self.last_value = dt, value
+        self.consecutive_rejects = 0
+        self.pending = []
+
+    def reject(self, dt, value):
+        """Record a rejected reading; return True when MAX_CONSECUTIVE rejections re-anchor the filter."""
+        self.consecutive_rejects += 1
+        self.pending.append((dt, value))
+        if self.consecutive_rejects < self.max_consecutive:
+            return False
+        logger.warning(f"{self.consecutive_rejects} consecutive rejections, re-anchoring at {dt}")
+        released = self.pending
+        self._rates.clear()
+        self._sorted.clear()
+        self.last_time = None
+        for pending_dt, pending_value in released:
+            self.accept(pending_dt, pending_value)
+        self._released = released
+        return True
+
+    def pop_released(self):
+        """(dt, value) readings re-accepted by the last re-anchoring, to release from quarantine."""
+        released, self._released = self._released, []
+        return released
+
+    def check(self, dt, value):
+        """Return None if the reading looks valid (and record it), else the reason ('rate' or 'mad')."""
+        if self.last_time is None:
+            self.accept(dt, value)
+            return None
+        hours = (dt - self.last_time).total_seconds() / 3600
+        if hours <= 0:
+            return None
+
+        rate = (value - self.last_value) / hours
+        reason = None
+        if abs(rate) > self.max_rate:
+            reason = "rate"
+        elif len(self._rates) >= 5:
+            median = self._median()
+            mad = float(np.median(np.abs(np.asarray(self._sorted) - median)))
+            tolerance = max(self.mad_threshold * 1.4826 * mad * hours, self.min_deviation)
+            if abs(rate - median) * hours > tolerance:
+                reason = "mad"
+
+        if reason is not None:
+            return None if self.reject(dt, value) else reason
+        self.accept(dt, value)
+        return None
+
+
+def build_filter(before, db_path=DB_PATH):
+    """Return a filter seeded with the readings before `before`, including the current run of rejections."""
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT datetime_event, value FROM water_level
+            WHERE datetime_event < ?
+            ORDER BY datetime_event DESC
+            LIMIT ?
+        """, (before, WINDOW + 1))
+        rows = cursor.fetchall()
+        cursor.execute("""
+            SELECT datetime_event, value FROM water_level_quarantine
+            WHERE datetime_event > ? AND datetime_event < ?
+            ORDER BY datetime_event DESC
+            LIMIT ?
+        """, (rows[0][0] if rows else "", before, MAX_CONSECUTIVE - 1))
+        pending = cursor.fetchall()
+    outlier_filter = StreamingOutlierFilter()
+    for dt_str, value in reversed(rows):
+        outlier_filter.accept(datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S"), value)
+    outlier_filter.pending = [(datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S"), value)
+                              for dt_str, value in reversed(pending)]
+    outlier_filter.consecutive_rejects = len(pending)
+    return outlier_filter
+
+
+def rescan_history(since=None, db_path=DB_PATH, until=None):
+    """Vectorized scan of stored readings; return the suspect ones (id, datetime_event, value, reason)."""
+    with sqlite3.connect(db_path) as conn:
+        df = pd.read_sql_query(
+            """
+            SELECT id, datetime_event, value FROM water_level
+            WHERE datetime_event >= ? AND datetime_event <= ?
+            ORDER BY datetime_event
+            """,
+            conn, params=(since or "", until or "9999-12-31 23:59:59"), parse_dates=["datetime_event"]
+        )
+    if df.empty:
+        return df.assign(reason=pd.Series(dtype=str))
+
+    values = df.set_index("datetime_event")["value"]
+    median = values.rolling("6h", center=True, min_periods=3).median()
+    deviation = (values - median).abs()
+    mad = deviation.rolling("6h", center=True, min_periods=3).median()
+    tolerance = np.maximum(MAD_THRESHOLD * 1.4826 * mad, MIN_DEVIATION_M)
+
+    hours = values.index.to_series().diff().dt.total_seconds().div(3600).to_numpy()
+    jump = np.abs(np.diff(values.to_numpy(), prepend=np.nan)) / hours
+
+    is_mad = (deviation > tolerance).to_numpy()
+    # Un saut trop rapide n'est imputé qu'à la mesure qui s'écarte de la médiane
+    is_rate = (jump > MAX_RATE_M_PER_H) & (deviation.to_numpy() > MIN_DEVIATION_M)
+    flagged = df[is_mad | is_rate].copy()
+    flagged["reason"] = np.where(is_rate[is_mad | is_rate], "rate", "mad")
+    return flagged
+
+
+def quarantine_readings(flagged, db_path=DB_PATH, refresh=True):
+    """Move flagged water_level rows to the quarantine table (refresh=False leaves the refresh to the caller)."""
+    if flagged.empty:
+        return 0
+    ids = [int(i) for i in flagged["id"]]
+    reasons = dict(zip(ids, flagged["reason"]))
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        # Triggers de version suspendus pendant les suppressions : une seule nouvelle version
+        triggers = suspend_version_triggers(cursor)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            cursor.execute(f"""
+                SELECT id, date_event, datetime_event, value, unit
+                FROM water_level WHERE id IN ({marks})
+            """, chunk)
+            cursor.executemany("""
+                INSERT OR IGNORE INTO water_level_quarantine
+                    (date_event, datetime_event, value, unit, reason)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(d, dt, v, u, reasons[i]) for i, d, dt, v, u in cursor.fetchall()])
+            cursor.execute(f"DELETE FROM water_level WHERE id IN ({marks})", chunk)
+        for sql in triggers:
+            cursor.execute(sql)
+        bump_data_version(cursor)
+        conn.commit()
+    if not refresh:
+        return len(ids)
+
+    # Seuls les jours touchés sont recalculés
+    days = sorted(flagged["datetime_event"].dt.strftime("%Y-%m-%d").unique())
+    for day in days:
+        refresh_rollups(day, day, db_path)
+        refresh_coverage(day, day, db_path)
+    _refresh_derived(days[0], db_path)
+    return len(ids)
+
+
+def release_readings(start, end, db_path=DB_PATH):
+    """Move quarantined readings between start and end (inclusive) back to water_level and refresh."""
+    moved = release_quarantine(start, end, db_path)
+    if moved:
+        refresh_rollups(start[:10], end[:10], db_path)
+        refresh_coverage(start[:10], end[:10], db_path)
+        _refresh_derived(start[:10], db_path)
+    return moved
+
+
+def _refresh_derived(first_day, db_path):
+    """KPI, franchissements et profils de variation depuis `first_day`."""
+    refresh_kpi_snapshot(db_path=db_path)
+    update_threshold_events(since=f"{first_day} 00:00:00", db_path=db_path)
+    refresh_patterns(since=f"{first_day} 00:00:00", db_path=db_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Détection des mesures aberrantes")
+    parser.add_argument("--rescan", action="store_true", help="réanalyser l'historique stocké")
+    parser.add_argument("--since", default=None, help="date de début (YYYY-MM-DD)")
+    parser.add_argument("--until", default=None, help="date de fin incluse pour --release (YYYY-MM-DD)")
+    parser.add_argument("--apply", action="store_true", help="mettre en quarantaine les mesures détectées")
+    parser.add_argument("--release", action="store_true", help="rétablir les mesures en quarantaine de la période")
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+
+    if args.release:
+        if not args.since:
+            parser.error("--release nécessite --since")
+        until = args.until or datetime.now().strftime("%Y-%m-%d")
+        moved = release_readings(f"{args.since} 00:00:00", f"{until} 23:59:59", args.db)
+        logger.info(f"{moved} readings released from quarantine")
+        raise SystemExit(0)
+    if not args.rescan:
+        parser.error("rien à faire : utiliser --rescan ou --release")
+    flagged = rescan_history(args.since, args.db)
+    logger.info(f"{len(flagged)} suspect readings")
+    if not flagged.empty:
+        print(flagged.to_string(index=False))
+    if args.apply:
+        moved = quarantine_readings(flagged, args.db)
+        logger.info(f"{moved} readings moved to quarantine")
@@ -0,0 +1,210 @@
+"""
+Rapport HTML statique du tableau de bord (KPI, graphiques, derniers commentaires).
+
+Le fichier produit est autonome (plotly.js inclus une seule fois) et peut être servi par
+n'importe quel serveur de fichiers statiques : les lecteurs n'ouvrent pas de session
+Streamlit et ne chargent pas les données.
+
+    python render_snapshot.py --out public/index.html
+    python render_snapshot.py --update --out public/index.html   # ingestion puis rendu (cron)
+
+Avec --update, le rapport n'est réécrit que si les données, les seuils ou les commentaires ont changé.
+"""
+
+import argparse
+import html
+import logging
+import os
+import re
+from datetime import datetime
+
+import pandas as pd
+
+from bdd import (
+    DB_PATH,
+    get_data_version,
+    get_latest_commentary,
+    get_latest_commentary_id,
+    get_latest_forecast,
+    init_db,
+    save_forecast,
+)
+from webapp.colors import build_year_color_map
+from webapp.data_access import (
+    RESOLUTION_HOURS,
+    choose_resolution,
+    get_first_measure_data,
+    get_series,
+    get_threshold_lines,
+)
+from webapp.figures import (
+    build_annual_figure,
+    build_daily_figure,
+    build_forecast_figure,
+    build_recent_figure,
+    prepare_daily,
+)
+from webapp.forecast import climatology_bands, forecast_water_level, resolve_forecast_model
+from webapp.kpi import load_kpis
+from webapp.series import map_series
+from webapp.ui_components import KPI_STYLE, render_kpi
+
+OUTPUT_PATH = "snapshot/index.html"
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(funcName)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="fr">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<meta name="data-version" content="{version}">
+<title>Surveillance du niveau d'eau</title>
+{kpi_style}
+<style>
+body {{ font-family: sans-serif; max-width: 1200px; margin: auto; padding: 0 16px; }}
+.kpi-row {{ display: grid; grid-template-columns: repeat(3, 1fr); }}
+.generated {{ color: #666; font-size: 13px; }}
+</style>
+</head>
+<body>
+<h1>💧 Niveau d'eau du barrage du lac des Saints Peyres</h1>
+<p class="generated">Instantané généré le {generated_at}</p>
+{body}
+</body>
+</html>
+"""
+
+
+def snapshot_version(db_path=DB_PATH):
+    """Token identifying the data rendered in a snapshot ('<readings>-<thresholds>-<last commentary>')."""
+    return (f"{get_data_version(db_path=db_path)[0]}-{get_data_version('threshold_line', db_path)[0]}"
+            f"-{get_latest_commentary_id(db_path)}")
+
+
+def rendered_version(out_path):
+    """Version token embedded in an existing snapshot (None if absent)."""
+    if not os.path.exists(out_path):
+        return None
+    with open(out_path, encoding="utf-8") as f:
+        match = re.search(r'<meta name="data-version" content="([^"]*)">', f.read(4096))
+    return match.group(1) if match else None
+
+
+def _kpi_row(cards):
+    return '<div class="kpi-row">' + "".join(render_kpi(*card) for card in cards) + "</div>"
+
+
+def _commentary(type, db_path=DB_PATH):
+    response, created_at = get_latest_commentary(type, db_path)
+    if response is None:
+        return ""
+    return f'<h4>✨ {html.escape(response)}</h4><p class="generated">Commentaire du {created_at}</p>'
+
+
+def _stored_forecast(series, version, db_path):
+    """Stored forecast, recomputed as in app.py if the data changed since."""
+    forecast_df, forecast_version, forecast_model = get_latest_forecast(db_path)
+    if forecast_version != version or forecast_model != resolve_forecast_model():
+        forecast_df, model = forecast_water_level(series)
+        forecast_df = forecast_df[forecast_df["ds"] > pd.Timestamp(series.times[-1])]
+        save_forecast(forecast_df, version, model=model, db_path=db_path)
+    return forecast_df[forecast_df["ds"] > pd.Timestamp.now()]
+
+
+def render_snapshot(out_path=OUTPUT_PATH, days=3, db_path=DB_PATH):
+    """Atomically write the static report to out_path and return its version token."""
+    version = snapshot_version(db_path)
+    data_version, _ = get_data_version(db_path=db_path)
+    kpis = load_kpis(db_path)
+    thresholds = get_threshold_lines(db_path)
+    now = pd.Timestamp.now()
+    parts = []
+
+    # KPI et commentaire de tendance
+    kpi_level = kpis.get("kpi_level")
+    parts.append("<h2>Tendance actuelle</h2>")
+    parts.append(_commentary("tendance", db_path))
+    parts.append(_kpi_row([
+        ("Dernier relevé", kpis.get("kpi_date"), False),
+        ("Niveau actuel", f"{kpi_level:.2f} m" if kpi_level is not None else None, False),
+        ("Tendance 7 jours (m/j)", kpis.get("kpi_7j"), True),
+    ]))
+    parts.append(_kpi_row([
+        ("VS Hier", kpis.get("kpi_j1"), True),
+        ("VS Il y a 3 jours", kpis.get("kpi_j3"), True),
+        ("VS Semaine dernière", kpis.get("kpi_s1"), True),
+    ]))
+
+    figures = []
+    start = now - pd.Timedelta(days=days)
+    resolution = choose_resolution(start, now)
+    df_window = get_series(start, resolution=resolution, db_path=db_path)
+    if not df_window.empty:
+        figures.append((f"Évolution sur les {days} derniers jours", "",
+                        build_recent_figure(df_window, RESOLUTION_HOURS[resolution], thresholds)))
+
+    df_first = get_first_measure_data(db_path)
+    if not df_first.empty:
+        df_daily = prepare_daily(df_first)
+        years = sorted(df_daily["Year"].unique().tolist())
+        color_map = build_year_color_map(years)
+        recent_years = df_daily[df_daily["Year"] > now.year - 4]
+        figures.append(("Comparaison annuelle (du 1er janvier au 31 décembre)",
+                        _commentary("comparaison_annuelle", db_path),
+                        build_annual_figure(recent_years, color_map, thresholds, climatology_bands(df_daily))))
+        figures.append(("Évolution quotidienne du niveau d'eau", "",
+                        build_daily_figure(df_daily, color_map, thresholds)))
+
+    series = map_series(data_version, db_path)
+    if len(series) > 100:
+        history_start = pd.Timestamp(series.times[0])
+        df_history = get_series(history_start, resolution=choose_resolution(history_start, now), db_path=db_path)
+        forecast_df = _stored_forecast(series, data_version, db_path)
+        figures.append(("Prévision jusqu’à la fin de l’année", "",
+                        build_forecast_figure(df_history, forecast_df, thresholds)))
+
+    for i, (title, intro, fig) in enumerate(figures):
+        parts.append(f"<h3>{html.escape(title)}</h3>")
+        parts.append(intro)
+        # plotly.js embarqué une seule fois : le fichier reste autonome
+        parts.append(fig.to_html(full_html=False, include_plotlyjs=(i == 0)))
+
+    page = PAGE_TEMPLATE.format(
+        version=version,
+        kpi_style=KPI_STYLE,
+        generated_at=datetime.now().strftime("%d/%m/%Y %H:%M"),
+        body="\n".join(parts),
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(page)
+    os.replace(tmp_path, out_path)
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rapport HTML statique du niveau d'eau")
+    parser.add_argument("--out", default=OUTPUT_PATH)
+    parser.add_argument("--days", type=int, default=3, help="fenêtre du graphique récent")
+    parser.add_argument("--update", action="store_true",
+                        help="mettre à jour la base puis ne régénérer que si les données ont changé")
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+
+    init_db(args.db)
+    if args.update:
+        from update_missing_day import update_db
+        update_db(args.db)
+        if rendered_version(args.out) == snapshot_version(args.db):
+            logger.info(f"{args.out} already up to date")
+            raise SystemExit(0)
+    version = render_snapshot(args.out, args.days, args.db)
+    logger.info(f"Snapshot written to {args.out} (version {version})")
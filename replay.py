@@ -0,0 +1,302 @@
+"""
+Simulateur de rejeu accéléré : de l'ingestion au tableau de bord.
+
+Un historique (base existante ou synthétique) est rejoué dans une base vide à N fois
+le temps réel, par le vrai chemin d'ingestion (insert_measures_for_day) derrière l'API
+de mesures bouchonnée (stubs.py) : à l'instant simulé t, l'API ne connaît que les
+mesures antérieures à t. Après chaque lot, les calculs du tableau de bord sont
+exécutés et chronométrés (KPI, première mesure du jour, climatologie, graphique
+récent, série partagée, profils de variation, couverture).
+
+    python replay.py --days 60                        # historique synthétique, aussi vite que possible
+    python replay.py --source niveau_eau.db --days 30 --speed 3600
+    python replay.py --days 365 --batch-minutes 360 --csv replay.csv
+
+Le rapport donne, par étape, le coût médian et maximal et l'exposant de croissance du
+coût avec le nombre de mesures en base (≈ 0 : proportionnel au lot, ≈ 1 : à
+l'historique), le retard de fraîcheur (heure simulée à laquelle les KPI reflètent une
+mesure, moins l'heure de cette mesure) et un contrôle final des tables incrémentales
+contre un recalcul complet.
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from stubs import install_stubs
+
+from bdd import get_data_version, get_kpi_snapshot, init_db, refresh_kpi_snapshot, refresh_rollups
+from update_missing_day import insert_measures_for_day
+from webapp.data_access import (
+    RESOLUTION_HOURS,
+    choose_resolution,
+    create_threshold_line,
+    get_first_measure_data,
+    get_series,
+    get_threshold_lines,
+)
+from webapp.data_quality import coverage_report, refresh_coverage
+from webapp.figures import build_recent_figure, prepare_daily
+from webapp.forecast import climatology_bands
+from webapp.kpi import load_kpis
+from webapp.patterns import load_profiles, profile_matrix, refresh_patterns
+from webapp.series import map_series, publish_series
+
+DEFAULT_UNIT = "mNGF"
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(funcName)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+
+# --- Historique rejoué ---
+
+def synthetic_history(days, step_minutes=10, end=None):
+    """Seasonal readings over `days` days ending at `end` (same shape as benchmark.build_synthetic_db)."""
+    end = pd.Timestamp(end or pd.Timestamp.now().floor("D"))
+    times = pd.date_range(end=end, periods=days * 24 * 60 // step_minutes, freq=f"{step_minutes}min")
+    doy = times.dayofyear.to_numpy() + times.hour.to_numpy() / 24
+    values = 655 + 5 * np.sin(2 * np.pi * (doy - 60) / 365) + np.random.default_rng(0).normal(0, 0.01, len(times))
+    return pd.DataFrame({"datetime_event": times, "value": values, "unit": DEFAULT_UNIT})
+
+
+def stored_history(source_db, days):
+    """Last `days` days of water_level from an existing database."""
+    with sqlite3.connect(source_db) as conn:
+        last = conn.execute("SELECT MAX(datetime_event) FROM water_level").fetchone()[0]
+        if last is None:
+            raise ValueError(f"{source_db} ne contient aucune mesure")
+        start = (pd.Timestamp(last) - pd.Timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+        df = pd.read_sql_query(
+            "SELECT datetime_event, value, unit FROM water_level WHERE datetime_event > ? ORDER BY datetime_event",
+            conn, params=(start,)
+        )
+    df["datetime_event"] = pd.to_datetime(df["datetime_event"])
+    df["unit"] = df["unit"].fillna(DEFAULT_UNIT)
+    return df
+
+
+class ReplayApi:
+    """
+    Chroniques servies par l'API bouchonnée : celles du jour demandé, antérieures à
+    l'instant simulé `now` (recherche dichotomique dans les mesures triées du jour).
+    """
+
+    def __init__(self, history):
+        self.now = history["datetime_event"].iloc[0]
+        self.days = {}
+        for day, group in history.groupby(history["datetime_event"].dt.strftime("%d-%m-%Y")):
+            self.days[day] = (
+                group["datetime_event"].to_numpy(),
+                [
+                    {"date": day, "heure": t.strftime("%H:%M"), "valeur": f"{v:.4f}", "unite": u}
+                    for t, v, u in zip(group["datetime_event"], group["value"], group["unit"])
+                ],
+            )
+
+    def measures_for_day(self, date_str):
+        times, measures = self.days.get(date_str, (None, []))
+        if times is None:
+            return []
+        return measures[:int(np.searchsorted(times, np.datetime64(self.now), side="right"))]
+
+
+# --- Étapes du tableau de bord ---
+
+def _dashboard_steps(db_path):
+    """(nom, fonction) des calculs exécutés après chaque lot, comme lors d'un affichage."""
+    def kpis():
+        return load_kpis(db_path)
+
+    def daily():
+        return prepare_daily(get_first_measure_data(db_path))
+
+    def climatology():
+        return climatology_bands(prepare_daily(get_first_measure_data(db_path)))
+
+    def recent_chart():
+        end = pd.Timestamp(get_kpi_time(db_path))
+        start = end - pd.Timedelta(days=3)
+        resolution = choose_resolution(start, end)
+        df_window = get_series(start, resolution=resolution, db_path=db_path)
+        return build_recent_figure(df_window, RESOLUTION_HOURS[resolution], get_threshold_lines(db_path))
+
+    def shared_series():
+        return map_series(get_data_version(db_path=db_path)[0], db_path)
+
+    def patterns():
+        return profile_matrix(load_profiles(db_path), "weekday")
+
+    def coverage():
+        # Rapport à l'horloge simulée (dernière mesure rejouée), pas à l'horloge murale
+        now = pd.Timestamp(get_kpi_time(db_path))
+        return coverage_report((now - pd.Timedelta(days=89)).strftime("%Y-%m-%d"), db_path, now=now)
+
+    return [("kpis", kpis), ("daily", daily), ("climatology", climatology),
+            ("recent_chart", recent_chart), ("shared_series", shared_series), ("patterns", patterns),
+            ("coverage", coverage)]
+
+
+def get_kpi_time(db_path):
+    """Datetime of the reading shown by the KPI cards (None before the first reading)."""
+    snapshot = get_kpi_snapshot(db_path=db_path)
+    return snapshot["datetime_event"] if snapshot else None
+
+
+# --- Rejeu ---
+
+def replay(history, db_path, speed=0.0, batch_minutes=60, thresholds=()):
+    """Replay `history` into the empty database, one batch per `batch_minutes`; return one row per batch."""
+    init_db(db_path)
+    for i, value in enumerate(thresholds):
+        create_threshold_line(f"Seuil {i + 1}", value=value, db_path=db_path)
+    api = ReplayApi(history)
+    install_stubs(measures_for_day=api.measures_for_day)
+    steps = _dashboard_steps(db_path)
+
+    sim_start = history["datetime_event"].iloc[0].floor("h")
+    sim_end = history["datetime_event"].iloc[-1]
+    batch = pd.Timedelta(minutes=batch_minutes)
+    wall_start = time.perf_counter()
+    rows = []
+    previous = sim_start
+    sim_now = sim_start + batch
+    while previous < sim_end:
+        if speed:
+            # Attente de l'heure murale correspondant à l'instant simulé
+            due = wall_start + (sim_now - sim_start).total_seconds() / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        api.now = sim_now
+        record = {"sim_time": sim_now}
+
+        # Ingestion : chaque jour touché par le lot (la fin de la veille au passage de minuit)
+        start = time.perf_counter()
+        with sqlite3.connect(db_path) as conn:
+            before = conn.execute("SELECT COUNT(*) FROM water_level").fetchone()[0]
+        for day in pd.date_range(previous.normalize(), sim_now.normalize(), freq="D"):
+            insert_measures_for_day(day.strftime("%d-%m-%Y"), db_path)
+        publish_series(db_path)
+        record["ingest"] = time.perf_counter() - start
+        with sqlite3.connect(db_path) as conn:
+            record["rows"] = conn.execute("SELECT COUNT(*) FROM water_level").fetchone()[0]
+        record["batch_rows"] = record["rows"] - before
+
+        for name, step in steps:
+            start = time.perf_counter()
+            step()
+            record[name] = time.perf_counter() - start
+
+        # Fraîcheur : instant simulé où les KPI sont à jour, moins la mesure qu'ils montrent
+        latest = get_kpi_time(db_path)
+        seen_at = sim_start + pd.Timedelta(seconds=(time.perf_counter() - wall_start) * speed) if speed else sim_now
+        record["lag_minutes"] = (max(seen_at, sim_now) - pd.Timestamp(latest)).total_seconds() / 60 \
+            if latest else np.nan
+        rows.append(record)
+        previous, sim_now = sim_now, sim_now + batch
+    return pd.DataFrame(rows)
+
+
+def growth_exponent(costs, rows):
+    """Slope of log(cost) against log(rows): about 0 for a constant cost per batch, 1 if proportional to history."""
+    mask = (rows > 0) & (costs > 0)
+    if mask.sum() < 4 or rows[mask].max() < 2 * rows[mask].min():
+        return np.nan
+    return float(np.polyfit(np.log(rows[mask]), np.log(costs[mask]), 1)[0])
+
+
+def verify_incremental(db_path):
+    """Compare incrementally maintained tables with a full recomputation; return the diverging ones."""
+    tables = {
+        "water_level_rollup": "SELECT resolution, bucket_start, value_mean, value_min, value_max, n_samples "
+                              "FROM water_level_rollup ORDER BY resolution, bucket_start",
+        "daily_coverage": "SELECT date_event, n_samples, first_reading, last_reading, max_gap_minutes, "
+                          "hours_covered, completeness_pct, out_of_order, n_quarantined, units "
+                          "FROM daily_coverage ORDER BY date_event",
+        "kpi_snapshot": "SELECT * FROM kpi_snapshot",
+        "rate_profile": "SELECT * FROM rate_profile ORDER BY month, weekday, hour",
+    }
+
+    def read():
+        with sqlite3.connect(db_path) as conn:
+            frames = {name: pd.read_sql_query(query, conn) for name, query in tables.items()}
+        frames["kpi_snapshot"] = frames["kpi_snapshot"].drop(columns=["updated_at"])
+        return frames
+
+    incremental = read()
+    refresh_rollups(db_path=db_path)
+    refresh_coverage(db_path=db_path)
+    refresh_kpi_snapshot(db_path=db_path)
+    refresh_patterns(since="0000-01-01 00:00:00", db_path=db_path)
+    rebuilt = read()
+    mismatches = []
+    for name in tables:
+        try:
+            pd.testing.assert_frame_equal(incremental[name], rebuilt[name], check_exact=False, rtol=1e-9)
+        except AssertionError:
+            mismatches.append(name)
+    return mismatches
+
+
+def summarize(report, speed):
+    """Print per-step costs and growth, freshness lag and throughput."""
+    step_names = ["ingest"] + [c for c in report.columns if c not in
+                               ("sim_time", "ingest", "rows", "batch_rows", "lag_minutes")]
+    rows = report["rows"].to_numpy(dtype=float)
+    print(f"{len(report)} batches, {int(rows[-1])} readings replayed, "
+          f"{report['batch_rows'].median():.0f} readings per batch")
+    print(f"{'step':>14} {'p50_ms':>8} {'p95_ms':>8} {'max_ms':>8} {'growth':>7}")
+    for name in step_names:
+        costs = report[name].to_numpy(dtype=float) * 1000
+        exponent = growth_exponent(costs, rows)
+        flag = "  <- scales with history" if exponent > 0.5 else ""
+        print(f"{name:>14} {np.median(costs):>8.1f} {np.percentile(costs, 95):>8.1f} {costs.max():>8.1f} "
+              f"{exponent:>7.2f}{flag}")
+    total = report[step_names].sum(axis=1)
+    lag = report["lag_minutes"].dropna()
+    print(f"end-to-end per batch: p50 {total.median() * 1000:.0f} ms, max {total.max() * 1000:.0f} ms; "
+          f"ingestion {report['batch_rows'].sum() / report['ingest'].sum():,.0f} readings/s")
+    if not lag.empty:
+        print(f"freshness lag ({'x' + format(speed, 'g') if speed else 'no wall clock'}): "
+              f"p50 {lag.median():.0f} min, p95 {lag.quantile(0.95):.0f} min, max {lag.max():.0f} min (simulated)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rejeu accéléré de l'ingestion et du tableau de bord")
+    parser.add_argument("--source", default=None, help="base à rejouer (historique synthétique par défaut)")
+    parser.add_argument("--days", type=int, default=30, help="jours d'historique rejoués")
+    parser.add_argument("--speed", type=float, default=0.0, help="facteur d'accélération (0 : sans attente)")
+    parser.add_argument("--batch-minutes", type=int, default=60, help="intervalle simulé entre deux ingestions")
+    parser.add_argument("--threshold", type=float, nargs="*", default=[652.0, 658.0])
+    parser.add_argument("--csv", default=None, help="écrire le détail par lot dans ce fichier")
+    args = parser.parse_args()
+
+    os.environ.setdefault("FORECAST_MODEL", "climatology")
+    # Une ligne de journal par jour inséré : seul le rapport final est affiché
+    logging.getLogger("update_missing_day").setLevel(logging.WARNING)
+    history = stored_history(args.source, args.days) if args.source else synthetic_history(args.days)
+    logger.info(f"Replaying {len(history)} readings from {history['datetime_event'].iloc[0]} "
+                f"to {history['datetime_event'].iloc[-1]}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "replay.db")
+        report = replay(history, db_path, args.speed, args.batch_minutes, args.threshold)
+        if args.csv:
+            report.to_csv(args.csv, index=False)
+        summarize(report, args.speed)
+        mismatches = verify_incremental(db_path)
+        if mismatches:
+            logger.error(f"Incremental tables differ from a full recomputation: {', '.join(mismatches)}")
+            raise SystemExit(1)
+        logger.info("Incremental tables match a full recomputation")
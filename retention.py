@@ -0,0 +1,225 @@
+"""
+Rétention des mesures brutes anciennes.
+
+Au-delà de RETENTION_YEARS ans, water_level ne garde que la première mesure de chaque
+heure (la première mesure du jour reste donc inchangée). La moyenne, le min et le max
+horaires restent disponibles dans water_level_rollup, calculés sur les mesures complètes
+puis figés sous le filigrane de compactage (table compaction_watermark).
+
+Le compactage avance par lots de jours, un lot par transaction, avec contrôle de la
+première mesure de chaque jour avant validation, puis PRAGMA incremental_vacuum.
+
+    python retention.py                          # aperçu, aucune modification
+    python retention.py --apply                  # compactage + vérification
+    python retention.py --apply --vacuum full    # VACUUM complet à la fin
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+from bdd import (
+    KPI_SNAPSHOT_OFFSETS,
+    bump_data_version,
+    get_compaction_watermark,
+    get_first_measure_data,
+    get_kpi_snapshot,
+    init_db,
+    refresh_kpi_snapshot,
+    refresh_rollups,
+    suspend_version_triggers,
+)
+from webapp.data_quality import refresh_coverage
+
+DB_PATH = "niveau_eau.db"
+RETENTION_YEARS = int(os.getenv("RETENTION_YEARS", "5"))
+BATCH_DAYS = 30
+# Les KPI comparent la dernière mesure aux mesures brutes d'il y a 3 ans au plus
+MIN_RETENTION_DAYS = max(KPI_SNAPSHOT_OFFSETS.values()) + 31
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(funcName)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+
+def retention_cutoff(years=RETENTION_YEARS, now=None):
+    """First day ('YYYY-MM-DD') whose raw readings are kept in full."""
+    if years * 365 < MIN_RETENTION_DAYS:
+        raise ValueError(f"Rétention trop courte : au moins {MIN_RETENTION_DAYS} jours pour préserver les KPI")
+    now = now or datetime.now()
+    return (now - timedelta(days=round(years * 365.25))).strftime("%Y-%m-%d")
+
+
+def _first_hour_readings(where):
+    """Sub-query selecting the first reading of each hour in the `where` range."""
+    return f"""
+        SELECT MIN(datetime_event) FROM water_level
+        WHERE {where}
+        GROUP BY strftime('%Y-%m-%d %H', datetime_event)
+    """
+
+
+def plan_compaction(cutoff, db_path=DB_PATH):
+    """Return (start, cutoff, readings to remove) without modifying the database."""
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(date_event) FROM water_level")
+        first_day = cursor.fetchone()[0]
+        start = get_compaction_watermark(db_path) or f"{first_day} 00:00:00"
+        end = f"{cutoff} 00:00:00"
+        if first_day is None or start >= end:
+            return start, end, 0
+        where = "datetime_event >= ? AND datetime_event < ?"
+        cursor.execute(f"""
+            SELECT (SELECT COUNT(*) FROM water_level WHERE {where})
+                 - (SELECT COUNT(*) FROM ({_first_hour_readings(where)}))
+        """, (start, end, start, end))
+        return start, end, cursor.fetchone()[0]
+
+
+def _daily_first(cursor, start, end):
+    cursor.execute("""
+        SELECT date_event, value FROM water_level
+        WHERE datetime_event IN (
+            SELECT MIN(datetime_event) FROM water_level
+            WHERE datetime_event >= ? AND datetime_event < ?
+            GROUP BY date_event
+        )
+        ORDER BY datetime_event
+    """, (start, end))
+    return cursor.fetchall()
+
+
+def compact_readings(cutoff, batch_days=BATCH_DAYS, vacuum="incremental", db_path=DB_PATH):
+    """Compact readings older than `cutoff` to the first reading of each hour; return how many were removed."""
+    start, end, _ = plan_compaction(cutoff, db_path)
+    if start >= end:
+        logger.info(f"Nothing to compact before {cutoff}")
+        return 0
+
+    removed = 0
+    where = "datetime_event >= ? AND datetime_event < ?"
+    batch_start = datetime.strptime(start[:10], "%Y-%m-%d")
+    last = datetime.strptime(cutoff, "%Y-%m-%d")
+    while batch_start < last:
+        batch_end = min(batch_start + timedelta(days=batch_days), last)
+        lo, hi = batch_start.strftime("%Y-%m-%d 00:00:00"), batch_end.strftime("%Y-%m-%d 00:00:00")
+
+        # Agrégats et couverture calculés sur les mesures complètes avant d'être figés
+        last_day = (batch_end - timedelta(days=1)).strftime("%Y-%m-%d")
+        refresh_rollups(lo[:10], last_day, db_path)
+        refresh_coverage(lo[:10], last_day, db_path)
+        with sqlite3.connect(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            before = _daily_first(cursor, lo, hi)
+            # Triggers de version suspendus pendant la suppression : une seule version par lot
+            triggers = suspend_version_triggers(cursor)
+            cursor.execute(f"""
+                DELETE FROM water_level
+                WHERE {where} AND datetime_event NOT IN ({_first_hour_readings(where)})
+            """, (lo, hi, lo, hi))
+            batch_removed = cursor.rowcount
+            for sql in triggers:
+                cursor.execute(sql)
+            if _daily_first(cursor, lo, hi) != before:
+                conn.rollback()
+                raise RuntimeError(f"Première mesure du jour modifiée entre {lo} et {hi}, lot annulé")
+            if batch_removed:
+                bump_data_version(cursor)
+            cursor.execute("""
+                INSERT OR REPLACE INTO compaction_watermark (name, compacted_before, updated_at)
+                VALUES ('water_level', ?, CURRENT_TIMESTAMP)
+            """, (hi,))
+            conn.commit()
+        removed += batch_removed
+        logger.info(f"{lo[:10]} -> {hi[:10]}: {batch_removed} readings removed")
+        if vacuum == "incremental":
+            incremental_vacuum(db_path)
+        batch_start = batch_end
+
+    if vacuum == "full":
+        full_vacuum(db_path)
+    refresh_kpi_snapshot(db_path=db_path)
+    return removed
+
+
+def incremental_vacuum(db_path=DB_PATH):
+    """Return free pages to the file system, switching the database to incremental auto_vacuum once."""
+    with sqlite3.connect(db_path) as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            logger.info("Switching database to incremental auto_vacuum (one-time VACUUM)")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        # executescript exécute le pragma jusqu'au bout (execute ne libère qu'une page)
+        conn.executescript("PRAGMA incremental_vacuum;")
+
+
+def full_vacuum(db_path=DB_PATH):
+    """Rebuild the database file (slower, defragments the tables)."""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+def capture_summaries(db_path=DB_PATH):
+    """Daily first readings and current KPIs, compared before and after compaction."""
+    return get_first_measure_data(db_path), get_kpi_snapshot(db_path=db_path)
+
+
+def verify_summaries(before, after):
+    """Return the differences between two capture_summaries results (empty if identical)."""
+    (daily_before, kpis_before), (daily_after, kpis_after) = before, after
+    problems = []
+    if not daily_before.equals(daily_after):
+        merged = daily_before.merge(daily_after, on="date", how="outer", suffixes=("_before", "_after"))
+        changed = merged[merged["value_before"].ne(merged["value_after"])]
+        problems.append(f"{len(changed)} daily first readings changed")
+    if kpis_before is not None and kpis_after is not None:
+        for key in ["datetime_event", "value", *KPI_SNAPSHOT_OFFSETS]:
+            if kpis_before[key] != kpis_after[key]:
+                problems.append(f"KPI {key}: {kpis_before[key]} -> {kpis_after[key]}")
+    elif (kpis_before is None) != (kpis_after is None):
+        problems.append("KPI snapshot appeared or disappeared")
+    return problems
+
+
+def database_size(db_path=DB_PATH):
+    return os.path.getsize(db_path) / 2**20
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rétention et compactage des mesures anciennes")
+    parser.add_argument("--years", type=float, default=RETENTION_YEARS,
+                        help="années de mesures brutes conservées intégralement")
+    parser.add_argument("--apply", action="store_true", help="compacter (sinon aperçu)")
+    parser.add_argument("--batch-days", type=int, default=BATCH_DAYS)
+    parser.add_argument("--vacuum", choices=["incremental", "full", "none"], default="incremental")
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+
+    init_db(args.db)
+    try:
+        cutoff = retention_cutoff(args.years)
+    except ValueError as e:
+        parser.error(str(e))
+    start, end, removable = plan_compaction(cutoff, args.db)
+    logger.info(f"{removable} readings to remove between {start[:10]} and {end[:10]} "
+                f"(database {database_size(args.db):.1f} MB)")
+
+    if args.apply and removable:
+        before = capture_summaries(args.db)
+        removed = compact_readings(cutoff, args.batch_days, args.vacuum, args.db)
+        problems = verify_summaries(before, capture_summaries(args.db))
+        logger.info(f"{removed} readings removed (database {database_size(args.db):.1f} MB)")
+        if problems:
+            for problem in problems:
+                logger.error(problem)
+            raise SystemExit(1)
+        logger.info("Verification OK: daily first readings and KPIs unchanged")
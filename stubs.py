@@ -0,0 +1,96 @@
+"""
+Bouchons locaux de l'API data.niv-eau.fr et d'OpenAI, pour exécuter app.py hors ligne
+(tests de charge, rejeu) sans appel réseau ni coût.
+
+    import stubs
+    stubs.install_stubs()
+"""
+
+import os
+import time
+import types
+
+import requests
+
+# webapp.llm crée le client OpenAI à l'import : une clé factice suffit, le client est remplacé
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+import webapp.llm  # noqa: E402
+
+STUB_COMMENT = "Niveau stable, aucune action nécessaire sur le bateau."
+
+
+class StubApiResponse:
+    """Réponse de l'API de mesures : aucune nouvelle chronique par défaut."""
+
+    def __init__(self, measures=None, status_code=200):
+        self.status_code = status_code
+        self._measures = measures or []
+
+    def json(self):
+        return {"chroniques": self._measures}
+
+
+class StubStream:
+    """Flux de réponse (stream=True) : un mot par fragment, puis un fragment de consommation."""
+
+    def __init__(self, words, usage, token_delay=0.0):
+        self.words = words
+        self.usage = usage
+        self.token_delay = token_delay
+        self.closed = False
+
+    def __iter__(self):
+        for i, word in enumerate(self.words):
+            if self.closed:
+                return
+            time.sleep(self.token_delay)
+            delta = types.SimpleNamespace(content=word if i == 0 else " " + word)
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)], usage=None)
+        yield types.SimpleNamespace(choices=[], usage=self.usage)
+
+    def close(self):
+        self.closed = True
+
+
+class StubCompletions:
+    """
+    chat.completions de remplacement : réponse fixe et consommation de jetons fictive.
+    token_delay (secondes par mot) simule une réponse lente en mode stream.
+    """
+
+    def __init__(self, content=STUB_COMMENT, token_delay=0.0):
+        self.content = content
+        self.token_delay = token_delay
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        prompt_tokens = sum(len(m["content"].split()) for m in kwargs.get("messages", []))
+        completion_tokens = len(self.content.split())
+        usage = types.SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        )
+        if kwargs.get("stream"):
+            return StubStream(self.content.split(), usage, self.token_delay)
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=self.content))],
+            usage=usage,
+        )
+
+
+def install_stubs(measures_for_day=None, comment=STUB_COMMENT, token_delay=0.0):
+    """
+    Remplace requests.get (API de mesures) et le client OpenAI de webapp.llm.
+    measures_for_day(date_str) -> liste de chroniques {date, heure, valeur, unite} (vide par défaut).
+    Renvoie le bouchon OpenAI (compteur d'appels).
+    """
+    def fake_get(url, *args, **kwargs):
+        date_str = url.rstrip("/").rsplit("/", 1)[-1]
+        return StubApiResponse(measures_for_day(date_str) if measures_for_day else [])
+
+    requests.get = fake_get
+    completions = StubCompletions(comment, token_delay)
+    webapp.llm.client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+    return completions
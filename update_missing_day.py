@@ -6,7 +6,24 @@ import logging
 import yaml
 import pandas as pd
 from datetime import datetime, timedelta
-from bdd import init_db, add_measure, get_first_measure_data
+from bdd import (
+    init_db,
+    add_measure,
+    record_exists,
+    quarantine_exists,
+    quarantine_measure,
+    release_quarantine,
+    get_first_measure_data,
+    refresh_rollups,
+    refresh_kpi_snapshot,
+    ensure_rollups,
+)
+from outlier_filter import build_filter
+from webapp.crossings import update_threshold_events
+from webapp.data_quality import ensure_coverage, refresh_coverage
+from webapp.patterns import refresh_patterns
+from webapp.profiling import PROFILE_RUNS, profile_run
+from webapp.series import publish_series
 
 DB_PATH = "niveau_eau.db"
 IGNORE_DATES_FILE = "ignore_dates.yaml"
@@ -42,7 +59,11 @@ def get_missing_days(db_path=DB_PATH, start_date="2021-07-07"):
           WHERE date < date('now')
         )
         SELECT date FROM all_dates
-        WHERE date NOT IN (SELECT DISTINCT date_event FROM water_level);
+        WHERE date NOT IN (
+            SELECT DISTINCT date_event FROM water_level
+            UNION
+            SELECT DISTINCT date_event FROM water_level_quarantine
+        );
         """
         cur.execute(query)
         missing = cur.fetchall()
@@ -68,14 +89,67 @@ def insert_measures_for_day(date_str, db_path=DB_PATH):
             logger.info(f"No measures for {date_str}.")
             return
 
-        new_records = 0
+        # Ordre chronologique pour le filtre d'aberrations en flux
+        parsed = []
         for m in measures:
             try:
-                if add_measure(m["date"], m["heure"], m["valeur"], m["unite"], db_path):
+                parsed.append((datetime.strptime(f"{m['date']} {m['heure']}", "%d-%m-%Y %H:%M"), m))
+            except Exception as e:
+                logger.error(f"Error parsing date/time on {date_str} with {m}: {e}")
+        parsed.sort(key=lambda p: p[0])
+        if not parsed:
+            return
+        outlier_filter = build_filter(parsed[0][0].strftime("%Y-%m-%d %H:%M:%S"), db_path)
+
+        new_records = released_records = 0
+        quarantined = set()  # mises en quarantaine par cette exécution et toujours en quarantaine
+        first_changed = parsed[0][0]
+        for dt, m in parsed:
+            try:
+                value = float(m["valeur"])
+                if record_exists(m["date"], m["heure"], db_path):
+                    outlier_filter.accept(dt, value)
+                    continue
+                in_quarantine = quarantine_exists(m["date"], m["heure"], db_path)
+                if in_quarantine:
+                    # Déjà écartée : compte parmi les rejets consécutifs
+                    outlier_filter.reject(dt, value)
+                    reason = None
+                else:
+                    reason = outlier_filter.check(dt, value)
+                released = outlier_filter.pop_released()
+                if released:
+                    # Changement de niveau réel : les mesures écartées depuis la dernière valide sont rétablies
+                    moved = release_quarantine(released[0][0].strftime("%Y-%m-%d %H:%M:%S"),
+                                               released[-1][0].strftime("%Y-%m-%d %H:%M:%S"), db_path)
+                    new_records += moved
+                    released_records += moved
+                    quarantined.difference_update(released_dt for released_dt, _ in released)
+                    first_changed = min(first_changed, released[0][0])
+                if in_quarantine:
+                    continue
+                if reason is not None:
+                    quarantine_measure(m["date"], m["heure"], value, m["unite"], reason, db_path)
+                    quarantined.add(dt)
+                elif add_measure(m["date"], m["heure"], value, m["unite"], db_path):
                     new_records += 1
             except Exception as e:
                 logger.error(f"Insertion error on {date_str} with {m}: {e}")
         logger.info(f"{new_records} new records for {date_str}")
+        if released_records:
+            logger.warning(f"{released_records} readings released from quarantine for {date_str} (level step)")
+        if quarantined:
+            logger.warning(f"{len(quarantined)} suspect readings quarantined for {date_str}")
+        day_iso = datetime.strptime(date_str, "%d-%m-%Y").strftime("%Y-%m-%d")
+        # Mesures rétablies : la veille peut aussi être touchée
+        first_iso = min(day_iso, first_changed.strftime("%Y-%m-%d"))
+        if new_records:
+            refresh_rollups(first_iso, day_iso, db_path)
+            refresh_kpi_snapshot(db_path=db_path)
+            update_threshold_events(since=f"{first_iso} 00:00:00", db_path=db_path)
+            refresh_patterns(since=f"{first_iso} 00:00:00", db_path=db_path)
+        if new_records or quarantined:
+            refresh_coverage(first_iso, day_iso, db_path)
     else:
         logger.error(f"API error {response.status_code} for {date_str}")
 
@@ -107,7 +181,15 @@ def update_missing_days(db_path=DB_PATH, start_date="2021-07-07"):
         else:
             logger.info("Last recorded day is current day or ignored.")
 
-def update_db(db_path=DB_PATH):
-    """Initialize and update the database."""
-    init_db(db_path)
-    update_missing_days(db_path)
\ No newline at end of file
+def update_db(db_path=DB_PATH, profile=PROFILE_RUNS):
+    """Initialize and update the database, profiled if `profile` is set."""
+    with profile_run("update_db", enabled=profile):
+        init_db(db_path)
+        ensure_rollups(db_path)
+        ensure_coverage(db_path)
+        refresh_patterns(db_path=db_path)  # premier calcul des profils sur une base existante
+        update_missing_days(db_path)
+        # Prend en compte les seuils ajoutés, modifiés ou supprimés depuis la dernière analyse
+        update_threshold_events(db_path=db_path)
+        # Série projetée en mémoire par les processus du tableau de bord (cf. webapp/series.py)
+        publish_series(db_path)
\ No newline at end of file
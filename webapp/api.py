@@ -0,0 +1,231 @@
+# water_level/webapp/api.py
+"""
+API HTTP locale en lecture seule (JSON) pour les outils internes et l'affichage mural.
+
+    python -m webapp.api --port 8502
+
+Routes :
+    /kpis                     KPI courants (table kpi_snapshot)
+    /series?days=3            série des 3 derniers jours mesurés (ou start=/end=, resolution=auto|raw|1h|6h|1d)
+    /daily                    première mesure de chaque jour
+    /thresholds               lignes de seuil actives
+    /forecast                 dernière prévision stockée
+
+Chaque réponse porte un ETag et un Last-Modified dérivés du registre `data_version`
+(mesures, seuils et prévision enregistrée) : un client qui renvoie If-None-Match /
+If-Modified-Since obtient un 304 sans recalcul.
+"""
+
+import argparse
+import json
+import logging
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+
+from bdd import get_data_version, get_kpi_snapshot, get_latest_forecast
+from webapp.data_access import (
+    RESOLUTION_HOURS,
+    get_first_measure_data,
+    get_series,
+    get_threshold_lines,
+    choose_resolution,
+)
+from webapp.kpi import load_kpis
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(funcName)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+DB_PATH = "niveau_eau.db"
+CACHE_MAX_ENTRIES = 64  # réponses sérialisées conservées (toutes requêtes confondues)
+
+
+class BadRequest(ValueError):
+    """Invalid query parameter (400 response)."""
+
+
+def _timestamp_param(params, name):
+    try:
+        return pd.Timestamp(params[name][0])
+    except (TypeError, ValueError, OverflowError):
+        raise BadRequest(f"invalid {name}: expected an ISO date") from None
+
+
+def _frame_records(df):
+    """DataFrame -> list of dicts with ISO dates."""
+    return json.loads(df.to_json(orient="records", date_format="iso"))
+
+
+def _kpis(params, db_path):
+    return load_kpis(db_path)
+
+
+def _series(params, db_path):
+    if "end" in params:
+        end = _timestamp_param(params, "end")
+    else:
+        # Fenêtre relative ancrée sur la dernière mesure : la réponse ne dépend que de la version
+        snapshot = get_kpi_snapshot(db_path=db_path)
+        end = pd.Timestamp(snapshot["datetime_event"]) if snapshot else pd.Timestamp.now()
+    if "start" in params:
+        start = _timestamp_param(params, "start")
+    else:
+        try:
+            days = float(params.get("days", ["3"])[0])
+        except ValueError:
+            days = math.nan
+        if not 0 < days <= 36600:
+            raise BadRequest("invalid days: expected a number of days between 0 and 36600")
+        start = end - pd.Timedelta(days=days)
+    if pd.isna(start) or pd.isna(end) or start > end:
+        raise BadRequest("invalid window: start must precede end")
+    resolution = params.get("resolution", ["auto"])[0]
+    if resolution != "auto" and resolution not in RESOLUTION_HOURS:
+        raise BadRequest(f"invalid resolution: expected auto, {', '.join(RESOLUTION_HOURS)}")
+    if resolution == "auto":
+        resolution = choose_resolution(start, end)
+    df = get_series(start, end, resolution=resolution, db_path=db_path)
+    return {"resolution": resolution, "points": _frame_records(df)}
+
+
+def _daily(params, db_path):
+    return _frame_records(get_first_measure_data(db_path))
+
+
+def _thresholds(params, db_path):
+    return _frame_records(get_threshold_lines(db_path))
+
+
+def _forecast(params, db_path):
+    df, version, model = get_latest_forecast(db_path)
+    return {"data_version": version, "model": model, "points": _frame_records(df)}
+
+
+ROUTES = {
+    "/kpis": _kpis,
+    "/series": _series,
+    "/daily": _daily,
+    "/thresholds": _thresholds,
+    "/forecast": _forecast,
+}
+
+
+class WaterLevelAPIHandler(BaseHTTPRequestHandler):
+    """Serve ROUTES as JSON with conditional GET support."""
+
+    db_path = DB_PATH
+    # LRU des réponses sérialisées, clé (chemin, requête, etag) ; purgé à chaque changement de version
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def _validators(self):
+        wl_version, wl_updated = get_data_version("water_level", self.db_path)
+        th_version, th_updated = get_data_version("threshold_line", self.db_path)
+        fc_version, fc_updated = get_data_version("forecast", self.db_path)
+        etag = f'"{wl_version}-{th_version}-{fc_version}"'
+        stamps = [
+            datetime.strptime(u, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+            for u in (wl_updated, th_updated, fc_updated) if u
+        ]
+        last_modified = max(stamps) if stamps else datetime.now(timezone.utc)
+        return etag, last_modified
+
+    def _not_modified(self, etag, last_modified):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*"
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        route = ROUTES.get(url.path.rstrip("/") or "/")
+        if route is None:
+            self._send(404, json.dumps({"error": f"unknown route {url.path}"}).encode())
+            return
+
+        etag, last_modified = self._validators()
+        headers = {
+            "ETag": etag,
+            "Last-Modified": format_datetime(last_modified, usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+        if self._not_modified(etag, last_modified):
+            self._send(304, None, headers)
+            return
+
+        key = (url.path, url.query, etag)
+        with self._cache_lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+        if body is None:
+            try:
+                payload = route(parse_qs(url.query), self.db_path)
+            except BadRequest as e:
+                self._send(400, json.dumps({"error": str(e)}).encode())
+                return
+            except Exception as e:
+                logger.error(f"Error on {self.path}: {e}")
+                self._send(500, json.dumps({"error": "internal error"}).encode())
+                return
+            body = json.dumps(payload, default=str).encode()
+            with self._cache_lock:
+                for k in [k for k in self._cache if k[2] != etag]:
+                    del self._cache[k]
+                self._cache[key] = body
+                while len(self._cache) > CACHE_MAX_ENTRIES:
+                    self._cache.popitem(last=False)
+        self._send(200, body, headers)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def serve(host="127.0.0.1", port=8502, db_path=DB_PATH):
+    """Start the API server (blocking)."""
+    WaterLevelAPIHandler.db_path = db_path
+    server = ThreadingHTTPServer((host, port), WaterLevelAPIHandler)
+    logger.info(f"Serving water level API on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API JSON locale du niveau d'eau")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.db)
@@ -0,0 +1,236 @@
+"""
+Détection des franchissements de seuils et estimation du temps restant avant un seuil.
+
+Les franchissements sont stockés dans `threshold_event` et mis à jour de façon
+incrémentale : seul l'historique postérieur au dernier point analysé
+(`threshold_scan_state`) est relu à chaque insertion.
+"""
+
+import sqlite3
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(funcName)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+DB_PATH = "niveau_eau.db"
+
+
+def _hours_between(start, end):
+    return (pd.Timestamp(end) - pd.Timestamp(start)).total_seconds() / 3600
+
+
+def _rewind(cursor, threshold_id, since):
+    """Forget events from `since` onward and restart the scan from the last reading before it."""
+    cursor.execute(
+        "DELETE FROM threshold_event WHERE threshold_id = ? AND crossed_at >= ?",
+        (threshold_id, since)
+    )
+    cursor.execute(
+        """
+        UPDATE threshold_event
+        SET ended_at = NULL, duration_hours = NULL
+        WHERE threshold_id = ? AND ended_at >= ?
+        """,
+        (threshold_id, since)
+    )
+    cursor.execute(
+        """
+        SELECT datetime_event, value FROM water_level
+        WHERE datetime_event < ?
+        ORDER BY datetime_event DESC LIMIT 1
+        """,
+        (since,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute("DELETE FROM threshold_scan_state WHERE threshold_id = ?", (threshold_id,))
+    else:
+        cursor.execute(
+            """
+            UPDATE threshold_scan_state
+            SET last_datetime = ?,
+                is_above = (threshold_value <= ?)
+            WHERE threshold_id = ?
+            """,
+            (row[0], row[1], threshold_id)
+        )
+
+
+def update_threshold_events(since=None, db_path=DB_PATH):
+    """
+    Scan new readings for crossings of every active threshold, from `since` if given.
+    Deleted or changed thresholds are rescanned from the start.
+    """
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, value FROM threshold_line WHERE is_deleted = 0")
+        thresholds = dict(cursor.fetchall())
+
+        # Nettoyage des seuils supprimés ou modifiés
+        cursor.execute("SELECT threshold_id, threshold_value FROM threshold_scan_state")
+        for threshold_id, scanned_value in cursor.fetchall():
+            if thresholds.get(threshold_id) != scanned_value:
+                cursor.execute("DELETE FROM threshold_event WHERE threshold_id = ?", (threshold_id,))
+                cursor.execute("DELETE FROM threshold_scan_state WHERE threshold_id = ?", (threshold_id,))
+        cursor.execute(
+            "DELETE FROM threshold_event WHERE threshold_id NOT IN (SELECT id FROM threshold_line WHERE is_deleted = 0)"
+        )
+        if not thresholds:
+            conn.commit()
+            return 0
+
+        if since is not None:
+            cursor.execute(
+                "SELECT threshold_id FROM threshold_scan_state WHERE last_datetime >= ?", (since,)
+            )
+            for (threshold_id,) in cursor.fetchall():
+                _rewind(cursor, threshold_id, since)
+
+        cursor.execute("SELECT threshold_id, last_datetime, is_above FROM threshold_scan_state")
+        states = {row[0]: (row[1], bool(row[2])) for row in cursor.fetchall()}
+
+        # Une seule lecture, à partir du plus ancien point restant à analyser
+        pending = [states[t][0] if t in states else None for t in thresholds]
+        start = None if None in pending else min(pending)
+        cursor.execute(
+            """
+            SELECT datetime_event, value FROM water_level
+            WHERE datetime_event > ?
+            ORDER BY datetime_event ASC
+            """,
+            (start or "",)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            conn.commit()
+            return 0
+        times = np.array([r[0] for r in rows], dtype="datetime64[s]")
+        values = np.array([r[1] for r in rows], dtype=float)
+
+        n_events = 0
+        for threshold_id, threshold_value in thresholds.items():
+            last_datetime, was_above = states.get(threshold_id, (None, None))
+            offset = 0 if last_datetime is None else int(
+                np.searchsorted(times, np.datetime64(last_datetime.replace(" ", "T")), side="right")
+            )
+            t, above = times[offset:], values[offset:] >= threshold_value
+            if len(t) == 0:
+                continue
+
+            if was_above is None:
+                # Premier passage : l'état initial n'est pas un franchissement
+                was_above = bool(above[0])
+            sides = np.concatenate(([was_above], above))
+            change_idx = np.flatnonzero(sides[1:] != sides[:-1])
+            crossed = [str(x).replace("T", " ") for x in t[change_idx]]
+
+            if crossed:
+                # Clôture de l'épisode en cours par le premier nouveau franchissement
+                cursor.execute(
+                    """
+                    SELECT id, crossed_at FROM threshold_event
+                    WHERE threshold_id = ? AND ended_at IS NULL
+                    """,
+                    (threshold_id,)
+                )
+                for event_id, crossed_at in cursor.fetchall():
+                    cursor.execute(
+                        "UPDATE threshold_event SET ended_at = ?, duration_hours = ? WHERE id = ?",
+                        (crossed[0], _hours_between(crossed_at, crossed[0]), event_id)
+                    )
+                ends = crossed[1:] + [None]
+                cursor.executemany(
+                    """
+                    INSERT OR REPLACE INTO threshold_event
+                        (threshold_id, threshold_value, direction, crossed_at, ended_at, duration_hours)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (threshold_id, threshold_value, "up" if above[i] else "down", start_at, end_at,
+                         _hours_between(start_at, end_at) if end_at else None)
+                        for i, start_at, end_at in zip(change_idx, crossed, ends)
+                    ]
+                )
+                n_events += len(crossed)
+
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO threshold_scan_state
+                    (threshold_id, threshold_value, last_datetime, is_above)
+                VALUES (?, ?, ?, ?)
+                """,
+                (threshold_id, threshold_value, str(t[-1]).replace("T", " "), int(above[-1]))
+            )
+        conn.commit()
+    logger.info(f"{n_events} new threshold crossings")
+    return n_events
+
+
+def get_threshold_events(limit=20, db_path=DB_PATH):
+    """Return the most recent crossings with the threshold name, newest first."""
+    with sqlite3.connect(db_path) as conn:
+        query = """
+        SELECT e.threshold_id,
+               t.name,
+               e.threshold_value,
+               e.direction,
+               e.crossed_at,
+               e.ended_at,
+               e.duration_hours
+        FROM threshold_event e
+        JOIN threshold_line t ON t.id = e.threshold_id
+        WHERE t.is_deleted = 0
+        ORDER BY e.crossed_at DESC
+        LIMIT ?
+        """
+        return pd.read_sql_query(query, conn, params=(limit,),
+                                 parse_dates=["crossed_at", "ended_at"])
+
+
+def estimate_time_to_thresholds(kpis, thresholds, forecast_df=None, now=None):
+    """
+    Estimate when the level reaches each threshold, from the 7-day trend and the stored forecast.
+    Return dicts (name, value, gap, trend_days, forecast_date).
+    """
+    level, trend = kpis.get("kpi_level"), kpis.get("kpi_7j")
+    if level is None:
+        return []
+    now = pd.Timestamp(now or pd.Timestamp.now())
+    if forecast_df is not None and not forecast_df.empty:
+        future = forecast_df[forecast_df["ds"] > now]
+        ds, yhat = future["ds"].to_numpy(), future["yhat"].to_numpy()
+    else:
+        ds, yhat = np.array([], dtype="datetime64[ns]"), np.array([])
+
+    estimates = []
+    for th in thresholds.itertuples():
+        gap = th.value - level
+        trend_days = gap / trend if trend and gap * trend > 0 else None
+        beyond = np.flatnonzero((yhat - th.value) * np.sign(gap) >= 0) if gap else np.array([])
+        forecast_date = pd.Timestamp(ds[beyond[0]]) if len(beyond) else None
+        estimates.append({
+            "name": th.name,
+            "value": th.value,
+            "gap": gap,
+            "trend_days": trend_days,
+            "forecast_date": forecast_date,
+        })
+    return estimates
+
+
+def describe_time_to_threshold(estimate):
+    """Short French description of an estimate from estimate_time_to_thresholds."""
+    parts = []
+    if estimate["trend_days"] is not None:
+        parts.append(f"≈ {estimate['trend_days']:.0f} j selon la tendance 7 jours")
+    if estimate["forecast_date"] is not None:
+        parts.append(f"vers le {estimate['forecast_date']:%d/%m/%Y} selon la prévision")
+    return ", ".join(parts) if parts else "non atteint selon la tendance et la prévision"
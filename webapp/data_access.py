@@ -1,10 +1,154 @@
 # water_level/webapp/data_access.py
 
+import glob
+import json
+import logging
+import os
 import sqlite3
+
+import numpy as np
 import pandas as pd
 
-def get_first_measure_data(db_path="niveau_eau.db"):
+from bdd import get_data_version
+
+# Moteur des agrégations analytiques : "sqlite" (par défaut) ou "duckdb" (optionnel, pip install duckdb)
+QUERY_BACKEND = os.getenv("QUERY_BACKEND", "sqlite")
+
+logger = logging.getLogger(__name__)
+
+
+# --- Backend DuckDB (instantané Parquet de water_level, un fichier par mois) ---
+
+def parquet_directory(db_path="niveau_eau.db"):
+    return os.path.splitext(os.path.abspath(db_path))[0] + ".parquet"
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, "manifest.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _month_path(directory, month):
+    return os.path.join(directory, f"water_level-{month}.parquet")
+
+def _write_month(conn, duck, directory, month):
+    """Rewrite the Parquet file of one month ('YYYY-MM') from water_level, deleting it if the month is empty."""
+    start = f"{month}-01 00:00:00"
+    end = (pd.Timestamp(start) + pd.offsets.MonthBegin()).strftime("%Y-%m-%d %H:%M:%S")
+    cursor = conn.execute("""
+        SELECT CAST(strftime('%s', datetime_event) AS INTEGER), value
+        FROM water_level
+        WHERE datetime_event >= ? AND datetime_event < ?
+        ORDER BY datetime_event ASC
+    """, (start, end))
+    rows = np.fromiter(cursor, dtype=[("t", "<i8"), ("v", "<f8")])
+    path = _month_path(directory, month)
+    if len(rows) == 0:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    frame = pd.DataFrame({
+        "datetime_event": rows["t"].astype("datetime64[s]"),
+        "value": rows["v"],
+    })
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    duck.register("frame", frame)
+    duck.sql("""
+        SELECT datetime_event,
+               CAST(datetime_event AS DATE) AS date_event,
+               value
+        FROM frame
+    """).write_parquet(tmp_path)
+    duck.unregister("frame")
+    # Remplacement atomique : un lecteur voit l'ancien ou le nouveau fichier, jamais un fichier partiel
+    os.replace(tmp_path, path)
+
+def _month_counts(conn):
+    return dict(conn.execute("""
+        SELECT substr(datetime_event, 1, 7), COUNT(*) FROM water_level
+        WHERE datetime_event IS NOT NULL GROUP BY 1
+    """).fetchall())
+
+def parquet_snapshot(db_path="niveau_eau.db"):
+    """Return the monthly Parquet files of water_level, brought up to the current data_version."""
+    import duckdb
+    version, _ = get_data_version(db_path=db_path)
+    directory = parquet_directory(db_path)
+    manifest = _read_manifest(directory)
+    if manifest is None or manifest["version"] != version:
+        os.makedirs(directory, exist_ok=True)
+        with sqlite3.connect(db_path) as conn:
+            total, max_id = conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM water_level").fetchone()
+            if manifest is None:
+                counts = _month_counts(conn)
+                dirty = set(counts)
+                # Anciens instantanés complets (un fichier par version)
+                for old in glob.glob(os.path.splitext(db_path)[0] + ".water_level.v*.parquet"):
+                    os.remove(old)
+            else:
+                # Ids AUTOINCREMENT : les lignes ajoutées depuis l'instantané ont un id supérieur
+                added = dict(conn.execute("""
+                    SELECT substr(datetime_event, 1, 7), COUNT(*) FROM water_level
+                    WHERE id > ? AND datetime_event IS NOT NULL GROUP BY 1
+                """, (manifest["max_id"],)).fetchall())
+                previous = manifest["months"]
+                if total == manifest["total"] + sum(added.values()):
+                    counts = {m: previous.get(m, 0) + added.get(m, 0) for m in set(previous) | set(added)}
+                    dirty = set(added)
+                else:
+                    # Des lignes ont été supprimées (quarantaine, rétention) : recomptage par mois
+                    counts = _month_counts(conn)
+                    dirty = set(added) | {m for m in set(counts) | set(previous)
+                                          if counts.get(m) != previous.get(m)}
+            with duckdb.connect() as duck:
+                for month in sorted(dirty):
+                    _write_month(conn, duck, directory, month)
+        manifest = {"version": version, "total": total, "max_id": max_id,
+                    "months": {m: n for m, n in counts.items() if n}}
+        tmp_path = os.path.join(directory, f"manifest.json.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(directory, "manifest.json"))
+    return [_month_path(directory, month) for month in sorted(manifest["months"])]
+
+def _use_duckdb(backend):
+    """True if `backend` (or QUERY_BACKEND) is duckdb and the package is installed."""
+    if (backend or QUERY_BACKEND) != "duckdb":
+        return False
+    try:
+        import duckdb  # noqa: F401
+    except ImportError as e:
+        logger.warning(f"DuckDB unavailable ({e}), using SQLite")
+        return False
+    return True
+
+def _duckdb_query(query, db_path, params=()):
+    """Run `query` with DuckDB against a `water_level` view of the monthly Parquet files."""
+    import duckdb
+    paths = parquet_snapshot(db_path)
+    with duckdb.connect() as conn:
+        if paths:
+            conn.read_parquet(paths).create_view("water_level")
+        else:
+            conn.execute("CREATE VIEW water_level AS "
+                         "SELECT NULL::TIMESTAMP AS datetime_event, NULL::DATE AS date_event, NULL::DOUBLE AS value "
+                         "WHERE false")
+        return conn.execute(query, params).df()
+
+
+def get_first_measure_data(db_path="niveau_eau.db", backend=None):
     """Return the first measure per day."""
+    if _use_duckdb(backend):
+        df = _duckdb_query("""
+            SELECT date_event AS date,
+                   arg_min(value, datetime_event) AS value
+            FROM water_level
+            GROUP BY date_event
+            ORDER BY date_event ASC
+        """, db_path)
+        df["date"] = pd.to_datetime(df["date"])
+        return df
     with sqlite3.connect(db_path) as conn:
         query = """
         SELECT w.date_event AS date, w.value
@@ -20,17 +164,58 @@ def get_first_measure_data(db_path="niveau_eau.db"):
         return pd.read_sql_query(query, conn, parse_dates=["date"])
 
 def get_all_data(db_path="niveau_eau.db"):
-    """Return all measures sorted by datetime."""
+    """Return all measures sorted by datetime (read-only callers should prefer webapp.series.load_series)."""
     with sqlite3.connect(db_path) as conn:
         query = """
-        SELECT date_event,
-               datetime_event,
+        SELECT datetime_event,
                value
         FROM water_level
         ORDER BY datetime_event ASC
         """
         return pd.read_sql_query(query, conn,
-                                 parse_dates=["date_event", "datetime_event"])
+                                 parse_dates=["datetime_event"])
+
+
+# --- Pyramide de résolutions ---
+
+# Du plus grossier au plus fin : (résolution, durée d'un bucket en secondes)
+ROLLUP_TIERS = [("1d", 86400), ("6h", 21600), ("1h", 3600)]
+
+# Taille de segment à utiliser dans create_interactive_chart_plotly pour chaque résolution
+RESOLUTION_HOURS = {"raw": 1, "1h": 1, "6h": 6, "1d": 24}
+
+def choose_resolution(start, end, min_points=1000):
+    """Return the coarsest tier giving at least `min_points` points over [start, end]."""
+    span = (pd.Timestamp(end) - pd.Timestamp(start)).total_seconds()
+    for resolution, seconds in ROLLUP_TIERS:
+        if span / seconds >= min_points:
+            return resolution
+    return "raw"
+
+def get_series(start=None, end=None, resolution="raw", db_path="niveau_eau.db"):
+    """Return `datetime_event`/`value` between start and end, from the raw table or the `resolution` tier."""
+    start = pd.Timestamp(start or "1900-01-01").strftime("%Y-%m-%d %H:%M:%S")
+    end = pd.Timestamp(end or "2100-01-01").strftime("%Y-%m-%d %H:%M:%S")
+    with sqlite3.connect(db_path) as conn:
+        if resolution == "raw":
+            query = """
+            SELECT datetime_event, value
+            FROM water_level
+            WHERE datetime_event >= ? AND datetime_event <= ?
+            ORDER BY datetime_event ASC
+            """
+            params = (start, end)
+        else:
+            query = """
+            SELECT bucket_start AS datetime_event,
+                   value_mean AS value
+            FROM water_level_rollup
+            WHERE resolution = ? AND bucket_start >= ? AND bucket_start <= ?
+            ORDER BY bucket_start ASC
+            """
+            params = (resolution, start, end)
+        return pd.read_sql_query(query, conn, params=params,
+                                 parse_dates=["datetime_event"])
 
 
 # --- Threshold lines CRUD ---
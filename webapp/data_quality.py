@@ -0,0 +1,204 @@
+"""
+Couverture et intégrité des mesures, jour par jour.
+
+La table `daily_coverage` garde pour chaque jour : nombre de mesures, plus grand trou
+jusqu'à la dernière mesure (y compris depuis minuit), heures couvertes, mesures insérées
+dans le désordre, mesures en quarantaine et unités vues. Elle ne dépend que des mesures :
+calculée par fonctions de fenêtre SQL, rafraîchie à l'ingestion pour les seuls jours
+touchés ; sous le filigrane de compactage (retention.py), les lignes existantes décrivent
+les mesures d'origine et sont figées, comme les agrégats. Le trou final (jusqu'à minuit,
+ou jusqu'à maintenant pour le jour en cours) et la complétude sont calculés à la lecture
+par coverage_report.
+
+Les horodatages en double sont refusés par UNIQUE(datetime_event) : ils ne peuvent
+pas apparaître dans water_level.
+
+    python -m webapp.data_quality --days 30
+"""
+
+import argparse
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from bdd import get_compaction_watermark
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(funcName)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+DB_PATH = "niveau_eau.db"
+GAP_ALERT_MINUTES = 180      # trou signalé au-delà de 3 heures sans mesure
+LOW_SAMPLES_RATIO = 0.5      # jour signalé sous la moitié du nombre habituel de mesures
+BASELINE_DAYS = 30           # fenêtre du nombre habituel de mesures (médiane glissante)
+
+COVERAGE_SELECT = """
+    WITH ordered AS (
+        SELECT date_event, datetime_event, unit,
+               (julianday(datetime_event) - julianday(LAG(datetime_event) OVER by_time)) * 1440 AS gap,
+               datetime_event < LAG(datetime_event) OVER by_id AS out_of_order
+        FROM water_level
+        WHERE datetime_event >= :start AND datetime_event < :end
+        WINDOW by_time AS (PARTITION BY date_event ORDER BY datetime_event),
+               by_id AS (PARTITION BY date_event ORDER BY id)
+    ),
+    days AS (
+        SELECT date_event,
+               COUNT(*) AS n_samples,
+               MIN(datetime_event) AS first_reading,
+               MAX(datetime_event) AS last_reading,
+               COALESCE(MAX(gap), 0) AS max_inner_gap,
+               COUNT(DISTINCT strftime('%H', datetime_event)) AS hours_covered,
+               SUM(COALESCE(out_of_order, 0)) AS out_of_order,
+               GROUP_CONCAT(DISTINCT unit) AS units
+        FROM ordered
+        GROUP BY date_event
+    )
+    SELECT d.date_event, d.n_samples, d.first_reading, d.last_reading,
+           MAX(d.max_inner_gap, (julianday(d.first_reading) - julianday(d.date_event)) * 1440),
+           d.hours_covered,
+           100.0 * MIN(d.hours_covered, 24) / 24,
+           d.out_of_order,
+           COALESCE(q.n_quarantined, 0),
+           d.units
+    FROM days d
+    LEFT JOIN (
+        SELECT date_event, COUNT(*) AS n_quarantined FROM water_level_quarantine
+        WHERE datetime_event >= :start AND datetime_event < :end
+        GROUP BY date_event
+    ) q ON q.date_event = d.date_event
+"""
+
+
+def refresh_coverage(start_date=None, end_date=None, db_path=DB_PATH):
+    """
+    Recalcule daily_coverage pour les jours compris entre start_date et end_date inclus
+    ('YYYY-MM-DD'), toute la table sans bornes. Sous le filigrane de compactage, seuls les
+    jours absents sont ajoutés.
+    """
+    start = f"{start_date or '0000-01-01'} 00:00:00"
+    end = (datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d 00:00:00") \
+        if end_date else "9999-12-31 00:00:00"
+    watermark = get_compaction_watermark(db_path) or start
+    live_start = max(start, watermark)
+
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        insert = f"""
+            INSERT OR IGNORE INTO daily_coverage
+                (date_event, n_samples, first_reading, last_reading, max_gap_minutes,
+                 hours_covered, completeness_pct, out_of_order, n_quarantined, units)
+            {COVERAGE_SELECT}
+        """
+        if start < watermark:
+            cursor.execute(insert, {"start": start, "end": min(end, watermark)})
+        if live_start < end:
+            cursor.execute("DELETE FROM daily_coverage WHERE date_event >= ? AND date_event < ?",
+                           (live_start[:10], end[:10]))
+            cursor.execute(insert, {"start": live_start, "end": end})
+        conn.commit()
+
+
+def ensure_coverage(db_path=DB_PATH):
+    """Build daily_coverage from scratch if it was never computed."""
+    with sqlite3.connect(db_path) as conn:
+        if conn.execute("SELECT 1 FROM daily_coverage LIMIT 1").fetchone() is not None:
+            return
+        if conn.execute("SELECT 1 FROM water_level LIMIT 1").fetchone() is None:
+            return
+    logger.info("Building daily coverage from raw readings")
+    refresh_coverage(db_path=db_path)
+
+
+def coverage_report(start_date=None, db_path=DB_PATH, now=None):
+    """
+    Return one row per calendar day since start_date, missing days included, with an `issues` column.
+    The final gap and completeness are measured up to `now` (current clock by default).
+    """
+    now = pd.Timestamp(now or datetime.now())
+    with sqlite3.connect(db_path) as conn:
+        df = pd.read_sql_query(
+            "SELECT * FROM daily_coverage WHERE date_event >= ? ORDER BY date_event",
+            conn, params=(start_date or "0000-01-01",)
+        )
+    if df.empty:
+        return df.assign(issues=pd.Series(dtype=object))
+
+    df["date_event"] = pd.to_datetime(df["date_event"])
+    calendar = pd.date_range(pd.Timestamp(start_date) if start_date else df["date_event"].iloc[0],
+                             now.normalize(), freq="D")
+    df = df[df["date_event"] <= now].set_index("date_event").reindex(calendar) \
+        .rename_axis("date_event").reset_index()
+    for column in ["n_samples", "hours_covered", "out_of_order", "n_quarantined"]:
+        df[column] = df[column].fillna(0).astype(int)
+
+    # Jour en cours : trou final jusqu'à maintenant, complétude sur les heures entamées
+    day_end = (df["date_event"] + pd.Timedelta(days=1)).clip(upper=now)
+    trailing = (day_end - pd.to_datetime(df["last_reading"])).dt.total_seconds() / 60
+    df["max_gap_minutes"] = np.fmax(df["max_gap_minutes"], trailing).fillna(1440)
+    expected_hours = np.where(df["date_event"] == now.normalize(), now.hour + 1, 24)
+    df["completeness_pct"] = 100.0 * np.minimum(df["hours_covered"], expected_hours) / expected_hours
+
+    # Nombre habituel de mesures : médiane des BASELINE_DAYS jours précédents
+    baseline = df["n_samples"].where(df["n_samples"] > 0).rolling(BASELINE_DAYS, min_periods=3).median().shift()
+    previous_units = df["units"].where(df["units"].notna()).ffill().shift()
+    flags = {
+        "jour manquant": df["n_samples"] == 0,
+        "peu de mesures": (df["n_samples"] > 0) & (df["n_samples"] < LOW_SAMPLES_RATIO * baseline),
+        f"trou > {GAP_ALERT_MINUTES // 60} h": (df["n_samples"] > 0) & (df["max_gap_minutes"] > GAP_ALERT_MINUTES),
+        "désordre": df["out_of_order"] > 0,
+        "quarantaine": df["n_quarantined"] > 0,
+        "unité changée": df["units"].notna() & previous_units.notna() & (df["units"] != previous_units),
+    }
+    issues = pd.DataFrame(flags)
+    df["issues"] = issues.apply(lambda row: ", ".join(issues.columns[row.to_numpy()]), axis=1) \
+        if not issues.empty else ""
+    return df
+
+
+def summarize_coverage(report):
+    """Headline figures of a coverage_report (days, missing days, completeness, flagged days)."""
+    if report.empty:
+        return {"days": 0, "missing_days": 0, "completeness_pct": None, "flagged_days": 0, "max_gap_hours": None}
+    measured = report[report["n_samples"] > 0]
+    return {
+        "days": len(report),
+        "missing_days": int((report["n_samples"] == 0).sum()),
+        "completeness_pct": round(float(report["completeness_pct"].mean()), 1),
+        "flagged_days": int((report["issues"] != "").sum()),
+        "max_gap_hours": round(float(measured["max_gap_minutes"].max()) / 60, 1) if not measured.empty else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Couverture et intégrité des mesures")
+    parser.add_argument("--days", type=int, default=30, help="jours analysés (0 : tout l'historique)")
+    parser.add_argument("--all", action="store_true", help="afficher tous les jours, pas seulement les jours signalés")
+    parser.add_argument("--rebuild", action="store_true", help="recalculer toute la table daily_coverage")
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+
+    from bdd import init_db
+    init_db(args.db)
+    if args.rebuild:
+        refresh_coverage(db_path=args.db)
+    else:
+        ensure_coverage(args.db)
+
+    start = (datetime.now() - timedelta(days=args.days - 1)).strftime("%Y-%m-%d") if args.days else None
+    report = coverage_report(start, args.db)
+    summary = summarize_coverage(report)
+    print(", ".join(f"{k}={v}" for k, v in summary.items()))
+    shown = report if args.all else report[report["issues"] != ""]
+    if not shown.empty:
+        columns = ["date_event", "n_samples", "hours_covered", "completeness_pct", "max_gap_minutes",
+                   "out_of_order", "n_quarantined", "units", "issues"]
+        print(shown[columns].assign(date_event=shown["date_event"].dt.strftime("%Y-%m-%d"))
+              .to_string(index=False, float_format=lambda v: f"{v:.1f}"))
@@ -0,0 +1,116 @@
+"""
+Courbes de dépassement et de durée pour la planification des seuils.
+
+Pour un niveau candidat L, à partir de la première mesure de chaque jour :
+  - la part des jours où le lac était sous L (et son complément, la probabilité de dépassement) ;
+  - le nombre de jours sous L ;
+  - par année, la plus longue période de jours consécutifs sous L.
+
+L'index est construit une fois par version des données : valeurs triées (ECDF) et,
+pour chaque année, la plus longue période sous le niveau après activation des k jours
+les plus bas (union-find sur les jours consécutifs). Une requête ne fait ensuite que
+des recherches dichotomiques, sans relire l'historique.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _longest_runs(ordinals, values):
+    """Longest run of consecutive days below the level once the k lowest days are, for k = 0..n."""
+    n = len(values)
+    runs = np.zeros(n + 1, dtype=np.int32)
+    if n == 0:
+        return runs
+    position = {ordinal: i for i, ordinal in enumerate(ordinals)}
+    parent = list(range(n))
+    size = [1] * n
+    active = [False] * n
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    longest = 0
+    for k, i in enumerate(np.argsort(values, kind="stable"), start=1):
+        active[i] = True
+        root = i
+        for neighbour in (position.get(ordinals[i] - 1), position.get(ordinals[i] + 1)):
+            if neighbour is not None and active[neighbour]:
+                other = find(neighbour)
+                if other != root:
+                    if size[other] > size[root]:
+                        root, other = other, root
+                    parent[other] = root
+                    size[root] += size[other]
+        longest = max(longest, size[root])
+        runs[k] = longest
+    return runs
+
+
+class ExceedanceIndex:
+    """Sorted daily values, overall and per year, answering level queries in O(log n)."""
+
+    def __init__(self, dates, values):
+        dates = pd.to_datetime(pd.Series(dates)).reset_index(drop=True)
+        values = np.asarray(values, dtype=np.float64)
+        keep = ~np.isnan(values)
+        dates, values = dates[keep].reset_index(drop=True), values[keep]
+        self.sorted_values = np.sort(values)
+        self.first_date = dates.min() if len(dates) else None
+        self.last_date = dates.max() if len(dates) else None
+        self.years = {}
+        ordinals = dates.map(pd.Timestamp.toordinal).to_numpy() if len(dates) else np.array([], dtype=int)
+        for year in sorted(dates.dt.year.unique()):
+            mask = (dates.dt.year == year).to_numpy()
+            year_values = values[mask]
+            self.years[int(year)] = (np.sort(year_values), _longest_runs(ordinals[mask].tolist(), year_values))
+
+    @classmethod
+    def from_daily(cls, df_first):
+        """Build from get_first_measure_data output (date and value columns)."""
+        return cls(df_first["date"], df_first["value"])
+
+    def __len__(self):
+        return len(self.sorted_values)
+
+    def days_below(self, level):
+        return int(np.searchsorted(self.sorted_values, level, side="left"))
+
+    def query(self, level):
+        """Days below `level`, exceedance probability and, per year, days below and longest run below."""
+        n = len(self.sorted_values)
+        below = self.days_below(level)
+        per_year = []
+        for year, (year_values, runs) in self.years.items():
+            k = int(np.searchsorted(year_values, level, side="left"))
+            per_year.append({
+                "year": year,
+                "days": len(year_values),
+                "days_below": k,
+                "longest_run_below": int(runs[k]),
+            })
+        return {
+            "level": level,
+            "days": n,
+            "days_below": below,
+            "below_pct": 100 * below / n if n else None,
+            "exceedance_pct": 100 * (n - below) / n if n else None,
+            "per_year": per_year,
+        }
+
+
+def describe_exceedance(result, years=3):
+    """Short French readout of ExceedanceIndex.query, detailing the last `years` years."""
+    if not result["days"]:
+        return "Pas encore d'historique pour situer ce niveau."
+    text = (f"Historiquement sous {result['level']:.2f} m : {result['below_pct']:.0f} % des jours "
+            f"({result['days_below']} / {result['days']}), au-dessus ou égal {result['exceedance_pct']:.0f} %.")
+    recent = [y for y in result["per_year"][-years:] if y["days"]]
+    if recent:
+        text += " Plus longue période sous ce niveau : " + ", ".join(
+            f"{y['year']} : {y['longest_run_below']} j" for y in reversed(recent)
+        ) + "."
+    return text
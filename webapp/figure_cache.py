@@ -0,0 +1,47 @@
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+
+
+def figure_key(kind, data_version, thresholds_version, **params):
+    """Build a hashable cache key from the data versions, the chart kind and its parameters."""
+    normalized = tuple(sorted(
+        (name, tuple(sorted(value)) if isinstance(value, (list, tuple, set)) else value)
+        for name, value in params.items()
+    ))
+    return (kind, data_version, thresholds_version, normalized)
+
+
+class FigureCache:
+    """LRU cache of serialized Plotly figures (JSON), shared between sessions."""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        """Return the cached figure for `key`, calling `build()` on a miss (None is cached too)."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                payload = self._entries[key]
+                return None if payload is None else pio.from_json(payload)
+
+        fig = build()
+        payload = None if fig is None else fig.to_json()
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fig
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
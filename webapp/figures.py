@@ -0,0 +1,183 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from webapp.plotly_chart import create_interactive_chart_plotly
+
+
+def add_threshold_lines(fig, thresholds):
+    """Add one horizontal line per active threshold (DataFrame from get_threshold_lines)."""
+    for th in thresholds.itertuples():
+        fig.add_hline(
+            y=th.value,
+            line_color=th.color,            # couleur depuis la BDD
+            line_dash=th.dash_style,        # style (solid, dash, dot…)
+            annotation_text=th.name,
+            annotation_position="top left"
+        )
+    return fig
+
+
+def prepare_daily(df_first):
+    """Add `Date`, `Year` and `dummy_date` (year 2000) columns to get_first_measure_data output."""
+    df = df_first.copy()
+    df["Date"] = pd.to_datetime(df["date"], format="%Y-%m-%d")
+    df = df.sort_values("Date")
+    df["Year"] = df["Date"].dt.year
+    df["dummy_date"] = pd.to_datetime("2000-" + df["Date"].dt.strftime("%m-%d"))
+    return df
+
+
+def build_recent_figure(df_window, segment_size_hours, thresholds):
+    """Slope-colored chart of the last N days."""
+    return create_interactive_chart_plotly(
+        data=df_window,
+        x_field="datetime_event",
+        y_field="value",
+        x_axis_format="%d %b %H:%M",
+        y_axis_label="Niveau d'eau (mNGF)",
+        margin_value=1,
+        segment_size_hours=segment_size_hours,
+        horizontal_lines=thresholds
+    )
+
+
+def climatology_traces(bands):
+    """Shaded min-max and p10-p90 bands plus median line, from climatology_bands output."""
+    traces = []
+    for lower, upper, name, fillcolor in (("min", "max", "Min-max", "rgba(0,0,0,0.06)"),
+                                         ("p10", "p90", "p10-p90", "rgba(0,0,0,0.12)")):
+        traces.append(go.Scatter(
+            x=bands["dummy_date"], y=bands[lower], mode="lines", line=dict(width=0),
+            legendgroup=name, showlegend=False, name=lower,
+            hovertemplate=f"{lower} : %{{y:.2f}} m<extra></extra>"
+        ))
+        traces.append(go.Scatter(
+            x=bands["dummy_date"], y=bands[upper], mode="lines", line=dict(width=0),
+            fill="tonexty", fillcolor=fillcolor, legendgroup=name, name=name,
+            hovertemplate=f"{upper} : %{{y:.2f}} m<extra></extra>"
+        ))
+    traces.append(go.Scatter(
+        x=bands["dummy_date"], y=bands["median"], mode="lines",
+        line=dict(color="grey", dash="dot", width=1), name="Médiane",
+        hovertemplate="Médiane : %{y:.2f} m<extra></extra>"
+    ))
+    return traces
+
+
+def build_annual_figure(df_selected, color_map, thresholds, bands=None):
+    """
+    Year-over-year comparison on a common January-December axis,
+    drawn over the per-day climatology bands when given.
+    """
+    fig = px.line(
+        df_selected,
+        x="dummy_date",
+        y="value",
+        color="Year",
+        labels={"dummy_date": "Date", "value": "Niveau d'eau (mNGF)", "Year": "Année"},
+        color_discrete_map=color_map
+    )
+    fig.update_layout(
+        width=800,
+        height=800,
+        margin=dict(l=20, r=20, t=20, b=20),
+        legend=dict(orientation="h", yanchor="top", y=-0.2, xanchor="center", x=0.5),
+        xaxis=dict(
+            range=["2000-01-01", "2000-12-31"],
+            tickformat="%B",
+            hoverformat="%d %B",
+            tickangle=-45,
+            side="bottom",
+            title=None,
+            dtick="M1"
+        ),
+        hovermode="x unified"
+    )
+    for trace in fig.data:
+        trace.hovertemplate = "%{data.name} : %{y:.2f} m<extra></extra>"
+    if bands is not None:
+        # Bandes ajoutées en premier pour rester sous les courbes annuelles
+        fig = go.Figure(data=[*climatology_traces(bands), *fig.data], layout=fig.layout)
+    return add_threshold_lines(fig, thresholds)
+
+
+def build_daily_figure(df_daily, color_map, thresholds):
+    """Daily first measure over the whole history, one color per year."""
+    fig = px.line(
+        df_daily,
+        x="Date",
+        y="value",
+        color="Year",
+        color_discrete_map=color_map,
+        labels={"value": "Niveau d'eau (mNGF)", "Date": "Date", "Year": "Année"}
+    )
+    # Axe X avec date au format "jour mois année"
+    fig.update_layout(
+        hovermode="x unified",
+        margin=dict(l=20, r=20, t=20, b=20),
+        xaxis=dict(
+            tickformat="%B %Y",
+            hoverformat="%d %B %Y",
+            tickangle=-45,
+            title=None,
+            dtick="M3"
+        ),
+        legend=dict(orientation="h", yanchor="top", y=-0.3, xanchor="center", x=0.5)
+    )
+    for trace in fig.data:
+        trace.hovertemplate = "Niveau : %{y:.2f} m<extra></extra>"
+    return add_threshold_lines(fig, thresholds)
+
+
+def build_forecast_figure(df_history, forecast_df, thresholds):
+    """History plus dotted forecast line."""
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=df_history["datetime_event"], y=df_history["value"],
+        mode="lines", name="Historique"
+    ))
+    if "yhat_lower" in forecast_df and forecast_df["yhat_lower"].notna().any():
+        # Bande p10-p90 de la prévision climatologique
+        fig.add_trace(go.Scatter(
+            x=pd.concat([forecast_df["ds"], forecast_df["ds"][::-1]]),
+            y=pd.concat([forecast_df["yhat_upper"], forecast_df["yhat_lower"][::-1]]),
+            fill="toself", fillcolor="rgba(0,0,0,0.1)",
+            line=dict(width=0), hoverinfo="skip", name="Intervalle p10-p90"
+        ))
+    fig.add_trace(go.Scatter(
+        x=forecast_df["ds"], y=forecast_df["yhat"],
+        mode="lines", name="Prévision",
+        line=dict(dash="dot", color="black")
+    ))
+    add_threshold_lines(fig, thresholds)
+    fig.update_layout(
+        title="Prévision du niveau d'eau",
+        xaxis_title="Date",
+        yaxis_title="Niveau (mNGF)",
+        hovermode="x unified",
+        margin=dict(l=20, r=20, t=40, b=20)
+    )
+    return fig
+
+
+def build_rate_heatmap(matrix):
+    """Heatmap of the mean rate of change (cm/h) from patterns.profile_matrix, hour on the x axis."""
+    z = matrix.to_numpy() * 100
+    limit = float(np.nanmax(np.abs(z))) if np.isfinite(z).any() else 1.0
+    fig = go.Figure(go.Heatmap(
+        z=z,
+        x=[f"{h} h" for h in matrix.columns],
+        y=list(matrix.index),
+        colorscale="RdBu",
+        zmin=-limit, zmax=limit,  # 0 au blanc : baisse en rouge, hausse en bleu
+        colorbar=dict(title="cm/h"),
+        hovertemplate="%{y} %{x} : %{z:+.2f} cm/h<extra></extra>"
+    ))
+    fig.update_layout(
+        height=120 + 22 * len(matrix.index),
+        margin=dict(l=20, r=20, t=20, b=20),
+        yaxis=dict(autorange="reversed")
+    )
+    return fig
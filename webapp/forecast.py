@@ -1,7 +1,28 @@
-from prophet import Prophet
+import importlib.util
+import logging
+import os
+import warnings
+
+import numpy as np
 import pandas as pd
 
-def forecast_water_level(df_all, days_ahead=160):
+from webapp.series import WaterLevelSeries
+
+# Modèle de prévision : "prophet" (par défaut) ou "climatology" (NumPy pur, quelques millisecondes)
+FORECAST_MODEL = os.getenv("FORECAST_MODEL", "prophet")
+CLIMATOLOGY_DECAY = 0.98      # persistance quotidienne de l'écart à la climatologie
+CLIMATOLOGY_SMOOTHING = 7     # lissage circulaire des statistiques (jours)
+
+# Prophet/cmdstanpy journalisent chaque ajustement en INFO
+logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+def build_prophet_model():
+    """Prophet configuration used for the dashboard forecast and by backtest.py."""
+    from prophet import Prophet
+    return Prophet(daily_seasonality=True, yearly_seasonality=True)
+
+def forecast_water_level_prophet(df_all, days_ahead=160):
     """
     Prend un DataFrame df_all avec colonnes 'datetime_event' et 'value',
     renvoie un DataFrame de prévisions avec colonnes 'ds', 'yhat'.
@@ -9,10 +30,132 @@ def forecast_water_level(df_all, days_ahead=160):
     df = df_all.copy()
     df = df.rename(columns={"datetime_event": "ds", "value": "y"})
     df = df[["ds", "y"]].dropna()
-    
-    model = Prophet(daily_seasonality=True, yearly_seasonality=True)
-    model.fit(df, suppress_logging=True)
+
+    model = build_prophet_model()
+    model.fit(df)
 
     future = model.make_future_dataframe(periods=days_ahead)
     forecast = model.predict(future)
-    return forecast[["ds", "yhat"]]
\ No newline at end of file
+    return forecast[["ds", "yhat"]]
+
+# --- Prévision climatologique ---
+
+def _is_leap(years):
+    return (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+
+def _day_of_year(times):
+    """0-based slot on the 366-day axis of a leap year, where 29 February has its own slot."""
+    days = times.astype("datetime64[D]")
+    years = days.astype("datetime64[Y]").astype(int) + 1970
+    month_day = (days - days.astype("datetime64[Y]")).astype(int)
+    return month_day + (~_is_leap(years) & (month_day >= 59)).astype(int)
+
+def _circular_smooth(stat, width=CLIMATOLOGY_SMOOTHING):
+    """Moving average over the 366 days of the year, wrapping around 31 Dec / 1 Jan."""
+    kernel = np.ones(width) / width
+    padded = np.concatenate((stat[-width:], stat, stat[:width]))
+    return np.convolve(padded, kernel, mode="same")[width:-width]
+
+def fit_climatology(df_all):
+    """Per-day-of-year mean, p10 and p90 of the daily first reading plus the current anomaly."""
+    if isinstance(df_all, WaterLevelSeries):
+        df_all = df_all.to_frame()
+    times = df_all["datetime_event"].to_numpy(dtype="datetime64[s]")
+    values = df_all["value"].to_numpy(dtype=float)
+    order = np.argsort(times, kind="stable")
+    times, values = times[order], values[order]
+
+    # Première mesure de chaque jour
+    days, first = np.unique(times.astype("datetime64[D]"), return_index=True)
+    daily = values[first]
+    years = days.astype("datetime64[Y]").astype(int) + 1970
+    doy = _day_of_year(days)
+
+    # Matrice années x jours de l'année (NaN si pas de mesure)
+    matrix = np.full((years.max() - years.min() + 1, 366), np.nan)
+    matrix[years - years.min(), doy] = daily
+    with warnings.catch_warnings():
+        # Colonnes entièrement NaN (jours jamais observés) traitées juste après
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(matrix, axis=0)
+        p10, p90 = np.nanpercentile(matrix, [10, 90], axis=0)
+
+    # Jours jamais observés : interpolation circulaire
+    known = ~np.isnan(mean)
+    positions = np.arange(366)
+    for stat in (mean, p10, p90):
+        stat[~known] = np.interp(positions[~known], positions[known], stat[known], period=366)
+
+    mean, p10, p90 = (_circular_smooth(s) for s in (mean, p10, p90))
+    return {
+        "mean": mean,
+        "p10": p10,
+        "p90": p90,
+        "last_time": times[-1],
+        "anomaly": values[-1] - mean[_day_of_year(times[-1:])[0]],
+    }
+
+def climatology_bands(df_daily):
+    """
+    Min, p10, median, p90 and max of the daily first reading per calendar day (prepare_daily output),
+    indexed by `dummy_date` on the year-2000 axis.
+    """
+    dates = df_daily["Date"].to_numpy(dtype="datetime64[D]")
+    values = df_daily["value"].to_numpy(dtype=float)
+    years = dates.astype("datetime64[Y]").astype(int) + 1970
+    # Position sur l'année 2000 (bissextile) : le 29 février a sa propre colonne
+    slot = _day_of_year(dates)
+
+    matrix = np.full((years.max() - years.min() + 1, 366), np.nan)
+    matrix[years - years.min(), slot] = values
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        p0, p10, p50, p90, p100 = np.nanpercentile(matrix, [0, 10, 50, 90, 100], axis=0)
+    return pd.DataFrame({
+        "dummy_date": np.datetime64("2000-01-01") + np.arange(366),
+        "min": p0,
+        "p10": p10,
+        "median": p50,
+        "p90": p90,
+        "max": p100,
+        "n_years": np.count_nonzero(~np.isnan(matrix), axis=0),
+    })
+
+def project_climatology(climatology, days_ahead=160, decay=CLIMATOLOGY_DECAY):
+    """Project the current anomaly forward with daily decay on top of the climatology."""
+    steps = np.arange(1, days_ahead + 1)
+    ds = climatology["last_time"] + steps * np.timedelta64(1, "D")
+    doy = _day_of_year(ds)
+    persistence = decay ** steps
+    yhat = climatology["mean"][doy] + climatology["anomaly"] * persistence
+    spread = 1 - persistence
+    return pd.DataFrame({
+        "ds": ds.astype("datetime64[ns]"),
+        "yhat": yhat,
+        "yhat_lower": yhat + (climatology["p10"][doy] - climatology["mean"][doy]) * spread,
+        "yhat_upper": yhat + (climatology["p90"][doy] - climatology["mean"][doy]) * spread,
+    })
+
+def forecast_water_level_climatology(df_all, days_ahead=160):
+    """Même interface que forecast_water_level, sans Prophet (quelques millisecondes)."""
+    return project_climatology(fit_climatology(df_all), days_ahead)
+
+def resolve_forecast_model(model=None):
+    """Model that forecast_water_level will use for `model` (FORECAST_MODEL par défaut)."""
+    model = model or FORECAST_MODEL
+    if model != "climatology" and importlib.util.find_spec("prophet") is None:
+        return "climatology"
+    return model
+
+def forecast_water_level(df_all, days_ahead=160, model=None):
+    """Forecast with FORECAST_MODEL (climatology without Prophet); return (DataFrame 'ds'/'yhat', model used)."""
+    model = resolve_forecast_model(model)
+    if isinstance(df_all, WaterLevelSeries):
+        df_all = df_all.to_frame()
+    if model == "climatology":
+        return forecast_water_level_climatology(df_all, days_ahead), model
+    try:
+        return forecast_water_level_prophet(df_all, days_ahead), model
+    except ImportError as e:
+        logger.warning(f"Prophet unavailable ({e}), using climatology forecast")
+        return forecast_water_level_climatology(df_all, days_ahead), "climatology"
@@ -1,22 +1,22 @@
 import locale
 from datetime import timedelta
 
-# locale.setlocale(locale.LC_TIME, 'fr_FR.UTF-8')
+import pandas as pd
+
+from bdd import get_kpi_snapshot
+from webapp.patterns import usual_pattern
+from webapp.series import WaterLevelSeries
 
-def get_closest_value(df, target_time):
-    """Return last value <= target_time."""
-    df_filtered = df[df["datetime_event"] <= target_time]
-    return None if df_filtered.empty else df_filtered.iloc[-1]["value"]
+# locale.setlocale(locale.LC_TIME, 'fr_FR.UTF-8')
 
 def compute_kpis(df_all):
-    """Compute KPI values for recent trends and comparisons."""
-    if df_all.empty:
+    """Compute KPI values for recent trends and comparisons from a WaterLevelSeries or a DataFrame."""
+    series = df_all if isinstance(df_all, WaterLevelSeries) else WaterLevelSeries.from_frame(df_all)
+    if series.empty:
         return {}
 
-    df_all = df_all.sort_values("datetime_event")
-    current_row = df_all.iloc[-1]
-    current_value = current_row["value"]
-    current_date = current_row["datetime_event"]
+    current_value = float(series.values[-1])
+    current_date = pd.Timestamp(series.times[-1])
 
     # Last measurement timestamp
     kpi_date = current_date.strftime("%d %B %Y %H:%M")
@@ -24,38 +24,38 @@ def compute_kpis(df_all):
     kpi_level = current_value
 
     # Comparison vs 1 day ago
-    value_j1 = get_closest_value(df_all, current_date - timedelta(days=1))
+    value_j1 = series.value_at_or_before(current_date - timedelta(days=1))
     kpi_j1 = current_value - value_j1 if value_j1 is not None else None
 
     # Comparison vs 3 days ago
-    value_j3 = get_closest_value(df_all, current_date - timedelta(days=3))
+    value_j3 = series.value_at_or_before(current_date - timedelta(days=3))
     kpi_j3 = current_value - value_j3 if value_j3 is not None else None
 
     # Comparison vs 1 week ago
-    value_s1 = get_closest_value(df_all, current_date - timedelta(weeks=1))
+    value_s1 = series.value_at_or_before(current_date - timedelta(weeks=1))
     kpi_s1 = current_value - value_s1 if value_s1 is not None else None
 
     # Trend over last 7 days (average daily change)
     kpi_7j = (kpi_s1 / 7) if kpi_s1 is not None else None
 
     # Comparison vs 1 month ago
-    value_m1 = get_closest_value(df_all, current_date - timedelta(days=30))
+    value_m1 = series.value_at_or_before(current_date - timedelta(days=30))
     kpi_m1 = current_value - value_m1 if value_m1 is not None else None
 
     # Comparison vs 2 months ago
-    value_m2 = get_closest_value(df_all, current_date - timedelta(days=60))
+    value_m2 = series.value_at_or_before(current_date - timedelta(days=60))
     kpi_m2 = current_value - value_m2 if value_m2 is not None else None
 
     # Comparison vs 1 year ago
-    value_y1 = get_closest_value(df_all, current_date - timedelta(days=365))
+    value_y1 = series.value_at_or_before(current_date - timedelta(days=365))
     kpi_y1 = current_value - value_y1 if value_y1 is not None else None
 
     # Comparison vs 2 years ago
-    value_y2 = get_closest_value(df_all, current_date - timedelta(days=730))
+    value_y2 = series.value_at_or_before(current_date - timedelta(days=730))
     kpi_y2 = current_value - value_y2 if value_y2 is not None else None
 
     # Comparison vs 3 years ago
-    value_y3 = get_closest_value(df_all, current_date - timedelta(days=1095))
+    value_y3 = series.value_at_or_before(current_date - timedelta(days=1095))
     kpi_y3 = current_value - value_y3 if value_y3 is not None else None
 
     return {
@@ -70,4 +70,36 @@ def compute_kpis(df_all):
         "kpi_y1": kpi_y1,
         "kpi_y2": kpi_y2,
         "kpi_y3": kpi_y3,
-    }
\ No newline at end of file
+    }
+
+def kpis_from_snapshot(snapshot):
+    """Same dict as compute_kpis, built from a kpi_snapshot row ({} if None)."""
+    if not snapshot:
+        return {}
+    kpi_s1 = snapshot["delta_7d"]
+    return {
+        "kpi_date": pd.Timestamp(snapshot["datetime_event"]).strftime("%d %B %Y %H:%M"),
+        "kpi_level": snapshot["value"],
+        "kpi_j1": snapshot["delta_1d"],
+        "kpi_j3": snapshot["delta_3d"],
+        "kpi_s1": kpi_s1,
+        "kpi_7j": (kpi_s1 / 7) if kpi_s1 is not None else None,
+        "kpi_m1": snapshot["delta_30d"],
+        "kpi_m2": snapshot["delta_60d"],
+        "kpi_y1": snapshot["delta_1y"],
+        "kpi_y2": snapshot["delta_2y"],
+        "kpi_y3": snapshot["delta_3y"],
+    }
+
+def load_kpis(db_path="niveau_eau.db"):
+    """Current KPIs from the kpi_snapshot row, with the usual behaviour at this time of year."""
+    snapshot = get_kpi_snapshot(db_path=db_path)
+    kpis = kpis_from_snapshot(snapshot)
+    if snapshot:
+        current = pd.Timestamp(snapshot["datetime_event"])
+        usual = usual_pattern(current.month, current.hour, db_path)
+        if usual is not None:
+            kpis["kpi_usual_24h"] = usual["usual_24h"]
+            kpis["kpi_usual_6h"] = usual["usual_next_6h"]
+            kpis["kpi_fall_hours"] = usual["fall_hours"]
+    return kpis
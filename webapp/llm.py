@@ -1,7 +1,10 @@
 from datetime import datetime
 from dotenv import load_dotenv
-from bdd import log_gpt_call, should_generate_annual_comparison, should_generate_commentary
+from bdd import get_latest_commentary, log_gpt_call, should_generate_annual_comparison, should_generate_commentary
 import os
+import queue
+import threading
+import time
 
 load_dotenv()
 
@@ -11,7 +14,88 @@ from bdd import log_gpt_call
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-def generate_commentary(kpis: dict, thresholds: list) -> str:
+# Délai maximal d'un appel (secondes) : au-delà, le dernier commentaire stocké est affiché
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "8"))
+
+def stream_completion(prompt, max_tokens, temperature, on_delta=None, deadline=None, model="gpt-4o"):
+    """
+    Stream a chat completion, calling on_delta(text so far) at each token, within `deadline` seconds.
+    Return (content, usage, latency_ms, first_token_ms, error).
+    """
+    deadline = LLM_DEADLINE_SECONDS if deadline is None else deadline
+    events = queue.Queue()
+    holder = {}
+
+    def pump():
+        try:
+            stream = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "Tu es un expert en hydrologie, tu rédiges en français."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=deadline,
+            )
+            holder["stream"] = stream
+            for chunk in stream:
+                events.put(("chunk", chunk))
+            events.put(("done", None))
+        except Exception as e:
+            events.put(("error", e))
+
+    start = time.monotonic()
+    threading.Thread(target=pump, daemon=True).start()
+    content, usage, first_token_ms, error = "", None, None, None
+    while True:
+        remaining = start + deadline - time.monotonic()
+        try:
+            kind, payload = events.get(timeout=max(remaining, 0))
+        except queue.Empty:
+            error = f"délai de {deadline:g} s dépassé"
+            stream = holder.get("stream")
+            if stream is not None:
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+            break
+        if kind == "done":
+            break
+        if kind == "error":
+            error = str(payload)
+            break
+        if payload.usage is not None:
+            usage = payload.usage
+        if payload.choices and payload.choices[0].delta.content:
+            if first_token_ms is None:
+                first_token_ms = (time.monotonic() - start) * 1000
+            content += payload.choices[0].delta.content
+            if on_delta is not None:
+                on_delta(content)
+    latency_ms = (time.monotonic() - start) * 1000
+    return content.strip(), usage, latency_ms, first_token_ms, error
+
+def _log_completion(prompt, result, type, model="gpt-4o"):
+    content, usage, latency_ms, first_token_ms, error = result
+    log_gpt_call(
+        model=model,
+        prompt=prompt,
+        response=content or None,
+        prompt_tokens=usage.prompt_tokens if usage else None,
+        completion_tokens=usage.completion_tokens if usage else None,
+        total_tokens=usage.total_tokens if usage else None,
+        type=type,
+        latency_ms=latency_ms,
+        first_token_ms=first_token_ms,
+        error=error
+    )
+
+def generate_commentary(kpis: dict, thresholds: list, crossings: list = None, on_delta=None) -> str:
+    """on_delta(texte partiel) permet d'afficher la réponse au fil de l'eau."""
 
     do_generate, last_comment = should_generate_commentary()
     if not do_generate:
@@ -31,13 +115,27 @@ def generate_commentary(kpis: dict, thresholds: list) -> str:
         f"Variation par rapport à il y a 3 jours : {kpis['kpi_j3']:.3f} m",
         f"Variation par rapport à la semaine dernière : {kpis['kpi_s1']:.3f} m",
         f"Tendance sur 7 jours : {kpis['kpi_7j']:.3f} m/j",
+    ]
+    if kpis.get("kpi_usual_24h") is not None:
+        # Rythme habituel des lâchers à cette période (profils horaires du mois)
+        parts += [
+            f"Variation habituelle sur 24 h à cette période de l’année : {kpis['kpi_usual_24h']:+.3f} m",
+            f"Variation habituelle sur les 6 prochaines heures : {kpis['kpi_usual_6h']:+.3f} m",
+            "Heures de plus forte baisse habituelle : " + ", ".join(f"{h} h" for h in kpis["kpi_fall_hours"]),
+        ]
+    parts += [
         "</données>",
         "",
         "<seuils>",
     ]
     for t in thresholds:
-        parts.append(f"- {t['name']} ({t['value']:.2f} m) : {t['description']}")
+        eta = f" — {t['eta']}" if t.get("eta") else ""
+        parts.append(f"- {t['name']} ({t['value']:.2f} m) : {t['description']}{eta}")
     parts.append("</seuils>")
+    if crossings:
+        parts.append("<franchissements_recents>")
+        parts.extend(f"- {c}" for c in crossings)
+        parts.append("</franchissements_recents>")
 
     parts.append(
         "<instruction>Rédige UNE PHRASE en français, claire et concise, qui indique ce que doit faire l’opérateur avec le bateau : ne rien faire, le reculer un peu, ou le déplacer ailleurs. Tu peux inclure des valeurs utiles (niveau actuel, tendance, seuil atteint). Sois factuel, et base ta recommandation sur les données ci-dessus. Mentionne un seuil s’il est proche ou franchi.</instruction>"
@@ -45,35 +143,14 @@ def generate_commentary(kpis: dict, thresholds: list) -> str:
 
     prompt = "\n".join(parts)
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "Tu es un expert en hydrologie, tu rédiges en français."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=180
-        )
-
-        content = response.choices[0].message.content.strip()
-        usage = response.usage
-
-        log_gpt_call(
-            model="gpt-4o",
-            prompt=prompt,
-            response=content,
-            prompt_tokens=usage.prompt_tokens,
-            completion_tokens=usage.completion_tokens,
-            total_tokens=usage.total_tokens
-        )
-
-        return content
-
-    except Exception as e:
-        return f"Erreur lors de l'appel à l'API : {e}"
+    result = stream_completion(prompt, max_tokens=180, temperature=0.7, on_delta=on_delta)
+    _log_completion(prompt, result, "tendance")
+    content, _, _, _, error = result
+    if error is not None:
+        return last_comment or f"Erreur lors de l'appel à l'API : {error}"
+    return content
     
-def generate_annual_comparison(kpis: dict) -> str:
+def generate_annual_comparison(kpis: dict, on_delta=None) -> str:
     do_generate, last_comment = should_generate_annual_comparison()
     if not do_generate:
         return last_comment or "⏱️ Commentaire déjà généré aujourd’hui."
@@ -92,30 +169,10 @@ def generate_annual_comparison(kpis: dict) -> str:
     ]
     prompt = "\n".join(parts)
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "Tu es un expert en hydrologie, tu rédiges en français."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.5,
-            max_tokens=100
-        )
-
-        content = response.choices[0].message.content.strip()
-        usage = response.usage
-
-        log_gpt_call(
-            model="gpt-4o",
-            prompt=prompt,
-            response=content,
-            prompt_tokens=usage.prompt_tokens,
-            completion_tokens=usage.completion_tokens,
-            total_tokens=usage.total_tokens,
-            type="comparaison_annuelle"
-        )
-
-        return content
-    except Exception as e:
-        return f"Erreur lors de l’appel à l’API : {e}"
\ No newline at end of file
+    result = stream_completion(prompt, max_tokens=100, temperature=0.5, on_delta=on_delta)
+    _log_completion(prompt, result, "comparaison_annuelle")
+    content, _, _, _, error = result
+    if error is not None:
+        # Dernier commentaire réussi, même s'il date d'un jour précédent
+        return get_latest_commentary("comparaison_annuelle")[0] or f"Erreur lors de l’appel à l’API : {error}"
+    return content
\ No newline at end of file
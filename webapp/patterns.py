@@ -0,0 +1,144 @@
+"""
+Profils de vitesse de variation du niveau : par heure du jour, par jour de la semaine
+et leur variation saisonnière (par mois).
+
+Les vitesses (m/h) sont les écarts entre moyennes horaires consécutives de
+water_level_rollup. La table `rate_profile` cumule, pour chaque case
+(mois, jour de la semaine, heure), le nombre de vitesses, leur somme et la somme de
+leurs carrés : tous les profils en sont des marges, lues en une requête de 2016 lignes
+au plus. Le cumul avance de façon incrémentale par jours clos (PATTERN_LAG_DAYS jours
+avant la dernière mesure) ; une réinsertion plus ancienne déclenche un recalcul complet,
+vectorisé (np.bincount) sur les moyennes horaires.
+"""
+
+import logging
+import sqlite3
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(funcName)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+DB_PATH = "niveau_eau.db"
+PATTERN_LAG_DAYS = 2  # jours récents encore susceptibles d'être complétés par l'API
+N_CELLS = 12 * 7 * 24
+WEEKDAYS = ["Lun", "Mar", "Mer", "Jeu", "Ven", "Sam", "Dim"]
+MONTHS = ["Jan", "Fév", "Mar", "Avr", "Mai", "Juin", "Juil", "Août", "Sep", "Oct", "Nov", "Déc"]
+
+
+def _accumulate(bucket_starts, means, start):
+    """Per-cell (n, sum, sum of squares) of hourly rates for buckets >= start."""
+    times = np.asarray(bucket_starts, dtype="datetime64[s]")
+    means = np.asarray(means, dtype=np.float64)
+    consecutive = np.diff(times) == np.timedelta64(3600, "s")
+    later = times[1:]
+    keep = consecutive & (later >= np.datetime64(start))
+    rates = np.diff(means)[keep]
+    stamps = pd.DatetimeIndex(later[keep])
+    cells = (stamps.month.to_numpy() - 1) * 168 + stamps.weekday.to_numpy() * 24 + stamps.hour.to_numpy()
+    return (
+        np.bincount(cells, minlength=N_CELLS),
+        np.bincount(cells, weights=rates, minlength=N_CELLS),
+        np.bincount(cells, weights=rates ** 2, minlength=N_CELLS),
+    )
+
+
+def refresh_patterns(since=None, db_path=DB_PATH):
+    """Add the hourly rates of newly closed days to rate_profile, rebuilding it if `since` is already counted."""
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(bucket_start) FROM water_level_rollup WHERE resolution = '1h'")
+        latest = cursor.fetchone()[0]
+        if latest is None:
+            return
+        target = (pd.Timestamp(latest).normalize() - timedelta(days=PATTERN_LAG_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+        cursor.execute("SELECT processed_before FROM rate_profile_state WHERE name = 'water_level'")
+        row = cursor.fetchone()
+        processed = row[0] if row else None
+
+        rebuild = processed is None or (since is not None and since < processed)
+        start = "0000-01-01 00:00:00" if rebuild else processed
+        if start >= target and not rebuild:
+            return
+        if rebuild:
+            logger.info("Rebuilding rate profiles from hourly rollups")
+            cursor.execute("DELETE FROM rate_profile")
+
+        # Moyenne horaire précédant `start` incluse : première vitesse du lot
+        cursor.execute("""
+            SELECT bucket_start, value_mean FROM water_level_rollup
+            WHERE resolution = '1h' AND bucket_start >= datetime(?, '-1 hour') AND bucket_start < ?
+            ORDER BY bucket_start
+        """, (start, target))
+        hourly = cursor.fetchall()
+        if len(hourly) > 1:
+            bucket_starts, means = zip(*hourly)
+            n, total, total_sq = _accumulate(bucket_starts, means, start)
+            cursor.execute("SELECT month, weekday, hour, n_samples, sum_rate, sum_sq_rate FROM rate_profile")
+            for month, weekday, hour, n_old, sum_old, sq_old in cursor.fetchall():
+                cell = (month - 1) * 168 + weekday * 24 + hour
+                n[cell] += n_old
+                total[cell] += sum_old
+                total_sq[cell] += sq_old
+            cells = np.flatnonzero(n)
+            cursor.executemany("""
+                INSERT OR REPLACE INTO rate_profile (month, weekday, hour, n_samples, sum_rate, sum_sq_rate)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [
+                (int(c // 168 + 1), int(c % 168 // 24), int(c % 24), int(n[c]), float(total[c]), float(total_sq[c]))
+                for c in cells
+            ])
+        cursor.execute("""
+            INSERT OR REPLACE INTO rate_profile_state (name, processed_before, updated_at)
+            VALUES ('water_level', ?, CURRENT_TIMESTAMP)
+        """, (target,))
+        conn.commit()
+
+
+def load_profiles(db_path=DB_PATH):
+    """The rate_profile cube (month, weekday, hour, n_samples, sum_rate, sum_sq_rate)."""
+    with sqlite3.connect(db_path) as conn:
+        return pd.read_sql_query("SELECT * FROM rate_profile ORDER BY month, weekday, hour", conn)
+
+
+def profile(cube, by):
+    """Marginal profile of `cube` over the `by` columns: mean rate, standard deviation (m/h) and count."""
+    grouped = cube.groupby(by)[["n_samples", "sum_rate", "sum_sq_rate"]].sum()
+    mean = grouped["sum_rate"] / grouped["n_samples"]
+    variance = (grouped["sum_sq_rate"] / grouped["n_samples"] - mean ** 2).clip(lower=0)
+    return pd.DataFrame({"mean_rate": mean, "std_rate": np.sqrt(variance), "n_samples": grouped["n_samples"]})
+
+
+def profile_matrix(cube, rows="weekday"):
+    """Mean rate (m/h) as a `rows` x hour matrix (weekday: 7 x 24, month: 12 x 24)."""
+    labels = WEEKDAYS if rows == "weekday" else MONTHS
+    offset = 0 if rows == "weekday" else 1
+    matrix = profile(cube, [rows, "hour"])["mean_rate"].unstack("hour")
+    return matrix.reindex(index=range(offset, len(labels) + offset), columns=range(24)).set_axis(labels, axis=0)
+
+
+def usual_pattern(month, hour, db_path=DB_PATH):
+    """Usual 24 h and next 6 h change in `month` (m) and its 3 steepest falling hours; None if incomplete."""
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT hour, SUM(sum_rate) / SUM(n_samples)
+            FROM rate_profile
+            WHERE month = ? AND n_samples > 0
+            GROUP BY hour
+        """, (month,))
+        rates = dict(cursor.fetchall())
+    if len(rates) < 24:
+        return None
+    return {
+        "usual_24h": sum(rates.values()),
+        "usual_next_6h": sum(rates[(hour + i) % 24] for i in range(1, 7)),
+        "fall_hours": sorted(sorted(rates, key=rates.get)[:3]),
+    }
@@ -0,0 +1,102 @@
+"""
+Profilage à la demande (cProfile) d'une exécution complète de app.py ou de update_db.
+
+Activé par PROFILE_RUNS=1 (toutes les exécutions) ou, dans le tableau de bord, par le
+paramètre d'URL ?profile=1, accepté seulement si l'exploitant a posé PROFILE_ALLOW_QUERY=1.
+Chaque exécution profilée produit dans PROFILE_DIR :
+  - <nom>-<horodatage>.pstats : à ouvrir avec pstats, snakeviz, ...
+  - <nom>-<horodatage>.txt    : les 40 fonctions les plus coûteuses (temps cumulé)
+Seuls les PROFILE_KEEP derniers rapports sont conservés.
+"""
+
+import cProfile
+import glob
+import io
+import logging
+import os
+import pstats
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_RUNS = os.getenv("PROFILE_RUNS", "0") == "1"
+PROFILE_ALLOW_QUERY = os.getenv("PROFILE_ALLOW_QUERY", "0") == "1"  # autorise ?profile=1
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(asctime)s - %(funcName)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+if not logger.handlers:
+    logger.addHandler(handler)
+
+# Profileur actif par thread : une exécution interrompue (st.rerun, st.stop) ne l'arrête pas
+_active = {}
+_lock = threading.Lock()
+
+
+def start_profile(enabled=PROFILE_RUNS):
+    """Start a cProfile.Profile for the current thread (None if profiling is disabled)."""
+    if not enabled:
+        return None
+    thread_id = threading.get_ident()
+    with _lock:
+        previous = _active.pop(thread_id, None)
+    if previous is not None:
+        previous.disable()
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Un autre profileur est déjà actif sur ce thread
+        logger.warning(f"Profiling unavailable: {e}")
+        return None
+    with _lock:
+        _active[thread_id] = profiler
+    return profiler
+
+
+def stop_profile(profiler, name):
+    """Stop `profiler` and save its report; return the .pstats path (None if profiler is None)."""
+    if profiler is None:
+        return None
+    profiler.disable()
+    with _lock:
+        if _active.get(threading.get_ident()) is profiler:
+            del _active[threading.get_ident()]
+    return save_report(profiler, name)
+
+
+@contextmanager
+def profile_run(name, enabled=PROFILE_RUNS):
+    """Profile the enclosed block, writing the report even if the block raises."""
+    profiler = start_profile(enabled)
+    try:
+        yield profiler
+    finally:
+        stop_profile(profiler, name)
+
+
+def save_report(profiler, name, directory=None, keep=None):
+    """Write <name>-<timestamp>.pstats/.txt and prune reports beyond the retention cap."""
+    directory = directory or PROFILE_DIR
+    keep = PROFILE_KEEP if keep is None else keep
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{name}-{datetime.now():%Y%m%d-%H%M%S-%f}")
+    profiler.dump_stats(f"{base}.pstats")
+
+    summary = io.StringIO()
+    stats = pstats.Stats(profiler, stream=summary)
+    stats.sort_stats("cumulative").print_stats(40)
+    with open(f"{base}.txt", "w", encoding="utf-8") as f:
+        f.write(summary.getvalue())
+    logger.info(f"Profile saved to {base}.pstats ({stats.total_tt:.2f} s)")
+
+    reports = sorted(glob.glob(os.path.join(directory, "*.pstats")), key=os.path.getmtime)
+    for old in reports[:max(len(reports) - keep, 0)]:
+        for path in (old, old[:-len(".pstats")] + ".txt"):
+            if os.path.exists(path):
+                os.remove(path)
+    return f"{base}.pstats"
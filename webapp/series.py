@@ -0,0 +1,152 @@
+"""
+Représentation compacte de la série brute (datetime_event, value).
+
+Un seul index datetime64[s] (8 octets) et des valeurs float32 (4 octets), soit 12 octets
+par mesure, en lecture seule : la même instance peut être partagée entre sessions
+et consommateurs (KPI, graphiques, prévision) sans copie défensive.
+
+Entre processus (plusieurs serveurs Streamlit), l'ingestion publie la série de chaque
+version des données en fichiers .npy que les processus projettent en mémoire
+(np.load mmap_mode="r") : une seule copie dans le cache de pages, quel que soit le
+nombre de processus.
+"""
+
+import glob
+import os
+import shutil
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+
+class WaterLevelSeries:
+    """Sorted, read-only time series: `times` (datetime64[s]) and `values` (float32)."""
+
+    __slots__ = ("times", "values")
+
+    def __init__(self, times, values):
+        times = np.asarray(times, dtype="datetime64[s]")
+        values = np.asarray(values, dtype=np.float32)
+        if len(times) > 1 and not (times[1:] >= times[:-1]).all():
+            order = np.argsort(times, kind="stable")
+            times, values = times[order], values[order]
+        self.times, self.values = _read_only(times), _read_only(values)
+
+    @classmethod
+    def from_frame(cls, df, x_field="datetime_event", y_field="value"):
+        """Build from a DataFrame such as get_all_data() output."""
+        df = df.dropna(subset=[x_field, y_field])
+        return cls(pd.to_datetime(df[x_field]).to_numpy(dtype="datetime64[s]"), df[y_field].to_numpy())
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def empty(self):
+        return len(self.times) == 0
+
+    @property
+    def nbytes(self):
+        return self.times.nbytes + self.values.nbytes
+
+    def window(self, start=None, end=None):
+        """Readings with start <= t <= end, as views (no copy)."""
+        lo = 0 if start is None else int(np.searchsorted(self.times, np.datetime64(pd.Timestamp(start), "s"), "left"))
+        hi = len(self.times) if end is None else int(np.searchsorted(self.times, np.datetime64(pd.Timestamp(end), "s"), "right"))
+        return WaterLevelSeries._from_sorted(self.times[lo:hi], self.values[lo:hi])
+
+    @classmethod
+    def _from_sorted(cls, times, values):
+        """Wrap arrays already sorted and typed (no check, no copy)."""
+        series = cls.__new__(cls)
+        series.times, series.values = _read_only(times), _read_only(values)
+        return series
+
+    def value_at_or_before(self, t):
+        """Return last value <= t (None if t precedes the series)."""
+        idx = int(np.searchsorted(self.times, np.datetime64(pd.Timestamp(t), "s"), "right")) - 1
+        return None if idx < 0 else float(self.values[idx])
+
+    def years(self):
+        """Sorted distinct years present in the series."""
+        return sorted(np.unique(self.times.astype("datetime64[Y]").astype(int) + 1970).tolist())
+
+    def to_frame(self):
+        """DataFrame view with `datetime_event`/`value` (for Prophet or pandas)."""
+        return pd.DataFrame({"datetime_event": self.times, "value": self.values}, copy=False)
+
+
+def _read_only(array):
+    array = array.view()
+    array.setflags(write=False)
+    return array
+
+
+def _fetch_series(conn):
+    cursor = conn.execute("""
+        SELECT CAST(strftime('%s', datetime_event) AS INTEGER), value
+        FROM water_level
+        WHERE datetime_event IS NOT NULL AND value IS NOT NULL
+        ORDER BY datetime_event ASC
+    """)
+    rows = np.fromiter(cursor, dtype=[("t", "<i8"), ("v", "<f4")])
+    return np.ascontiguousarray(rows["t"]), np.ascontiguousarray(rows["v"])
+
+def load_series(db_path="niveau_eau.db"):
+    """Load water_level into a WaterLevelSeries, with timestamps converted to epoch seconds by SQLite."""
+    with sqlite3.connect(db_path) as conn:
+        times, values = _fetch_series(conn)
+    return WaterLevelSeries._from_sorted(times.view("datetime64[s]"), values)
+
+
+# --- Série partagée entre processus ---
+
+SERIES_KEEP = 2  # versions conservées : un processus peut encore lire la précédente
+
+def series_directory(db_path="niveau_eau.db"):
+    return os.path.splitext(os.path.abspath(db_path))[0] + ".series"
+
+def publish_series(db_path="niveau_eau.db"):
+    """Atomically publish the series of the current version to <base>.series/v<version>/; return the version."""
+    directory = series_directory(db_path)
+    with sqlite3.connect(db_path) as conn:
+        # Version et mesures lues dans la même transaction
+        conn.execute("BEGIN")
+        version = conn.execute("SELECT version FROM data_version WHERE name = 'water_level'").fetchone()[0]
+        target = os.path.join(directory, f"v{version}")
+        if os.path.isdir(target):
+            return version
+        times, values = _fetch_series(conn)
+
+    tmp = f"{target}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    np.save(os.path.join(tmp, "times.npy"), times)
+    np.save(os.path.join(tmp, "values.npy"), values)
+    try:
+        os.rename(tmp, target)
+    except OSError:
+        # Publiée entre-temps par un autre processus
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    published = sorted(
+        (path for path in glob.glob(os.path.join(directory, "v*")) if path.rsplit("v", 1)[-1].isdigit()),
+        key=lambda path: int(path.rsplit("v", 1)[-1])
+    )
+    for old in published[:-SERIES_KEEP]:
+        shutil.rmtree(old, ignore_errors=True)
+    return version
+
+def map_series(version=None, db_path="niveau_eau.db"):
+    """Memory-map the published series of `version` (current by default), publishing it first if needed."""
+    if version is None:
+        version = publish_series(db_path)
+    for _ in range(2):
+        target = os.path.join(series_directory(db_path), f"v{version}")
+        try:
+            times = np.load(os.path.join(target, "times.npy"), mmap_mode="r")
+            values = np.load(os.path.join(target, "values.npy"), mmap_mode="r")
+            return WaterLevelSeries._from_sorted(times.view("datetime64[s]"), values)
+        except FileNotFoundError:
+            version = publish_series(db_path)
+    return load_series(db_path)